@@ -2,28 +2,55 @@ import os
 
 # add the parent directory to system path so we can run api_server.py from the src directory
 import sys
+from contextlib import asynccontextmanager
 
 sys.path.append(os.path.dirname(os.path.dirname("../")))
 
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from utils import logger, settings
+from telemetry import registry, span
+from utils import logger
 
 from api.api_route import router, TagEnum
+from api.evaluation_route import router as evaluation_router, get_worker_pool
+from api.extraction_route import router as extraction_router
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the evaluation jobs run in background threads, not in the request workers
+    worker_pool = get_worker_pool()
+    worker_pool.start()
+    yield
+    worker_pool.stop(timeout=5)
+
+
+app = FastAPI(lifespan=lifespan)
 
 # ROUTERS
-routers = [router]
+routers = [router, extraction_router, evaluation_router]
 for router in routers:
     app.include_router(router)
 
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Records each request as the root span of the operations it triggers."""
+    with span("http.request", method=request.method, path=request.url.path) as current:
+        response = await call_next(request)
+        current.set_attribute("status_code", response.status_code)
+    return response
+
+
 @app.get("/", tags=[TagEnum.general])
 async def root():
     logger.debug("Server is up and running!")
 
-    logger.debug(f"Settings: {settings}")
-
     return JSONResponse(content="FastAPI server is up and running!")
+
+
+@app.get("/metrics", tags=[TagEnum.general], response_class=PlainTextResponse)
+async def metrics():
+    """Returns the latency histograms of the instrumented operations for Prometheus."""
+    return PlainTextResponse(registry.to_prometheus(), media_type="text/plain; version=0.0.4")
@@ -3,8 +3,8 @@ from enum import Enum
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 
-from ml.ai import get_rag_response
-from utils import logger
+from ml.ai import conversation_store, get_rag_response
+from utils import log_payload
 
 
 class TagEnum(str, Enum):
@@ -12,18 +12,25 @@ class TagEnum(str, Enum):
 
     general = "general"
     tag_example = "tag_example"
+    extraction = "extraction"
+    evaluation = "evaluation"
 
 
 router = APIRouter(prefix="/prefix_example", tags=[TagEnum.tag_example])
 
 
+# the routes calling blocking code (SQLite, LLM calls waiting for the rate limits of the gateway)
+# are not async: FastAPI runs them in its thread pool instead of the event loop
 @router.get("/example/")
-async def get_conversation_by_id(conversation_id: str):
-    return JSONResponse(content="example response : 1234")
+def get_conversation_by_id(conversation_id: str):
+    conversation = conversation_store.find(conversation_id)
+    if conversation is None:
+        return JSONResponse(status_code=404, content=f"Unknown conversation: {conversation_id}")
+    return JSONResponse(content=conversation.to_dict())
 
 
 @router.get("/form/")
-async def get_conversation_by_id(question: str):
-    logger.debug(f"question: {question}")
-    res = get_rag_response(question)
+def get_conversation_by_id(question: str, conversation_id: str = None):
+    log_payload("question", question)
+    res = get_rag_response(question, conversation_id)
     return JSONResponse(content=res)
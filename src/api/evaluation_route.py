@@ -0,0 +1,73 @@
+from functools import cache
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+
+from api.api_route import TagEnum
+from evaluation.jobs import JobQueue, WorkerPool, parquet_results_store
+from evaluation.results_store import ResultsStore
+from evaluation.runner import CONFIGS_DIR, load_config
+from utils import settings
+
+router = APIRouter(prefix="/evaluation", tags=[TagEnum.evaluation])
+# the routes are not async: the SQLite queries of the queue run in the thread pool of FastAPI
+
+
+# the databases are opened on first use, not when the module is imported
+@cache
+def get_job_queue() -> JobQueue:
+    return JobQueue(settings.EVALUATION_JOBS_DB)
+
+
+@cache
+def get_worker_pool() -> WorkerPool:
+    """Returns the workers of the job queue, started and stopped by the lifespan of the app."""
+    return WorkerPool(
+        get_job_queue(),
+        settings.EVALUATION_WORKERS,
+        store=ResultsStore(settings.EVALUATION_RESULTS_DB),
+        parquet_store=parquet_results_store(),
+    )
+
+
+class EvaluationJobRequest(BaseModel):
+    """The name of a promptfoo config of evaluation/configs.
+
+    Configs are not accepted inline: their `file://` references are run by the workers.
+    """
+
+    config_name: str
+
+
+@router.post("/jobs/")
+def submit_evaluation_job(
+    request: EvaluationJobRequest, job_queue: JobQueue = Depends(get_job_queue)
+):
+    """Queues an evaluation run and returns its id, its progress is polled with GET /jobs/{id}."""
+    path = (CONFIGS_DIR / request.config_name).resolve()
+    if path.parent != CONFIGS_DIR.resolve() or not path.is_file():
+        raise HTTPException(status_code=404, detail=f"Unknown config: {request.config_name}")
+    return {"id": job_queue.submit(load_config(path), CONFIGS_DIR)}
+
+
+@router.get("/jobs/")
+def list_evaluation_jobs(limit: int = 100, job_queue: JobQueue = Depends(get_job_queue)):
+    return job_queue.list(limit)
+
+
+@router.get("/jobs/{job_id}")
+def get_evaluation_job(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    """Returns the status, the progress (done / total test cases) and the summary of a job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+
+@router.get("/jobs/{job_id}/results")
+def get_evaluation_job_results(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    """Returns the results of a job, one per test case, prompt, provider and metric."""
+    job = job_queue.get(job_id, with_results=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
@@ -0,0 +1,61 @@
+import json
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from api.api_route import TagEnum
+from evaluation.metrics.utils import create_dynamic_model
+from ml.extraction import extract_documents
+from utils import logger, settings
+
+router = APIRouter(prefix="/extraction", tags=[TagEnum.extraction])
+
+
+class ExtractionDocument(BaseModel):
+    id: str | None = None
+    text: str
+
+
+class ExtractionRequest(BaseModel):
+    """Documents to extract and the fields to extract from each of them."""
+
+    fields: dict[str, str] = Field(
+        description="{field: question}, e.g. {'name': 'What is the name of the customer?'}",
+        min_length=1,
+    )
+    documents: list[ExtractionDocument] = Field(min_length=1)
+
+
+@router.post("/json/")
+async def extract_json(request: ExtractionRequest):
+    """Streams the fields extracted from each document as JSON lines, in completion order.
+
+    Each line is {"index": ..., "id": ..., "fields": {field: answer}} or, if the extraction of the
+    document failed, {"index": ..., "id": ..., "error": ...}.
+    """
+    if len(request.documents) > settings.EXTRACTION_MAX_DOCUMENTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.EXTRACTION_MAX_DOCUMENTS} documents per request.",
+        )
+    # invalid field names (e.g. "_private", "model_config") are reported before streaming
+    try:
+        response_model = create_dynamic_model(request.fields)
+    except (NameError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid fields: {e}")
+    logger.info(
+        "Extracting {} fields from {} documents", len(request.fields), len(request.documents)
+    )
+
+    async def lines():
+        results = extract_documents(
+            [document.text for document in request.documents],
+            response_model,
+            concurrency=settings.EXTRACTION_MAX_CONCURRENCY,
+        )
+        async for result in results:
+            result["id"] = request.documents[result["index"]].id
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,106 @@
+"""Local stand-ins for the model provider and the search service, used by the load test."""
+
+import asyncio
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+
+def create_fake_llm_app(
+    latency: float = 0.2, tokens_per_second: float = 100.0, completion_tokens: int = 50
+) -> FastAPI:
+    """Returns an OpenAI compatible chat completions server with a simulated generation time.
+
+    Each completion takes `latency` seconds (time to first token) plus the time to generate its
+    tokens at `tokens_per_second`. The answer repeats the beginning of the last message.
+
+    Args:
+        latency: seconds before the first token.
+        tokens_per_second: generation speed, 0 for an instant generation.
+        completion_tokens: tokens generated per completion, at most max_tokens of the request.
+    """
+    app = FastAPI()
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "fake"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        num_tokens = min(completion_tokens, body.get("max_tokens") or completion_tokens)
+        generation_time = num_tokens / tokens_per_second if tokens_per_second else 0.0
+        await asyncio.sleep(latency + generation_time)
+
+        prompt = " ".join(str(message.get("content", "")) for message in body["messages"])
+        words = str(body["messages"][-1].get("content", "")).split()
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words[:num_tokens])},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4 + 1,
+                "completion_tokens": num_tokens,
+                "total_tokens": len(prompt) // 4 + 1 + num_tokens,
+            },
+        }
+
+    return app
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port: int = None) -> tuple[uvicorn.Server, str]:
+    """Starts an ASGI app with uvicorn in a background thread and returns it with its url."""
+    port = port or get_free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    )
+    threading.Thread(target=server.run, name=f"uvicorn-{port}", daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+@dataclass
+class FakeCaption:
+    text: str
+
+
+class FakeSearchClient:
+    """Replaces the Azure AI Search client: returns `num_documents` documents after `latency`."""
+
+    def __init__(self, latency: float = 0.05, num_documents: int = 3, caption_words: int = 100):
+        self.latency = latency
+        self.num_documents = num_documents
+        self.caption_words = caption_words
+
+    def search(self, search_text: str, top: int = None, **kwargs) -> list[dict]:
+        time.sleep(self.latency)
+        return [
+            {
+                "title": f"document_{i}.pdf",
+                "@search.captions": [
+                    FakeCaption(" ".join([f"{search_text} passage {i}"] * self.caption_words))
+                ],
+            }
+            # the settings give top as a string
+            for i in range(min(self.num_documents, int(top or self.num_documents)))
+        ]
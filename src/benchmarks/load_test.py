@@ -0,0 +1,178 @@
+"""Load test of the FastAPI backend and the RAG pipeline, without network.
+
+The backend is served by uvicorn and uses a fake OpenAI compatible server and a fake search
+client (see fakes.py), whose latencies are configurable. Requests are sent at a fixed concurrency
+and the throughput, the latency percentiles and the memory are reported.
+
+The results can be saved and compared to a previous run, the command then fails if the throughput
+or the p95 latency regressed by more than `--max-regression`.
+
+Run it from the src directory: `python -m benchmarks.load_test --concurrency 1 8 32`
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+import httpx
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from benchmarks.fakes import FakeSearchClient, create_fake_llm_app, start_server
+
+
+def create_backend(args):
+    """Starts the fake model server and returns the backend app configured to use it."""
+    _, llm_url = start_server(
+        create_fake_llm_app(args.llm_latency, args.tokens_per_second, args.completion_tokens)
+    )
+    # the settings and the clients are created when the modules are imported
+    os.environ.update(
+        {
+            "LLM_PROVIDER": "openai",
+            "OPENAI_BASE_URL": f"{llm_url}/v1",
+            "OPENAI_DEPLOYMENT_NAME": "fake",
+            "OPENAI_API_KEY": "fake",
+            "LLM_DEPLOYMENTS": "[]",
+            "ENABLE_AZURE_SEARCH": "False",
+            "ENABLE_EVALUATION": "False",
+            "DEV_MODE": "False",
+            # the levels ask the same questions: the retrieval cache would skip the pipeline
+            "RAG_CACHE_MAX_ENTRIES": "0",
+        }
+    )
+    import ml.ai
+    from api.api import app
+
+    ml.ai.search_client = FakeSearchClient(args.search_latency, args.documents)
+    return app
+
+
+async def run_level(url: str, concurrency: int, num_requests: int) -> dict:
+    """Sends `num_requests` questions with `concurrency` clients and returns the measures."""
+    latencies = []
+    errors = 0
+    counter = iter(range(num_requests))
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await client.get(
+                    f"{url}/prefix_example/form/", params={"question": f"Question {i} ?"}
+                )
+                response.raise_for_status()
+            except httpx.HTTPError:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    return {
+        "concurrency": concurrency,
+        "requests": num_requests,
+        "errors": errors,
+        "throughput": len(latencies) / duration,
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "peak_traced_mb": tracemalloc.get_traced_memory()[1] / 2**20,
+        # kilobytes on linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], max_regression: float) -> list[str]:
+    """Returns the regressions of `results` compared to `baseline`, by concurrency level."""
+    baseline = {level["concurrency"]: level for level in baseline}
+    regressions = []
+    for level in results:
+        previous = baseline.get(level["concurrency"])
+        if not previous:
+            continue
+        if level["throughput"] < previous["throughput"] * (1 - max_regression):
+            regressions.append(
+                f"concurrency {level['concurrency']}: throughput {level['throughput']:.1f} req/s "
+                f"< {previous['throughput']:.1f} req/s"
+            )
+        if level["p95"] > previous["p95"] * (1 + max_regression):
+            regressions.append(
+                f"concurrency {level['concurrency']}: p95 {level['p95']:.3f}s "
+                f"> {previous['p95']:.3f}s"
+            )
+    return regressions
+
+
+def print_results(results: list[dict]):
+    table = Table(title="Load test of /prefix_example/form/")
+    for column in ["concurrency", "requests", "errors", "req/s", "p50 (s)", "p95 (s)", "p99 (s)"]:
+        table.add_column(column, justify="right")
+    table.add_column("peak traced (MB)", justify="right")
+    table.add_column("max RSS (MB)", justify="right")
+    for level in results:
+        table.add_row(
+            str(level["concurrency"]),
+            str(level["requests"]),
+            str(level["errors"]),
+            f"{level['throughput']:.1f}",
+            f"{level['p50']:.3f}",
+            f"{level['p95']:.3f}",
+            f"{level['p99']:.3f}",
+            f"{level['peak_traced_mb']:.1f}",
+            f"{level['max_rss_mb']:.0f}",
+        )
+    Console().print(table)
+
+
+def main(args) -> int:
+    app = create_backend(args)
+    _, backend_url = start_server(app)
+
+    tracemalloc.start()
+    results = [
+        asyncio.run(run_level(backend_url, concurrency, args.requests))
+        for concurrency in args.concurrency
+    ]
+    tracemalloc.stop()
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            Console().print(f"[red]Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--completion-tokens", type=int, default=50)
+    parser.add_argument("--search-latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--documents", type=int, default=3, help="documents per search")
+    parser.add_argument("--output", help="json file receiving the results")
+    parser.add_argument("--baseline", help="json results of a previous run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="tolerated ratio")
+    sys.exit(main(parser.parse_args()))
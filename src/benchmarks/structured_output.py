@@ -0,0 +1,75 @@
+"""Measures the overhead of structured outputs (response_model) for growing response models.
+
+No request is sent to the provider: the benchmark times what happens locally around the call,
+i.e. patching the client with instructor, preparing the request (json schema of the model) and
+validating the answer of the model.
+
+Run it from the src directory: `python -m benchmarks.structured_output`
+"""
+
+import argparse
+import json
+import timeit
+
+import instructor
+from instructor.process_response import handle_response_model
+from openai import OpenAI
+from rich.console import Console
+from rich.table import Table
+
+from evaluation.metrics.utils import create_dynamic_model
+from ml.ai import get_instructor_client, get_response_model
+
+
+def time_call(fn, number: int) -> float:
+    """Returns the mean duration of `fn` in microseconds (best of 3 repetitions)."""
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+
+
+def run(fields_sizes: list[int], number: int):
+    client = OpenAI(api_key="benchmark", base_url="http://localhost:11434/v1", max_retries=0)
+    messages = [{"role": "user", "content": "question"}]
+
+    table = Table(title="Structured output overhead per call (µs)")
+    table.add_column("fields", justify="right")
+
+    rows = []
+    for num_fields in fields_sizes:
+        response_model = create_dynamic_model(
+            {f"field_{i}": f"question {i}" for i in range(num_fields)}
+        )
+        cached_model = get_response_model(response_model)
+        answer = json.dumps({f"field_{i}": f"answer {i}" for i in range(num_fields)})
+
+        measures = {
+            "from_openai": lambda: instructor.from_openai(client, mode=instructor.Mode.JSON),
+            "cached client": lambda: get_instructor_client(client, instructor.Mode.JSON),
+        }
+        for mode in [instructor.Mode.JSON, instructor.Mode.TOOLS_STRICT]:
+            measures[f"request {mode.value}"] = lambda mode=mode: handle_response_model(
+                response_model, mode, messages=messages
+            )
+            measures[f"request {mode.value} cached"] = lambda mode=mode: handle_response_model(
+                cached_model, mode, messages=messages
+            )
+        measures["validate answer"] = lambda: response_model.model_validate_json(answer)
+
+        rows.append(
+            [str(num_fields)] + [f"{time_call(fn, number):.1f}" for fn in measures.values()]
+        )
+
+    for column in measures:
+        table.add_column(column, justify="right")
+    for row in rows:
+        table.add_row(*row)
+
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fields", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--number", type=int, default=100, help="calls per measure")
+    args = parser.parse_args()
+
+    run(args.fields, args.number)
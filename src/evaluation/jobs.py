@@ -0,0 +1,341 @@
+"""Evaluation jobs: a queue of evaluation runs stored in SQLite and the workers running them.
+
+Several processes can share the queue (the API and standalone workers on the same machine): a
+job is claimed by one worker with a single atomic update. A claim is a lease renewed by the
+heartbeats of the worker: the jobs of a worker that died (or of a restarted API) are claimed again
+once their lease expired, up to a maximum of attempts (a job crashing its worker is not run
+forever).
+
+Run standalone workers from the src directory: `python -m evaluation.jobs --workers 4`
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from dataclasses import asdict
+from enum import Enum
+from pathlib import Path
+
+from evaluation.parquet_store import ParquetResultsStore
+from evaluation.results_store import ResultsStore
+from evaluation.runner import CONFIGS_DIR, run_evaluation, summarize
+from evaluation.sampling import SamplingOptions, run_sampled_evaluation
+from utils import logger, settings
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class JobQueue:
+    """Evaluation jobs stored in a SQLite database.
+
+    Args:
+        db_path: the SQLite file, shared by all the processes using the queue.
+        lease: seconds a running job stays claimed without a heartbeat.
+        max_attempts: claims of a job before it is failed, when its workers keep dying.
+    """
+
+    def __init__(self, db_path: str, lease: float = None, max_attempts: int = None):
+        self.db_path = db_path
+        self.lease = settings.EVALUATION_JOB_LEASE if lease is None else lease
+        self.max_attempts = (
+            settings.EVALUATION_JOB_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        )
+        with closing(self._connect()) as db, db:
+            # readers (progress polling) do not block the workers
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, config TEXT, "
+                "base_dir TEXT, done INTEGER, total INTEGER, summary TEXT, results TEXT, "
+                "error TEXT, created REAL, started REAL, finished REAL, lease_expires REAL, "
+                "attempts INTEGER DEFAULT 0)"
+            )
+            # queue created by a previous version: its running jobs have no lease
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+            if "lease_expires" not in columns:
+                db.execute("ALTER TABLE jobs ADD COLUMN lease_expires REAL")
+            if "attempts" not in columns:
+                db.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER DEFAULT 0")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def _execute(self, query: str, parameters=()) -> list[sqlite3.Row]:
+        with closing(self._connect()) as db, db:
+            return db.execute(query, parameters).fetchall()
+
+    def submit(self, config: dict, base_dir: str | Path = CONFIGS_DIR) -> str:
+        """Adds a job running a promptfoo config and returns its id."""
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, status, config, base_dir, done, total, created) "
+            "VALUES (?, ?, ?, ?, 0, NULL, ?)",
+            (job_id, JobStatus.queued.value, json.dumps(config), str(base_dir), time.time()),
+        )
+        return job_id
+
+    def claim(self) -> dict | None:
+        """Marks the oldest queued job as running and returns it, None if there is none.
+
+        The running jobs whose lease expired (their worker died) are claimed again, from the start,
+        or failed once they were claimed `max_attempts` times.
+        """
+        now = time.time()
+        expired = "status = ? AND (lease_expires IS NULL OR lease_expires < ?)"
+        with closing(self._connect()) as db, db:
+            db.execute(
+                f"UPDATE jobs SET status = ?, error = ?, finished = ? "
+                f"WHERE {expired} AND COALESCE(attempts, 0) >= ?",
+                (
+                    JobStatus.failed.value,
+                    f"the workers running the job died {self.max_attempts} times",
+                    now,
+                    JobStatus.running.value,
+                    now,
+                    self.max_attempts,
+                ),
+            )
+            rows = db.execute(
+                "UPDATE jobs SET status = ?, started = ?, done = 0, lease_expires = ?, "
+                "attempts = COALESCE(attempts, 0) + 1 WHERE id = "
+                f"(SELECT id FROM jobs WHERE status = ? OR ({expired}) ORDER BY created LIMIT 1) "
+                "RETURNING id, config, base_dir",
+                (
+                    JobStatus.running.value,
+                    now,
+                    now + self.lease,
+                    JobStatus.queued.value,
+                    JobStatus.running.value,
+                    now,
+                ),
+            ).fetchall()
+        if not rows:
+            return None
+        return {
+            "id": rows[0]["id"],
+            "config": json.loads(rows[0]["config"]),
+            "base_dir": rows[0]["base_dir"],
+        }
+
+    def heartbeat(self, job_ids: list[str]):
+        """Renews the leases of running jobs."""
+        self._execute(
+            f"UPDATE jobs SET lease_expires = ? WHERE status = ? "
+            f"AND id IN ({', '.join('?' * len(job_ids))})",
+            (time.time() + self.lease, JobStatus.running.value, *job_ids),
+        )
+
+    def set_progress(self, job_id: str, done: int, total: int):
+        self._execute("UPDATE jobs SET done = ?, total = ? WHERE id = ?", (done, total, job_id))
+
+    def finish(self, job_id: str, summary: dict, results: list[dict]):
+        self._execute(
+            "UPDATE jobs SET status = ?, summary = ?, results = ?, finished = ? WHERE id = ?",
+            (
+                JobStatus.done.value,
+                json.dumps(summary),
+                json.dumps(results, ensure_ascii=False),
+                time.time(),
+                job_id,
+            ),
+        )
+
+    def fail(self, job_id: str, error: str):
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?",
+            (JobStatus.failed.value, error, time.time(), job_id),
+        )
+
+    def get(self, job_id: str, with_results: bool = False) -> dict | None:
+        """Returns the status, progress and summary of a job (and its results), None if unknown."""
+        columns = "id, status, done, total, summary, error, created, started, finished"
+        if with_results:
+            columns += ", results"
+        rows = self._execute(f"SELECT {columns} FROM jobs WHERE id = ?", (job_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def list(self, limit: int = 100) -> list[dict]:
+        """Returns the most recent jobs, without their results."""
+        rows = self._execute(
+            "SELECT id, status, done, total, summary, error, created, started, finished "
+            "FROM jobs ORDER BY created DESC LIMIT ?",
+            (limit,),
+        )
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        for key in ("summary", "results"):
+            if job.get(key) is not None:
+                job[key] = json.loads(job[key])
+        return job
+
+
+def run_job(
+    queue: JobQueue,
+    job: dict,
+    store: ResultsStore = None,
+    parquet_store: ParquetResultsStore = None,
+):
+    """Runs a claimed job, recording its progress and its results in the queue.
+
+    The outputs and scores already in `store` (computed by previous jobs) are not computed again.
+    The results are also written to `parquet_store`, as the run of id the job id.
+    A config with `evaluateOptions.sampling` is evaluated on a sample of its test cases (see
+    evaluation/sampling.py), the estimates of the means are added to the summary.
+    """
+    logger.info("Evaluation job {} started", job["id"])
+    run_options = dict(
+        max_concurrency=settings.EVALUATION_JOB_CONCURRENCY,
+        progress=lambda done, total: queue.set_progress(job["id"], done, total),
+        store=store,
+    )
+    try:
+        estimates = None
+        sampling = SamplingOptions.from_config(job["config"])
+        if sampling is None:
+            results = run_evaluation(job["config"], job["base_dir"], **run_options)
+        else:
+            results, estimates = run_sampled_evaluation(
+                job["config"], job["base_dir"], sampling, **run_options
+            )
+    except Exception as e:
+        logger.exception(f"Evaluation job {job['id']} failed: {e}")
+        queue.fail(job["id"], repr(e))
+        return
+    summary = summarize(results)
+    if estimates is not None:
+        summary = {"metrics": summary, "estimates": estimates}
+    queue.finish(job["id"], summary, [asdict(result) for result in results])
+    if parquet_store is not None:
+        try:
+            parquet_store.write_run(results, run_id=job["id"])
+        except (OSError, ValueError) as e:  # pyarrow.ArrowInvalid is a ValueError
+            logger.warning(f"Could not write the parquet results of job {job['id']}: {e}")
+    logger.info("Evaluation job {} done", job["id"])
+
+
+def parquet_results_store() -> ParquetResultsStore | None:
+    """Returns the parquet store of the settings, None if the results are not written."""
+    if not settings.EVALUATION_PARQUET_DIR:
+        return None
+    return ParquetResultsStore(settings.EVALUATION_PARQUET_DIR)
+
+
+class WorkerPool:
+    """Threads claiming the queued jobs and running them, one job at a time per worker.
+
+    The leases of the running jobs are renewed by a heartbeat thread.
+
+    Args:
+        queue: the job queue.
+        workers: the number of jobs run at the same time.
+        poll_interval: seconds between two checks of an empty queue.
+        store: the results store shared by the jobs, None to compute every result.
+        parquet_store: the store receiving the results of the jobs, None to not write them.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        workers: int = 2,
+        poll_interval: float = 1.0,
+        store: ResultsStore = None,
+        parquet_store: ParquetResultsStore = None,
+    ):
+        self.queue = queue
+        self.store = store
+        self.parquet_store = parquet_store
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+        self.threads = []
+        self.running = set()
+        # the leases are renewed until the running jobs finished
+        self.heartbeat_stopping = threading.Event()
+        self.heartbeat_thread = None
+
+    def _heartbeat(self):
+        while not self.heartbeat_stopping.wait(self.queue.lease / 3):
+            if job_ids := list(self.running):
+                try:
+                    self.queue.heartbeat(job_ids)
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not renew the leases of the evaluation jobs: {e}")
+
+    def _work(self):
+        while not self.stopping.is_set():
+            try:
+                job = self.queue.claim()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not claim an evaluation job: {e}")
+                job = None
+            if job is None:
+                self.stopping.wait(self.poll_interval)
+                continue
+            self.running.add(job["id"])
+            try:
+                run_job(self.queue, job, self.store, self.parquet_store)
+            except Exception as e:
+                # e.g. the queue is locked when the results are saved: the worker keeps running
+                logger.exception(f"Evaluation job {job['id']} failed: {e}")
+                try:
+                    self.queue.fail(job["id"], repr(e))
+                except sqlite3.Error as fail_error:
+                    logger.warning(f"Could not fail the evaluation job {job['id']}: {fail_error}")
+            finally:
+                self.running.discard(job["id"])
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"evaluation-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        self.heartbeat_stopping.clear()
+        self.heartbeat_thread = threading.Thread(
+            target=self._heartbeat, name="evaluation-heartbeat", daemon=True
+        )
+        self.heartbeat_thread.start()
+
+    def stop(self, timeout: float = None):
+        """Stops claiming jobs, and waits for the running jobs to finish."""
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+        self.heartbeat_stopping.set()
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join(timeout)
+            self.heartbeat_thread = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=settings.EVALUATION_WORKERS or 1)
+    parser.add_argument("--db", default=settings.EVALUATION_JOBS_DB, help="SQLite file")
+    args = parser.parse_args()
+
+    pool = WorkerPool(
+        JobQueue(args.db),
+        args.workers,
+        store=ResultsStore(settings.EVALUATION_RESULTS_DB),
+        parquet_store=parquet_results_store(),
+    )
+    pool.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
@@ -0,0 +1,162 @@
+"""Fuzzy comparisons of the fields of json answers, without embeddings.
+
+From the strictest to the most lenient: normalized match (case, accents, punctuation and spaces
+ignored, numbers compared by value), token F1 (overlap of the words), Levenshtein ratio (edit
+distance, bit-parallel algorithm of Myers / Hyyrö: one pass over the longest string with python
+ints as bit vectors) and Jaro-Winkler similarity (typos and short strings).
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+
+# signs, decimal points and "+" are kept inside the words: "-500", "3.14", "c++"
+_NON_WORD = re.compile(r"[^\w.+\-]+")
+# dots and dashes at the edges of a word are punctuation, except the sign of a number
+_LEADING_PUNCTUATION = re.compile(r"^(?:[.\-](?!\d))+")
+_TRAILING_PUNCTUATION = re.compile(r"[.\-]+$")
+
+METHODS = ("normalized_match", "token_f1", "levenshtein", "jaro_winkler")
+
+
+def normalize(text: str) -> str:
+    """Lowercases a text, removes its accents and punctuation and collapses its spaces.
+
+    The signs, decimal points and "+" inside the words are kept: "-500" is not "500" and "C++"
+    is not "C".
+    """
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    words = (
+        _TRAILING_PUNCTUATION.sub("", _LEADING_PUNCTUATION.sub("", word))
+        for word in _NON_WORD.sub(" ", text.lower()).split()
+    )
+    return " ".join(word for word in words if word)
+
+
+def to_number(value) -> float | None:
+    """Returns the value of a number or of a text holding only a number, None otherwise."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        try:
+            number = float(str(value).strip())
+        except ValueError:
+            return None
+    return number if math.isfinite(number) else None
+
+
+def token_f1(prediction: str, reference: str) -> float:
+    """Returns the F1 of the words of two normalized texts (the words are counted)."""
+    prediction_tokens, reference_tokens = prediction.split(), reference.split()
+    if not prediction_tokens or not reference_tokens:
+        return float(prediction_tokens == reference_tokens)
+    common = sum((Counter(prediction_tokens) & Counter(reference_tokens)).values())
+    if not common:
+        return 0.0
+    precision, recall = common / len(prediction_tokens), common / len(reference_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def levenshtein_distance(a: str, b: str) -> int:
+    """Returns the edit distance of two strings (insertions, deletions and substitutions)."""
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+    # one bit per character of the shortest string
+    positions = {}
+    for i, char in enumerate(b):
+        positions[char] = positions.get(char, 0) | (1 << i)
+    full = (1 << len(b)) - 1
+    last = 1 << (len(b) - 1)
+    vertical_positive, vertical_negative, distance = full, 0, len(b)
+    for char in a:
+        equal = positions.get(char, 0)
+        x_vertical = equal | vertical_negative
+        x_horizontal = (
+            ((equal & vertical_positive) + vertical_positive) ^ vertical_positive
+        ) | equal
+        horizontal_positive = vertical_negative | (~(x_horizontal | vertical_positive) & full)
+        horizontal_negative = vertical_positive & x_horizontal
+        if horizontal_positive & last:
+            distance += 1
+        elif horizontal_negative & last:
+            distance -= 1
+        horizontal_positive = ((horizontal_positive << 1) | 1) & full
+        horizontal_negative = (horizontal_negative << 1) & full
+        vertical_positive = horizontal_negative | (~(x_vertical | horizontal_positive) & full)
+        vertical_negative = horizontal_positive & x_vertical
+    return distance
+
+
+def levenshtein_ratio(a: str, b: str) -> float:
+    """Returns 1 - edit distance / length of the longest string."""
+    if not a and not b:
+        return 1.0
+    return 1 - levenshtein_distance(a, b) / max(len(a), len(b))
+
+
+def jaro_winkler(a: str, b: str, prefix_weight: float = 0.1) -> float:
+    """Returns the Jaro-Winkler similarity of two strings."""
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    window = max(max(len(a), len(b)) // 2 - 1, 0)
+    matched_b = [False] * len(b)
+    matches_a = []
+    for i, char in enumerate(a):
+        for j in range(max(0, i - window), min(len(b), i + window + 1)):
+            if not matched_b[j] and b[j] == char:
+                matched_b[j] = True
+                matches_a.append(char)
+                break
+    if not matches_a:
+        return 0.0
+    matches_b = [char for char, matched in zip(b, matched_b) if matched]
+    transpositions = sum(x != y for x, y in zip(matches_a, matches_b)) / 2
+    count = len(matches_a)
+    jaro = (count / len(a) + count / len(b) + (count - transpositions) / count) / 3
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * prefix_weight * (1 - jaro)
+
+
+def compare(prediction, reference) -> dict[str, float]:
+    """Returns the score of each method (see METHODS) for a predicted and a reference value.
+
+    Two numbers (or texts holding only a number) are compared by value: 5 and "5.0" are equal,
+    and a different number scores 0 with every method.
+    """
+    if prediction is None or reference is None:
+        equal = float(prediction is None and reference is None)
+        return {method: equal for method in METHODS}
+    prediction_number, reference_number = to_number(prediction), to_number(reference)
+    if prediction_number is not None and reference_number is not None:
+        equal = float(math.isclose(prediction_number, reference_number, rel_tol=1e-9))
+        return {method: equal for method in METHODS}
+    prediction, reference = normalize(prediction), normalize(reference)
+    if prediction == reference:
+        return {method: 1.0 for method in METHODS}
+    return {
+        "normalized_match": 0.0,
+        "token_f1": token_f1(prediction, reference),
+        "levenshtein": levenshtein_ratio(prediction, reference),
+        "jaro_winkler": jaro_winkler(prediction, reference),
+    }
+
+
+def compare_records(prediction: dict, reference: dict) -> dict[str, dict[str, float]]:
+    """Compares every field of a reference record to the same field of a predicted record.
+
+    Returns:
+        {field: {method: score}}, a field missing from the prediction scores 0.
+    """
+    return {field: compare(prediction.get(field), value) for field, value in reference.items()}
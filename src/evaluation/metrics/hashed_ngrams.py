@@ -0,0 +1,95 @@
+"""Local text vectors: hashed character n-gram counts, computed with numpy on the CPU.
+
+The n-grams (3 to 5 characters of the lowercased text, spaces included so that word boundaries
+count) are hashed into a fixed number of dimensions: no vocabulary is learned and no model is
+loaded. The n-gram hashes of a text are computed at once with numpy (polynomial rolling hash),
+the vectors are sparse (sorted dimensions, L2 normalized weights) and cached. The n-grams are
+weighted by their sublinear term frequency only, without inverse document frequency.
+"""
+
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+_WHITESPACES = re.compile(r"\s+")
+# odd 64-bit multipliers: polynomial hash of the n-grams, then fibonacci hashing to the dimensions
+_BASE = np.uint64(1_000_003)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def ngram_hashes(text: str, sizes: tuple[int, ...] = (3, 4, 5), bits: int = 18) -> np.ndarray:
+    """Returns the hashes (in [0, 2**bits)) of the character n-grams of a text."""
+    text = f" {_WHITESPACES.sub(' ', text.lower()).strip()} "
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    hashes = []
+    for size in sizes:
+        count = len(codes) - size + 1
+        if count <= 0:
+            continue
+        # the n-grams of every position at once, the products wrap modulo 2**64
+        h = np.full(count, size, dtype=np.uint64)
+        for offset in range(size):
+            h = h * _BASE + codes[offset : offset + count]
+        hashes.append(h)
+    if not hashes:
+        return np.zeros(0, dtype=np.uint64)
+    return (np.concatenate(hashes) * _MIX) >> np.uint64(64 - bits)
+
+
+class HashedNgramVectorizer:
+    """Encodes texts to sparse vectors of hashed character n-grams.
+
+    Args:
+        bits: the vectors have 2**bits dimensions.
+        sizes: the lengths of the character n-grams.
+        cache_size: the number of vectors kept in memory (the most recently used).
+    """
+
+    def __init__(self, bits: int = 18, sizes: tuple[int, ...] = (3, 4, 5), cache_size: int = 4096):
+        self.bits = bits
+        self.sizes = sizes
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def encode_one(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the vector of a text: its sorted dimensions and their L2 normalized weights."""
+        vector = self._cache.get(text)
+        if vector is not None:
+            self._cache.move_to_end(text)
+            return vector
+        dimensions, counts = np.unique(
+            ngram_hashes(text, self.sizes, self.bits), return_counts=True
+        )
+        weights = 1 + np.log(counts)  # sublinear term frequency
+        norm = np.linalg.norm(weights)
+        vector = (dimensions, weights / norm if norm else weights)
+        self._cache[text] = vector
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return vector
+
+    def encode(self, texts: list[str]) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Returns the vectors of texts, each distinct text is encoded once."""
+        vectors = {text: self.encode_one(text) for text in dict.fromkeys(texts)}
+        return [vectors[text] for text in texts]
+
+    def similarities(self, texts: list[str], references: list[str]) -> np.ndarray:
+        """Returns the cosine similarity of each text with the reference at the same position.
+
+        Two texts without n-grams (empty or only whitespaces) are identical: their similarity is 1.
+        """
+        vectors = self.encode(list(texts) + list(references))
+        return np.array(
+            [
+                cosine(a, b) if len(a[0]) or len(b[0]) else 1.0
+                for a, b in zip(vectors[: len(texts)], vectors[len(texts) :])
+            ],
+            dtype=np.float64,
+        )
+
+
+def cosine(a: tuple[np.ndarray, np.ndarray], b: tuple[np.ndarray, np.ndarray]) -> float:
+    """Returns the cosine similarity of two normalized sparse vectors."""
+    _, in_a, in_b = np.intersect1d(a[0], b[0], assume_unique=True, return_indices=True)
+    return float(np.dot(a[1][in_a], b[1][in_b]))
@@ -0,0 +1,150 @@
+import json
+from collections import Counter, defaultdict
+
+from evaluation.metrics.fuzzy import jaro_winkler, levenshtein_ratio, normalize
+from utils import time_function
+
+# blocks larger than this (frequent words) are not used to find fuzzy candidates
+MAX_BLOCK_SIZE = 50
+
+
+@time_function
+def get_assert(output: str, context):
+    """Evaluates the entities of an answer: precision, recall and F1 of the matched entities.
+
+    The entities are read from json (see extract_entities), normalized (case, accents and
+    punctuation), then matched exactly with a hash index. With `fuzzy` in the assertion config,
+    the entities left are matched to the reference entities of the same type sharing a word (up
+    to one letter), if their similarity reaches `fuzzy_threshold`: the comparisons stay close to
+    linear in the number of entities.
+    """
+    config = context.get("config", {})
+    threshold = config.get("threshold", 0.8)
+    try:
+        predicted = extract_entities(output)
+        expected = extract_entities(context["vars"]["ground_truth"])
+    except (TypeError, ValueError):
+        return {
+            "pass": False,
+            "score": 0.0,
+            "reason": "answer or ground_truth is not a valid json to be used in this metric",
+        }
+
+    exact, fuzzy = match_entities(
+        predicted,
+        expected,
+        fuzzy=config.get("fuzzy", False),
+        fuzzy_threshold=config.get("fuzzy_threshold", 0.85),
+    )
+    matched = exact + fuzzy
+    precision = matched / len(predicted) if predicted else float(not expected)
+    recall = matched / len(expected) if expected else float(not predicted)
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+    score = round(f1, 4)
+    return {
+        "pass": score >= threshold,
+        "score": score,
+        "reason": (
+            f"{score} >= {threshold} = {score >= threshold}. {len(predicted)} predicted, "
+            f"{len(expected)} expected, {exact} exact and {fuzzy} fuzzy matches"
+        ),
+        "named_scores": {
+            "precision": round(precision, 4),
+            "recall": round(recall, 4),
+            "f1": score,
+        },
+    }
+
+
+def extract_entities(value) -> list[tuple[str, str]]:
+    """Returns the normalized (type, text) entities of a json value.
+
+    Supported: {type: text or [texts]}, [{"type": ..., "text": ...}] and [texts] (no type).
+    Empty texts are ignored.
+    """
+    if isinstance(value, str):
+        value = json.loads(value)
+    if isinstance(value, dict):
+        items = [
+            (entity_type, text)
+            for entity_type, texts in value.items()
+            for text in (texts if isinstance(texts, list) else [texts])
+        ]
+    elif isinstance(value, list):
+        items = [
+            (item.get("type", ""), item.get("text")) if isinstance(item, dict) else ("", item)
+            for item in value
+        ]
+    else:
+        raise ValueError(f"Entities should be a json object or list, not {type(value).__name__}")
+
+    entities = [(str(entity_type), normalize(text)) for entity_type, text in items if text]
+    return [entity for entity in entities if entity[1]]
+
+
+def match_entities(
+    predicted: list[tuple[str, str]],
+    expected: list[tuple[str, str]],
+    fuzzy: bool = False,
+    fuzzy_threshold: float = 0.85,
+) -> tuple[int, int]:
+    """Matches the predicted entities to the expected ones, each entity at most once.
+
+    Returns:
+        the number of exact matches and of fuzzy matches.
+    """
+    # exact: multisets of the entities, each occurrence is matched once
+    predicted_counts, expected_counts = Counter(predicted), Counter(expected)
+    common = predicted_counts & expected_counts
+    exact = sum(common.values())
+    if not fuzzy:
+        return exact, 0
+
+    left_predicted = list((predicted_counts - common).elements())
+    left_expected = list((expected_counts - common).elements())
+    blocks = defaultdict(list)
+    for index, entity in enumerate(left_expected):
+        for key in _block_keys(entity):
+            blocks[key].append(index)
+
+    candidates = []
+    for predicted_index, entity in enumerate(left_predicted):
+        compared = set()
+        for key in _block_keys(entity):
+            block = blocks.get(key, ())
+            if len(block) > MAX_BLOCK_SIZE:
+                continue
+            for expected_index in block:
+                if expected_index in compared:
+                    continue
+                compared.add(expected_index)
+                text, expected_text = entity[1], left_expected[expected_index][1]
+                similarity = max(
+                    levenshtein_ratio(text, expected_text), jaro_winkler(text, expected_text)
+                )
+                if similarity >= fuzzy_threshold:
+                    candidates.append((similarity, predicted_index, expected_index))
+
+    # the most similar pairs first, each entity is matched once
+    used_predicted, used_expected = set(), set()
+    for _, predicted_index, expected_index in sorted(candidates, reverse=True):
+        if predicted_index not in used_predicted and expected_index not in used_expected:
+            used_predicted.add(predicted_index)
+            used_expected.add(expected_index)
+    return exact, len(used_predicted)
+
+
+def _block_keys(entity: tuple[str, str]) -> set[tuple[str, str]]:
+    """Returns the blocking keys of an entity: its words, and its words without one letter.
+
+    Two words at one edit from each other share a key (symmetric deletions): "curie" and "curry"
+    do not, but "sorbone" and "sorbonne" do. The keys are prefixed by the type of the entity.
+    """
+    entity_type, text = entity
+    keys = set()
+    for word in text.split():
+        keys.add((entity_type, word))
+        if len(word) > 3:
+            keys.update((entity_type, f"{word[:i]}~{word[i + 1 :]}") for i in range(len(word)))
+    return keys
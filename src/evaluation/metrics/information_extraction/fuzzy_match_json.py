@@ -0,0 +1,47 @@
+import json
+
+from evaluation.metrics.fuzzy import METHODS, compare_records
+from utils import time_function
+
+
+@time_function
+def get_assert(output: str, context):
+    """Evaluates the fields of a json answer with fuzzy matches, between exact and embeddings.
+
+    The fields are compared once with every method of evaluation/metrics/fuzzy.py: the mean of
+    each method over the fields is a named score, the score is the mean of the method chosen in
+    the assertion config (`method`, default token_f1).
+    """
+    config = context.get("config", {})
+    method = config.get("method", "token_f1")
+    threshold = config.get("threshold", 0.8)
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method}, use one of {', '.join(METHODS)}")
+
+    try:
+        llm_answer = output if isinstance(output, dict) else json.loads(output)
+        true_answer = json.loads(context["vars"]["ground_truth"])
+    except (TypeError, ValueError):
+        llm_answer, true_answer = None, None
+    if not isinstance(llm_answer, dict) or not isinstance(true_answer, dict) or not true_answer:
+        return {
+            "pass": False,
+            "score": 0.0,
+            "reason": "answer or ground_truth is not a valid json to be used in this metric",
+        }
+
+    fields = compare_records(llm_answer, true_answer)
+    named_scores = {
+        name: round(sum(scores[name] for scores in fields.values()) / len(fields), 4)
+        for name in METHODS
+    }
+    score = named_scores[method]
+    differences = {
+        field: round(scores[method], 2) for field, scores in fields.items() if scores[method] < 1
+    }
+    return {
+        "pass": score > threshold,
+        "score": score,
+        "reason": f"{score} > {threshold} = {score > threshold}. Differences: {differences}",
+        "named_scores": named_scores,
+    }
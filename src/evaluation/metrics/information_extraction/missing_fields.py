@@ -2,8 +2,10 @@ from pydantic import ValidationError
 
 from evaluation.metrics.data_types import GradingResult
 from evaluation.metrics.utils import create_dynamic_model, convert_to_json
+from utils import time_function
 
 
+@time_function
 def get_assert(output: str, context) -> GradingResult:
     """Evaluates the precision at k."""
     threshold = 0.99
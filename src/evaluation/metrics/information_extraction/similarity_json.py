@@ -5,9 +5,10 @@ from evaluation.metrics.utils import (
     create_dynamic_model,
     convert_to_json,
 )
-from utils import llmaaj_embedding_client
+from utils import llmaaj_embedding_client, time_function
 
 
+@time_function
 def get_assert(output: str, context):
     """Evaluates the precision at k."""
     threshold = 0.99
@@ -63,7 +64,8 @@ def compare_pydantic_objects(
     for field in differences:
         value1 = getattr(obj1, field)
         value2 = getattr(obj2, field)
-        if value1 != value2:
+        # fields equal up to case and spaces do not need embeddings
+        if value1 != value2 and not (value1 and value2 and fold(value1) == fold(value2)):
             if value1 and value2:
                 embedding1 = llmaaj_embedding_client.embed_query(text=str(value1))
                 embedding2 = llmaaj_embedding_client.embed_query(text=str(value2))
@@ -78,6 +80,11 @@ def compare_pydantic_objects(
     return result, total_similarity
 
 
+def fold(value) -> str:
+    """Lowercases a value and collapses its spaces."""
+    return " ".join(str(value).lower().split())
+
+
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     """Calculate cosine similarity between two vectors."""
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
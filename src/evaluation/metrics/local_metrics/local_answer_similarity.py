@@ -0,0 +1,71 @@
+"""Answer similarity computed locally: no judge, no embedding endpoint.
+
+A fast alternative to ragas_metrics/ragas_answer_similarity.py for CI runs: the cosine similarity
+of the hashed character n-gram vectors (see evaluation/metrics/hashed_ngrams.py) of the output
+and of the ground truth. The n-grams are not weighted by an IDF: fitted on the evaluation
+datasets, it would depend on their ground truths and change the scores of the cached results.
+
+For a json ground truth ({field: answer}), each field is compared to the same field of the output
+(named scores), the score is their mean. The assertion config can set a `threshold` (default 0.5).
+"""
+
+import ast
+import json
+from functools import lru_cache
+
+from evaluation.metrics.hashed_ngrams import HashedNgramVectorizer
+from utils import time_function
+
+# CPU-bound: runs in the process pool of the evaluation runner
+IO_BOUND = False
+
+
+@lru_cache(maxsize=1)
+def get_vectorizer() -> HashedNgramVectorizer:
+    return HashedNgramVectorizer()
+
+
+def to_text(value) -> str:
+    return "" if value is None else str(value)
+
+
+def parse_json(text) -> dict | None:
+    """Returns the dict written in a text (json or python literal), None if it is not one."""
+    if isinstance(text, dict):
+        return text
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            value = parse(text)
+        except (TypeError, ValueError, SyntaxError, MemoryError, RecursionError):
+            continue
+        return value if isinstance(value, dict) else None
+    return None
+
+
+@time_function
+def get_assert(output: str, context) -> dict:
+    threshold = context.get("config", {}).get("threshold", 0.5)
+    ground_truth = context["vars"]["ground_truth"]
+    vectorizer = get_vectorizer()
+
+    true_fields = parse_json(ground_truth)
+    named_scores = {}
+    if true_fields:
+        answer_fields = parse_json(output) or {}
+        fields = list(true_fields)
+        similarities = vectorizer.similarities(
+            [to_text(answer_fields.get(field)) for field in fields],
+            [to_text(true_fields[field]) for field in fields],
+        )
+        named_scores = {field: round(float(s), 4) for field, s in zip(fields, similarities)}
+        score = float(similarities.mean())
+    else:
+        score = float(vectorizer.similarities([str(output)], [str(ground_truth)])[0])
+
+    score = round(score, 4)
+    return {
+        "pass": score > threshold,
+        "score": score,
+        "reason": f"{score} > {threshold} = {score > threshold}",
+        "named_scores": named_scores,
+    }
@@ -1,7 +1,7 @@
 import math
 
 from evaluation.metrics.data_types import GradingResult
-from utils import safe_eval
+from utils import safe_eval, time_function
 
 
 # pomptfoo cwd is evaluations
@@ -9,6 +9,7 @@ from utils import safe_eval
 
 # def ragas_context_answer_similarity(input, output, reference, metadata, expected) -> float:
 # def get_assert(output: str, context) -> Union[bool, float, Dict[str, Any]]:
+@time_function
 def get_assert(output: str, context) -> GradingResult:
     """Evaluates the precision at k."""
     retrieved_docs = safe_eval(context["vars"]["context"])
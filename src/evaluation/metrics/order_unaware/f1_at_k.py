@@ -3,8 +3,10 @@ import math
 
 from evaluation.metrics.data_types import GradingResult
 from evaluation.metrics.order_unaware import precision_at_k, recall_at_k
+from utils import time_function
 
 
+@time_function
 def get_assert(output: str, context) -> GradingResult:
     """Calculates F1@k."""
     precision = precision_at_k.get_assert(context=context, output=output)["score"]
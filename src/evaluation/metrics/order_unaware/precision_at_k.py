@@ -2,9 +2,10 @@ import math
 import os
 
 from evaluation.metrics.data_types import GradingResult
-from utils import safe_eval
+from utils import safe_eval, time_function
 
 
+@time_function
 def get_assert(output: str, context) -> GradingResult:
     """Evaluates the precision at k."""
     retrieved_docs = safe_eval(context["vars"]["context"])
@@ -5,8 +5,10 @@ from ragas.metrics import answer_relevancy
 from evaluation.metrics.data_types import GradingResult
 from evaluation.metrics.utils import to_dataset
 from utils import llmaaj_chat_client, llmaaj_embedding_client
+from utils import time_function
 
 
+@time_function
 def get_assert(output: str, context) -> GradingResult:
     eval_dataset = to_dataset(output=output, context=context)
 
@@ -6,10 +6,12 @@ from ragas.metrics import context_utilization
 from evaluation.metrics.data_types import GradingResult
 from evaluation.metrics.utils import to_dataset
 from utils import llmaaj_chat_client, llmaaj_embedding_client
+from utils import time_function
 
 
 # def ragas_context_answer_similarity(input, output, reference, metadata, expected) -> float:
 # def get_assert(output: str, context) -> Union[bool, float, Dict[str, Any]]:
+@time_function
 def get_assert(output: str, context) -> GradingResult:
     eval_dataset = to_dataset(output=output, context=context)
 
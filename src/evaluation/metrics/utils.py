@@ -1,5 +1,6 @@
 import ast
 import json
+from functools import lru_cache
 from typing import Optional
 
 from datasets import Dataset
@@ -204,9 +205,19 @@ def to_evaldataset(output, context):
 
 
 def create_dynamic_model(input_dict: dict):
+    """Returns a model with an optional string field per key, described by its value.
+
+    The same fields give the same class: the response models of ml.ai.get_response_model are
+    cached per class, a new class per request would never be found in its cache.
+    """
+    return _create_dynamic_model(json.dumps(list(input_dict.items()), default=str))
+
+
+@lru_cache(maxsize=256)
+def _create_dynamic_model(fields_json: str):
     fields = {
         i: (Optional[str], Field(default=None, description=question))
-        for i, question in input_dict.items()
+        for i, question in json.loads(fields_json)
     }
 
     return create_model("DynamicModel", **fields)
@@ -0,0 +1,177 @@
+"""Columnar storage of the evaluation results and datasets (Apache Arrow / Parquet).
+
+Results: one parquet file per run, one row per test case x prompt x provider x metric. The
+named scores of the metrics are flattened into `named_scores.<name>` float columns, so an
+aggregation only reads the columns it needs (column pruning) from thousands of runs.
+
+Datasets: the csv datasets (evaluation/data) hold python literals in quoted strings (lists of
+contexts, json queries). The converter stores the lists as list<string> columns and keeps the
+other columns as strings.
+
+Run it from the src directory:
+    `python -m evaluation.parquet_store convert evaluation/data/test_json.csv test_json.parquet`
+"""
+
+import argparse
+import ast
+import csv
+import json
+import time
+import uuid
+from dataclasses import asdict
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+NAMED_SCORES_PREFIX = "named_scores."
+
+RESULTS_SCHEMA = pa.schema(
+    [
+        ("run_id", pa.string()),
+        ("created", pa.timestamp("s")),
+        ("test_index", pa.int32()),
+        ("prompt_index", pa.int32()),
+        ("provider", pa.string()),
+        ("metric", pa.string()),
+        ("passed", pa.bool_()),
+        ("score", pa.float64()),
+        ("reason", pa.string()),
+        ("output", pa.string()),
+        ("vars", pa.string()),  # json
+        ("latency", pa.float64()),
+        ("cached", pa.bool_()),
+    ]
+)
+
+
+def results_to_table(results: list, run_id: str, created: float = None) -> pa.Table:
+    """Returns the Arrow table of the results of a run (AssertionResult objects or dicts)."""
+    rows = [result if isinstance(result, dict) else asdict(result) for result in results]
+    created = int(created or time.time())
+    columns = {
+        "run_id": [run_id] * len(rows),
+        "created": [created] * len(rows),
+        **{
+            name: [row.get(name) for row in rows]
+            for name in RESULTS_SCHEMA.names
+            if name not in ("run_id", "created", "vars")
+        },
+        "vars": [json.dumps(row.get("vars") or {}, ensure_ascii=False) for row in rows],
+    }
+    table = pa.table(columns, schema=RESULTS_SCHEMA)
+
+    named_scores = sorted({name for row in rows for name in row.get("named_scores") or {}})
+    for name in named_scores:
+        values = [(row.get("named_scores") or {}).get(name) for row in rows]
+        table = table.append_column(
+            pa.field(f"{NAMED_SCORES_PREFIX}{name}", pa.float64()), pa.array(values, pa.float64())
+        )
+    return table
+
+
+class ParquetResultsStore:
+    """Evaluation results stored as one parquet file per run in a directory.
+
+    Args:
+        root: the directory of the parquet files.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def write_run(self, results: list, run_id: str = None) -> Path:
+        """Writes the results of a run and returns the path of its file."""
+        run_id = run_id or uuid.uuid4().hex
+        path = self.root / f"{run_id}.parquet"
+        # written then renamed: readers never see a partial file
+        tmp_path = path.with_suffix(".parquet.tmp")
+        pq.write_table(results_to_table(results, run_id), tmp_path, compression="zstd")
+        tmp_path.replace(path)
+        return path
+
+    def dataset(self) -> ds.Dataset:
+        """Returns the dataset of all the runs, with the union of their columns.
+
+        The runs have different named scores columns: a column missing from a run is null.
+        """
+        files = sorted(str(path) for path in self.root.glob("*.parquet"))
+        if not files:
+            return ds.dataset(RESULTS_SCHEMA.empty_table())
+        schema = pa.unify_schemas([pq.read_schema(path) for path in files])
+        return ds.dataset(files, schema=schema, format="parquet")
+
+    def read(
+        self, columns: list[str] = None, run_ids: list[str] = None, metrics: list[str] = None
+    ) -> pa.Table:
+        """Reads the results, only the given columns and the rows of the given runs and metrics.
+
+        Filters are pushed down to the parquet reader, which skips the row groups they exclude.
+        """
+        dataset = self.dataset()
+        filters = []
+        if run_ids is not None:
+            filters.append(pc.field("run_id").isin(run_ids))
+        if metrics is not None:
+            filters.append(pc.field("metric").isin(metrics))
+        expression = None
+        for condition in filters:
+            expression = condition if expression is None else expression & condition
+        return dataset.to_table(columns=columns, filter=expression)
+
+
+def _parse_literal(value: str):
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def convert_dataset(csv_path: str | Path, parquet_path: str | Path) -> pa.Table:
+    """Converts a csv dataset to parquet and returns its table.
+
+    A column whose values are all python lists (e.g. `context`, `relevant_context`) becomes a
+    list<string> column, the other columns stay strings (json queries are kept as written).
+    """
+    with open(csv_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    names = list(rows[0]) if rows else []
+
+    columns = {}
+    for name in names:
+        values = [row[name] for row in rows]
+        parsed = [_parse_literal(value) if value else [] for value in values]
+        if values and all(isinstance(value, list) for value in parsed):
+            columns[name] = pa.array([[str(item) for item in value] for value in parsed])
+        else:
+            columns[name] = pa.array(values, pa.string())
+    table = pa.table(columns)
+    pq.write_table(table, parquet_path, compression="zstd")
+    return table
+
+
+def read_dataset(parquet_path: str | Path) -> list[dict]:
+    """Returns the rows of a parquet dataset as test variables.
+
+    Lists are written back as python literals, as the metrics expect them in the csv datasets.
+    """
+    return [
+        {name: repr(value) if isinstance(value, list) else value for name, value in row.items()}
+        for row in pq.read_table(parquet_path).to_pylist()
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="convert a csv dataset to parquet")
+    convert.add_argument("csv_path")
+    convert.add_argument("parquet_path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        converted = convert_dataset(args.csv_path, args.parquet_path)
+        print(f"{converted.num_rows} rows written to {args.parquet_path}\n{converted.schema}")
@@ -0,0 +1,157 @@
+"""Aggregate reports of the evaluation runs stored as parquet (see evaluation/parquet_store.py).
+
+Every statistic is computed with pandas group-bys over all the cells at once, nothing is run
+again. The confidence intervals use the normal approximation (mean +/- z * standard error), the
+regression of a candidate run is measured on the cells it shares with the baseline run (paired
+differences).
+
+The reports are shown by the promptfoo page of the streamlit app (pages/3_promptfoo.py).
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from evaluation.parquet_store import NAMED_SCORES_PREFIX, ParquetResultsStore
+
+CELL = ["test_index", "prompt_index", "provider", "metric"]
+RESULT_COLUMNS = ["run_id", "created", *CELL, "passed", "score"]
+
+
+def load_results(
+    store: ParquetResultsStore, run_ids: list[str] = None, named_scores: bool = True
+) -> pd.DataFrame:
+    """Returns the results of the runs (all of them by default), one row per cell of a run.
+
+    Only the columns used by the reports are read: not the outputs, the reasons or the variables.
+    With `named_scores`, the named scores are added as `metric.name` rows (see
+    expand_named_scores).
+    """
+    dataset = store.dataset()
+    columns = list(RESULT_COLUMNS)
+    if named_scores:
+        columns += [name for name in dataset.schema.names if name.startswith(NAMED_SCORES_PREFIX)]
+    results = store.read(columns=columns, run_ids=run_ids).to_pandas()
+    return expand_named_scores(results) if named_scores else results
+
+
+def expand_named_scores(results: pd.DataFrame) -> pd.DataFrame:
+    """Moves the `named_scores.<name>` columns to rows of the metric `<metric>.<name>`.
+
+    The json metrics score each field of the json in a named score: they are reported as metrics.
+    """
+    named_columns = [name for name in results.columns if name.startswith(NAMED_SCORES_PREFIX)]
+    if not named_columns:
+        return results
+    named = results.melt(
+        id_vars=[name for name in results.columns if name not in named_columns],
+        value_vars=named_columns,
+        var_name="name",
+        value_name="named_score",
+    ).dropna(subset=["named_score"])
+    named["metric"] = named["metric"] + "." + named["name"].str.removeprefix(NAMED_SCORES_PREFIX)
+    named["score"] = named["named_score"]
+    named["passed"] = np.nan
+    named = named.drop(columns=["name", "named_score"])
+    return pd.concat([results.drop(columns=named_columns), named], ignore_index=True)
+
+
+def list_runs(results: pd.DataFrame) -> pd.DataFrame:
+    """Returns the runs of the results, most recent first: cells, test cases and mean score."""
+    runs = results.groupby("run_id").agg(
+        created=("created", "min"),
+        cells=("score", "size"),
+        tests=("test_index", "nunique"),
+        mean_score=("score", "mean"),
+    )
+    return runs.sort_values("created", ascending=False).reset_index()
+
+
+def _confidence_interval(mean, std, count, confidence: float):
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    half_width = z * std / np.sqrt(count)
+    # a single value has no interval
+    half_width = half_width.where(count > 1)
+    return mean - half_width, mean + half_width
+
+
+def metric_summary(
+    results: pd.DataFrame, by: list[str] = ("run_id", "metric"), confidence: float = 0.95
+) -> pd.DataFrame:
+    """Returns the count, mean score, confidence interval and pass rate of each group."""
+    results = results.assign(passed=results["passed"].astype("float"))
+    summary = results.groupby(list(by)).agg(
+        count=("score", "count"),
+        mean=("score", "mean"),
+        std=("score", "std"),
+        pass_rate=("passed", "mean"),
+    )
+    summary["ci_low"], summary["ci_high"] = _confidence_interval(
+        summary["mean"], summary["std"], summary["count"], confidence
+    )
+    return summary.reset_index()
+
+
+def prompt_comparison(results: pd.DataFrame, run_id: str) -> pd.DataFrame:
+    """Returns the mean score of each metric (rows) for each prompt and provider (columns)."""
+    run = results[results["run_id"] == run_id]
+    return run.pivot_table(
+        index="metric", columns=["prompt_index", "provider"], values="score", aggfunc="mean"
+    )
+
+
+def paired_scores(results: pd.DataFrame, baseline: str, candidate: str) -> pd.DataFrame:
+    """Returns the scores of the cells of both runs: `baseline`, `candidate` and `delta` columns."""
+    scores = results[results["run_id"].isin([baseline, candidate])]
+    paired = scores.pivot_table(index=CELL, columns="run_id", values="score", aggfunc="mean")
+    paired = paired.reindex(columns=[baseline, candidate]).dropna()
+    paired.columns = ["baseline", "candidate"]
+    paired["delta"] = paired["candidate"] - paired["baseline"]
+    return paired.reset_index()
+
+
+def compare_runs(
+    results: pd.DataFrame,
+    baseline: str,
+    candidate: str,
+    tolerance: float = 0.0,
+    confidence: float = 0.95,
+) -> pd.DataFrame:
+    """Compares the metrics of a candidate run to a baseline run on the cells of both runs.
+
+    Args:
+        results: the results of the runs (see load_results).
+        baseline: the run id of the reference run.
+        candidate: the run id of the compared run.
+        tolerance: the drop of the mean score accepted before reporting a regression.
+        confidence: the level of the confidence interval of the mean difference.
+
+    Returns:
+        One row per metric: the mean scores of both runs, the mean difference and its confidence
+        interval, the number of cells whose score dropped by more than `tolerance`, and
+        `regressed`, True when the whole interval is below `-tolerance`.
+    """
+    paired = paired_scores(results, baseline, candidate)
+    paired["dropped"] = paired["delta"] < -tolerance
+    comparison = paired.groupby("metric").agg(
+        cells=("delta", "count"),
+        baseline=("baseline", "mean"),
+        candidate=("candidate", "mean"),
+        delta=("delta", "mean"),
+        delta_std=("delta", "std"),
+        dropped_cells=("dropped", "sum"),
+    )
+    comparison["ci_low"], comparison["ci_high"] = _confidence_interval(
+        comparison["delta"], comparison["delta_std"], comparison["cells"], confidence
+    )
+    comparison["regressed"] = comparison["ci_high"] < -tolerance
+    return comparison.drop(columns="delta_std").reset_index()
+
+
+def regressed_cells(
+    results: pd.DataFrame, baseline: str, candidate: str, tolerance: float = 0.0
+) -> pd.DataFrame:
+    """Returns the cells whose score dropped by more than `tolerance`, largest drop first."""
+    paired = paired_scores(results, baseline, candidate)
+    return paired[paired["delta"] < -tolerance].sort_values("delta").reset_index(drop=True)
@@ -0,0 +1,98 @@
+"""Store of the evaluation outputs and scores, keyed by the hash of everything they depend on.
+
+An output depends on the rendered prompt, the test variables and the provider (its id and
+config, the source of `file://` providers, the chat model). A score depends on the output, the
+test variables, the assertion and the source of the metric. When a prompt, a row of a dataset or
+a metric changes, only the cells depending on it get new keys: the others are read from the store
+instead of being generated and scored again.
+"""
+
+import hashlib
+import inspect
+import json
+import sqlite3
+import time
+from contextlib import closing
+from functools import lru_cache
+from pathlib import Path
+from types import ModuleType
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+
+
+def content_hash(*parts) -> str:
+    """Returns the sha256 of json serializable values."""
+    serialized = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def source_hash(module: ModuleType) -> str:
+    """Returns the hash of the source of a module and of the project modules it imports from.
+
+    The imported project modules (e.g. evaluation.metrics.utils for the json metrics) are
+    included: changing a helper of a metric changes the scores of the metric.
+    """
+    files = {Path(inspect.getfile(module)).resolve()}
+    for value in vars(module).values():
+        dependency = value if isinstance(value, ModuleType) else inspect.getmodule(value)
+        try:
+            path = Path(inspect.getfile(dependency)).resolve()
+        except TypeError:  # built-in or None
+            continue
+        if path.is_relative_to(SRC_DIR):
+            files.add(path)
+    return content_hash(*(path.read_text() for path in sorted(files)))
+
+
+class ResultsStore:
+    """Outputs and scores stored in SQLite, shared by the evaluation runs.
+
+    Args:
+        db_path: the SQLite file.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS outputs (key TEXT PRIMARY KEY, output TEXT, "
+                "latency REAL, created REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, result TEXT, created REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _get(self, query: str, key: str):
+        with closing(self._connect()) as db:
+            return db.execute(query, (key,)).fetchone()
+
+    def _put(self, query: str, values: tuple):
+        with closing(self._connect()) as db, db:
+            db.execute(query, values)
+
+    def get_output(self, key: str) -> tuple[str, float] | None:
+        """Returns the (output, latency) stored for a key, None if there is none."""
+        row = self._get("SELECT output, latency FROM outputs WHERE key = ?", key)
+        return (row[0], row[1]) if row else None
+
+    def put_output(self, key: str, output: str, latency: float):
+        self._put(
+            "INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?)",
+            (key, output, latency, time.time()),
+        )
+
+    def get_score(self, key: str) -> dict | None:
+        """Returns the assertion result ({pass, score, reason, named_scores}) stored for a key."""
+        row = self._get("SELECT result FROM scores WHERE key = ?", key)
+        return json.loads(row[0]) if row else None
+
+    def put_score(self, key: str, result: dict):
+        self._put(
+            "INSERT OR REPLACE INTO scores VALUES (?, ?, ?)",
+            (key, json.dumps(result, ensure_ascii=False), time.time()),
+        )
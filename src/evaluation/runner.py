@@ -0,0 +1,739 @@
+"""Runs promptfoo evaluation configs in Python.
+
+The runner reads the same yaml configs as promptfoo (evaluation/configs) and supports the parts
+used by this project:
+    - prompts: nunjucks-like templates rendered with the variables of each test (jinja2).
+    - providers: `file://...py` providers (their `call_api` function); any other provider id is
+      answered by the chat client of the application (see ml.ai.get_completions).
+    - tests: inline tests and `file://...csv` or `file://...parquet` datasets (see
+      evaluation/parquet_store.py), variables can be `file://...py` files
+      (their `get_var` function) or `file://` text files.
+    - assertions: python metrics (`file://...py` with a `get_assert` function), equals,
+      contains, icontains, is-json and contains-json. The other types are skipped.
+    - gates (extension): an assertion can be decided by cheaper assertions of the same test,
+      it is then not run (see check_gates).
+
+The outputs are requested in threads. The python metrics are dispatched by kind (see
+metric_kind): CPU-bound metrics (json comparisons, retrieval metrics) run in a pool of processes
+with warm imports, I/O-bound metrics (ragas, llm as a judge) run in threads driven by asyncio.
+
+With a results store (see evaluation/results_store.py), the outputs and the scores that do not
+depend on what changed since a previous run are read from the store instead of recomputed.
+
+It is used by the evaluation jobs (see evaluation/jobs.py) and from the command line:
+`python -m evaluation.runner evaluation/configs/config_simple.yaml --output results.json`
+"""
+
+import argparse
+import asyncio
+import csv
+import importlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from types import ModuleType
+from typing import Callable
+
+import jinja2
+import jinja2.sandbox
+import yaml
+
+from evaluation.parquet_store import ParquetResultsStore, read_dataset
+from evaluation.results_store import ResultsStore, content_hash, source_hash
+from settings import ProviderEnum
+from telemetry import span
+from utils import chat_model_name, logger, settings
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+EVALUATION_DIR = SRC_DIR / "evaluation"
+CONFIGS_DIR = EVALUATION_DIR / "configs"
+# the `file://` references are imported and run: only the files of these directories can be used
+ALLOWED_DIRS = [EVALUATION_DIR]
+# the environment variables the templates can read ({{env.NAME}})
+TEMPLATE_ENV_VARIABLES = ("OPENAI_DEPLOYMENT_NAME", "AZURE_OPENAI_DEPLOYMENT_NAME")
+
+# sandboxed: a template cannot reach python objects (e.g. os through the globals of a function)
+_templates = jinja2.sandbox.SandboxedEnvironment(autoescape=False)
+
+
+@dataclass
+class AssertionResult:
+    """The result of one assertion on the output of a prompt for a test case."""
+
+    test_index: int
+    prompt_index: int
+    provider: str
+    metric: str
+    passed: bool
+    score: float
+    reason: str
+    named_scores: dict[str, float] = field(default_factory=dict)
+    output: str = ""
+    vars: dict = field(default_factory=dict)
+    latency: float = 0.0  # seconds to get the output
+    cached: bool = False  # read from the results store
+
+
+def render(template: str, variables: dict) -> str:
+    """Renders a promptfoo template ({{var}}, {{env.NAME}}) with the variables of a test."""
+    env = {name: os.environ[name] for name in TEMPLATE_ENV_VARIABLES if name in os.environ}
+    return _templates.from_string(template).render(env=env, **variables)
+
+
+def resolve_path(path: str, base_dir: Path) -> Path:
+    """Returns the path of a `file://` reference, relative to the directory of the config.
+
+    Raises:
+        ValueError: the path is outside of the allowed directories (see ALLOWED_DIRS).
+    """
+    resolved = (Path(base_dir) / path.removeprefix("file://")).resolve()
+    if not any(resolved.is_relative_to(Path(root).resolve()) for root in ALLOWED_DIRS):
+        raise ValueError(f"{path} is outside of the evaluation directory")
+    return resolved
+
+
+@lru_cache(maxsize=None)
+def load_module(path: Path):
+    """Imports a python file, as a module of the src package when it is one (metrics, configs)."""
+    try:
+        module_name = ".".join(path.relative_to(SRC_DIR).with_suffix("").parts)
+    except ValueError:
+        module_name = None
+    if module_name:
+        return importlib.import_module(module_name)
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_config(path: str | Path) -> dict:
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+def load_tests(config: dict, base_dir: Path) -> list[dict]:
+    """Returns the test cases of a config: inline tests and the rows of the datasets."""
+    tests = []
+    for test in config.get("tests") or []:
+        if isinstance(test, str) and test.endswith(".parquet"):
+            tests.extend({"vars": row} for row in read_dataset(resolve_path(test, base_dir)))
+        elif isinstance(test, str):
+            with open(resolve_path(test, base_dir), newline="") as f:
+                tests.extend({"vars": row} for row in csv.DictReader(f))
+        else:
+            tests.append(test)
+
+    default_test = config.get("defaultTest") or {}
+    return [
+        {
+            **test,
+            "vars": {**default_test.get("vars", {}), **test.get("vars", {})},
+            "assert": (default_test.get("assert") or []) + (test.get("assert") or []),
+        }
+        for test in tests
+    ]
+
+
+def resolve_vars(variables: dict, prompt: str, base_dir: Path) -> dict:
+    """Replaces the `file://` variables by the output of their get_var function or their text."""
+    resolved = dict(variables)
+    for name, value in variables.items():
+        if not isinstance(value, str) or not value.startswith("file://"):
+            continue
+        path = resolve_path(value, base_dir)
+        if path.suffix == ".py":
+            resolved[name] = load_module(path).get_var(name, prompt, variables)["output"]
+        else:
+            resolved[name] = path.read_text()
+    return resolved
+
+
+def call_provider(provider: dict, prompt: str, variables: dict, base_dir: Path) -> str:
+    """Returns the output of a provider for a rendered prompt.
+
+    Raises:
+        ValueError: the provider is neither a `file://` provider nor the chat deployment.
+    """
+    provider_id = render(provider["id"], {})
+    if provider_id.startswith("file://"):
+        module = load_module(resolve_path(provider_id, base_dir))
+        result = module.call_api(prompt, provider.get("config", {}), {"vars": variables})
+        if result.get("error"):
+            raise RuntimeError(result["error"])
+        return result["output"]
+
+    # only the chat deployment of the settings is available: another model cannot be substituted
+    _, _, deployment = provider_id.rpartition(":chat:")
+    if deployment != chat_model_name:
+        raise ValueError(
+            f"Unsupported provider {provider_id}: only file:// providers and the chat deployment "
+            f"{chat_model_name} (e.g. azureopenai:chat:{chat_model_name}) can be evaluated"
+        )
+
+    # imported here: the chat client is only needed by configs calling a model
+    from ml.ai import get_completions
+
+    output = get_completions(messages=[{"role": "user", "content": prompt}])
+    if output is None:
+        raise RuntimeError(f"The provider {provider_id} did not answer")
+    return output
+
+
+def provider_fingerprint(provider: dict, base_dir: Path) -> dict:
+    """Returns what the outputs of a provider depend on, besides the prompt and the variables."""
+    provider_id = render(provider["id"], {})
+    fingerprint = {"id": provider_id, "config": provider.get("config", {})}
+    if provider_id.startswith("file://"):
+        fingerprint["source"] = source_hash(load_module(resolve_path(provider_id, base_dir)))
+    else:
+        fingerprint["model"] = chat_model_name
+    return fingerprint
+
+
+def judge_fingerprint() -> dict:
+    """Returns the models of the LLM as a judge, used by the I/O-bound metrics."""
+    provider = settings.LLMAAJ_PROVIDER
+    if provider == ProviderEnum.openai:
+        model = settings.LLMAAJ_OPENAI_DEPLOYMENT_NAME
+        embedding_model = settings.LLMAAJ_OPENAI_EMBEDDING_DEPLOYMENT_NAME
+    elif provider == ProviderEnum.azure_openai:
+        model = settings.LLMAAJ_AZURE_OPENAI_DEPLOYMENT_NAME
+        embedding_model = settings.LLMAAJ_AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME
+    else:
+        model = embedding_model = settings.LOCAL_MODEL_NAME
+    return {"provider": provider, "model": model, "embedding_model": embedding_model}
+
+
+def assertion_fingerprint(assertion: dict, variables: dict, base_dir: Path) -> dict:
+    """Returns what the result of an assertion depends on, besides the output.
+
+    The scores of the I/O-bound metrics also depend on the judge: changing its model computes
+    them again.
+    """
+    fingerprint = {"assertion": assertion, "vars": variables}
+    if assertion["type"] == "python":
+        fingerprint["source"] = source_hash(load_module(resolve_path(assertion["value"], base_dir)))
+        if metric_kind(assertion, base_dir) == "io":
+            fingerprint["judge"] = judge_fingerprint()
+    return fingerprint
+
+
+def _is_json(text: str) -> bool:
+    try:
+        json.loads(text)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _contains_json(text: str) -> bool:
+    decoder = json.JSONDecoder()
+    for start, char in enumerate(text):
+        if char in "{[":
+            try:
+                decoder.raw_decode(text, start)
+                return True
+            except ValueError:
+                continue
+    return False
+
+
+ASSERTION_TYPES = ("python", "equals", "contains", "icontains", "is-json", "contains-json")
+
+
+def run_assertion(assertion: dict, output: str, context: dict, base_dir: Path) -> dict:
+    """Returns {pass, score, reason, named_scores} of an assertion on an output."""
+    assertion_type = assertion["type"]
+    value = assertion.get("value")
+    if isinstance(value, str) and assertion_type != "python":
+        value = render(value, context["vars"])
+
+    if assertion_type == "python":
+        module = load_module(resolve_path(value, base_dir))
+        result = module.get_assert(output, {**context, "config": assertion.get("config", {})})
+        if isinstance(result, bool):
+            result = {"pass": result, "score": float(result), "reason": ""}
+        elif isinstance(result, (int, float)):
+            result = {"pass": result > 0, "score": float(result), "reason": ""}
+        else:
+            result = dict(result)
+            if "pass_" in result:  # GradingResult
+                result["pass"] = result.pop("pass_")
+    else:
+        passed = {
+            "equals": lambda: output == value,
+            "contains": lambda: value in output,
+            "icontains": lambda: value.lower() in output.lower(),
+            "is-json": lambda: _is_json(output),
+            "contains-json": lambda: _contains_json(output),
+        }[assertion_type]()
+        result = {"pass": passed, "score": float(passed), "reason": f"{assertion_type}: {passed}"}
+
+    if assertion.get("threshold") is not None:
+        result["pass"] = result["score"] >= assertion["threshold"]
+    return {
+        "pass": bool(result["pass"]),
+        "score": float(result.get("score") or 0.0),
+        "reason": str(result.get("reason", "")),
+        "named_scores": result.get("named_scores") or {},
+    }
+
+
+def metric_name(assertion: dict) -> str:
+    if assertion.get("metric"):
+        return assertion["metric"]
+    if assertion["type"] == "python":
+        return Path(str(assertion["value"])).stem
+    return assertion["type"]
+
+
+# packages whose use makes a metric wait for a model (llm as a judge, embeddings)
+IO_PACKAGES = ("ragas", "langchain", "langchain_core", "langchain_openai", "openai", "ml")
+
+
+@lru_cache(maxsize=None)
+def _module_kind(path: Path) -> str:
+    module = load_module(path)
+    if hasattr(module, "IO_BOUND"):
+        return "io" if module.IO_BOUND else "cpu"
+    for value in vars(module).values():
+        name = getattr(value, "__name__", "") if isinstance(value, ModuleType) else ""
+        name = name or getattr(value, "__module__", None) or type(value).__module__
+        if name.split(".")[0] in IO_PACKAGES:
+            return "io"
+    return "cpu"
+
+
+def metric_kind(assertion: dict, base_dir: Path) -> str:
+    """Returns how an assertion is run: "inline" (built-in), "cpu" (process pool) or "io".
+
+    A python metric is I/O-bound if it uses a model (it imports from ragas, langchain, openai or
+    ml), CPU-bound otherwise. A metric module can set `IO_BOUND = True/False` to override it.
+    """
+    if assertion["type"] != "python":
+        return "inline"
+    return _module_kind(resolve_path(assertion["value"], base_dir))
+
+
+def _init_process(metric_paths: list[Path], allowed_dirs: list[Path]):
+    """Imports the metrics in a new worker process, so that the first tasks do not wait for it.
+
+    The worker resolves the `file://` references with the allowed directories of the parent.
+    """
+    global ALLOWED_DIRS
+    ALLOWED_DIRS = allowed_dirs
+    for path in metric_paths:
+        load_module(path)
+
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool(
+    workers: int, metric_paths: list[Path], broken: ProcessPoolExecutor = None
+) -> ProcessPoolExecutor:
+    """Returns the pool of processes running the CPU-bound metrics, shared by the runs.
+
+    The pool is created by the first run, with its number of workers. The workers are spawned
+    (not forked from a process running threads) and import the metrics of this run when they
+    start. A pool broken by a worker that died (e.g. out of memory) is replaced: pass it as
+    `broken` when a task failed with BrokenProcessPool.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        # _broken is set by the executor when one of its processes died
+        if _process_pool is not None and (
+            _process_pool is broken or getattr(_process_pool, "_broken", False)
+        ):
+            logger.warning("A worker process of the CPU-bound metrics died, the pool is recreated")
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process,
+                initargs=(metric_paths, list(ALLOWED_DIRS)),
+            )
+        elif _process_pool._max_workers != workers:
+            # the pool is shared by the running evaluations, it is not replaced while in use
+            logger.warning(
+                f"The process pool has {_process_pool._max_workers} workers, not {workers}: the "
+                "workers of the first run are kept"
+            )
+        return _process_pool
+
+
+GATE_CONDITIONS = ("pass", "fail")
+
+
+def check_gates(assertions: list[dict]):
+    """Checks the gates of the assertions of a test.
+
+    An assertion with `gates` is only run if none of its gates decides it. A gate names the
+    metric of another assertion of the test, the outcome deciding the assertion and its score:
+
+        - type: python
+          value: file://../metrics/ragas_metrics/ragas_answer_similarity.py
+          gates:
+            - {metric: Exact Match JSON, when: pass, score: 1.0}
+            - {metric: is-json, when: fail, score: 0.0}
+
+    A gated assertion passes if its gate says so with `pass`. Without it, it passes if the score
+    reaches the threshold of the assertion, if any, or is positive.
+
+    Raises:
+        ValueError: a gate names an unknown or ambiguous metric, has an unknown condition, or
+            the gates form a cycle.
+    """
+    names = Counter(metric_name(assertion) for assertion in assertions)
+    dependencies = {}
+    for assertion in assertions:
+        for gate in assertion.get("gates") or []:
+            if names[gate.get("metric")] != 1:
+                raise ValueError(
+                    f"The gate {gate.get('metric')!r} of {metric_name(assertion)} must name "
+                    "exactly one assertion of the test"
+                )
+            if gate.get("when") not in GATE_CONDITIONS or "score" not in gate:
+                raise ValueError(
+                    f"A gate needs `when` ({' or '.join(GATE_CONDITIONS)}) and `score`"
+                )
+            dependencies.setdefault(metric_name(assertion), set()).add(gate["metric"])
+
+    done, visiting = set(), set()
+
+    def visit(name: str):
+        if name in visiting:
+            raise ValueError(f"The gates of {name} form a cycle")
+        if name not in done:
+            visiting.add(name)
+            for dependency in dependencies.get(name, ()):
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+    for name in dependencies:
+        visit(name)
+
+
+def gated_result(assertion: dict, gate: dict) -> dict:
+    """Returns the result given to an assertion by a gate deciding it."""
+    score = float(gate["score"])
+    if "pass" in gate:
+        passed = gate["pass"]
+    elif assertion.get("threshold") is not None:
+        passed = score >= assertion["threshold"]
+    else:
+        passed = score > 0
+    return {
+        "pass": bool(passed),
+        "score": score,
+        "reason": f"gated: {gate['metric']} {gate['when']}",
+        "named_scores": {},
+    }
+
+
+def _safe_assertion(assertion: dict, output: str, context: dict, base_dir: Path) -> dict:
+    """Runs an assertion, returning a failed result instead of raising."""
+    try:
+        return run_assertion(assertion, output, context, base_dir)
+    except Exception as e:
+        logger.warning(f"Assertion {metric_name(assertion)} failed: {e!r}")
+        return {"pass": False, "score": 0.0, "reason": f"error: {e}", "error": True}
+
+
+def get_output(
+    test: dict, prompt_template: str, provider: dict, base_dir: Path, store: ResultsStore = None
+) -> dict:
+    """Returns the output of a provider for a test and a prompt, read from the store if possible.
+
+    Returns:
+        {"prompt", "vars", "output", "latency", "key", "cached"}, with an "error" instead of the
+        output if the provider failed (errors are not stored, they are retried by the next run).
+    """
+    variables = resolve_vars(test["vars"], prompt_template, base_dir)
+    prompt = render(prompt_template, variables)
+    case = {"prompt": prompt, "vars": variables, "latency": 0.0, "cached": False}
+    case["key"] = content_hash(prompt, variables, provider_fingerprint(provider, base_dir))
+
+    stored = store.get_output(case["key"]) if store else None
+    if stored:
+        case["output"], case["latency"] = stored
+        case["cached"] = True
+        return case
+    start = time.perf_counter()
+    try:
+        case["output"] = call_provider(provider, prompt, variables, base_dir)
+    except Exception as e:
+        logger.exception(f"Provider {provider['id']}: {e}")
+        case["error"] = str(e)
+        return case
+    case["latency"] = time.perf_counter() - start
+    if store:
+        store.put_output(case["key"], case["output"], case["latency"])
+    return case
+
+
+class _Executors:
+    """Runs the work of an evaluation on the executor of its kind, with bounded concurrency."""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        io_concurrency: int,
+        process_pool=None,
+        replace_process_pool: Callable[[ProcessPoolExecutor], ProcessPoolExecutor] = None,
+    ):
+        self.cases = asyncio.Semaphore(max_concurrency)
+        self.io = asyncio.Semaphore(io_concurrency)
+        self.process_pool = process_pool
+        self.replace_process_pool = replace_process_pool
+
+    async def run(self, kind: str, function, *args):
+        if kind == "cpu" and self.process_pool:
+            loop = asyncio.get_running_loop()
+            pool = self.process_pool
+            try:
+                return await loop.run_in_executor(pool, function, *args)
+            except BrokenProcessPool:
+                if self.replace_process_pool is None:
+                    raise
+            # a worker died (e.g. out of memory): the task is run once more on a new pool
+            if self.process_pool is pool:
+                self.process_pool = self.replace_process_pool(pool)
+            try:
+                return await loop.run_in_executor(self.process_pool, function, *args)
+            except BrokenProcessPool as e:
+                return {"pass": False, "score": 0.0, "reason": f"error: {e}", "error": True}
+        if kind == "inline":
+            return function(*args)
+        # the metrics and the providers are synchronous, they wait for the models in threads
+        async with self.io:
+            return await asyncio.to_thread(function, *args)
+
+
+async def evaluate_case(
+    test_index: int,
+    test: dict,
+    prompt_index: int,
+    prompt_template: str,
+    provider: dict,
+    base_dir: Path,
+    executors: _Executors,
+    store: ResultsStore = None,
+) -> list[AssertionResult]:
+    """Gets the output of a provider for a test and a prompt, then runs the assertions of the test.
+
+    The assertions run concurrently, each on the executor of its kind (see metric_kind), an
+    assertion with gates waits for the assertions it is gated by (see check_gates). With a store,
+    the output and the assertion results are read from it when their key is found.
+    """
+    label = render(provider.get("label") or provider["id"], {})
+    with span("evaluation.case", test=test_index, prompt=prompt_index, provider=label) as current:
+        async with executors.cases:
+            case = await asyncio.to_thread(
+                get_output, test, prompt_template, provider, base_dir, store
+            )
+        current.set_attribute("cached_output", case["cached"])
+        if "error" in case:
+            result = AssertionResult(
+                test_index, prompt_index, label, "provider", False, 0.0, f"error: {case['error']}"
+            )
+            result.vars = case["vars"]
+            return [result]
+
+        context = {"prompt": case["prompt"], "vars": case["vars"], "test": test}
+        assertions = [a for a in test["assert"] if a["type"] in ASSERTION_TYPES]
+        tasks = {}
+        gated = 0
+
+        async def score(assertion: dict) -> AssertionResult:
+            nonlocal gated
+            key = None
+            result = None
+            if store:
+                fingerprint = assertion_fingerprint(assertion, case["vars"], base_dir)
+                key = content_hash(case["key"], case["output"], fingerprint)
+                result = store.get_score(key)
+            cached = result is not None
+            gates = [] if cached else assertion.get("gates") or []
+            for gate in gates:
+                gate_result = await tasks[gate["metric"]]
+                if gate_result.passed == (gate["when"] == "pass"):
+                    result = gated_result(assertion, gate)
+                    gated += 1
+                    break
+            if result is None:
+                result = await executors.run(
+                    metric_kind(assertion, base_dir),
+                    _safe_assertion,
+                    assertion,
+                    case["output"],
+                    context,
+                    base_dir,
+                )
+                if store and not result.pop("error", False):
+                    store.put_score(key, result)
+            return AssertionResult(
+                test_index=test_index,
+                prompt_index=prompt_index,
+                provider=label,
+                metric=metric_name(assertion),
+                passed=result["pass"],
+                score=result["score"],
+                reason=result["reason"],
+                named_scores=result.get("named_scores") or {},
+                output=case["output"],
+                vars=case["vars"],
+                latency=case["latency"],
+                cached=cached,
+            )
+
+        scoring = [asyncio.ensure_future(score(assertion)) for assertion in assertions]
+        # the gated assertions await the tasks of their gates, created before any of them runs
+        for assertion, task in zip(assertions, scoring):
+            tasks.setdefault(metric_name(assertion), task)
+        results = list(await asyncio.gather(*scoring))
+        current.set_attribute("gated", gated)
+        return results
+
+
+def summarize(results: list[AssertionResult]) -> dict:
+    """Returns the pass rate and the mean score of each metric."""
+    metrics = {}
+    for result in results:
+        metric = metrics.setdefault(result.metric, {"count": 0, "passed": 0, "score": 0.0})
+        metric["count"] += 1
+        metric["passed"] += result.passed
+        metric["score"] += result.score
+    return {
+        name: {
+            "count": metric["count"],
+            "pass_rate": metric["passed"] / metric["count"],
+            "mean_score": metric["score"] / metric["count"],
+        }
+        for name, metric in metrics.items()
+    }
+
+
+def run_evaluation(
+    config: dict,
+    base_dir: str | Path = CONFIGS_DIR,
+    max_concurrency: int = 4,
+    progress: Callable[[int, int], None] = None,
+    store: ResultsStore = None,
+    process_workers: int = None,
+    io_concurrency: int = None,
+) -> list[AssertionResult]:
+    """Runs every prompt of a config with every provider on every test case.
+
+    Args:
+        config: the promptfoo config (see load_config).
+        base_dir: the directory the `file://` references of the config are relative to.
+        max_concurrency: test cases whose output is requested at the same time.
+        progress: called with (cases done, total cases) after each case.
+        store: the store of the outputs and scores of the previous runs, None to compute them all.
+            Ignored if the config disables the cache (evaluateOptions.cache: false).
+        process_workers: processes running the CPU-bound metrics, 0 to run them in threads.
+            Defaults to settings.EVALUATION_PROCESS_WORKERS (None = number of CPUs).
+        io_concurrency: I/O-bound metrics run at the same time. Defaults to
+            settings.EVALUATION_IO_CONCURRENCY.
+
+    Returns:
+        the results of the assertions, one per test case, prompt, provider and metric.
+    """
+    base_dir = Path(base_dir)
+    if not (config.get("evaluateOptions") or {}).get("cache", True):
+        store = None
+    if process_workers is None:
+        process_workers = settings.EVALUATION_PROCESS_WORKERS or os.cpu_count()
+    tests = load_tests(config, base_dir)
+    for test in tests:
+        check_gates([a for a in test["assert"] if a["type"] in ASSERTION_TYPES])
+    prompts = config.get("prompts") or []
+    providers = [
+        {"id": provider} if isinstance(provider, str) else provider
+        for provider in config.get("providers") or []
+    ]
+    cases = [
+        (test_index, test, prompt_index, prompt, provider)
+        for test_index, test in enumerate(tests)
+        for prompt_index, prompt in enumerate(prompts)
+        for provider in providers
+    ]
+    logger.info(
+        "Evaluating {} tests x {} prompts x {} providers", len(tests), len(prompts), len(providers)
+    )
+
+    cpu_metrics = {
+        resolve_path(assertion["value"], base_dir)
+        for test in tests
+        for assertion in test["assert"]
+        if assertion["type"] == "python" and metric_kind(assertion, base_dir) == "cpu"
+    }
+    process_pool = None
+    if cpu_metrics and process_workers:
+        process_pool = get_process_pool(process_workers, sorted(cpu_metrics))
+
+    def replace_process_pool(broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        return get_process_pool(process_workers, sorted(cpu_metrics), broken=broken)
+
+    async def run_cases() -> list[AssertionResult]:
+        executors = _Executors(
+            max_concurrency,
+            io_concurrency or settings.EVALUATION_IO_CONCURRENCY,
+            process_pool,
+            replace_process_pool,
+        )
+        tasks = [
+            asyncio.create_task(evaluate_case(*case, base_dir, executors, store)) for case in cases
+        ]
+        results = []
+        for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+            results.extend(await task)
+            if progress:
+                progress(done, len(cases))
+        return results
+
+    with span("evaluation.run", cases=len(cases), cpu_metrics=len(cpu_metrics)):
+        results = asyncio.run(run_cases())
+    return sorted(results, key=lambda r: (r.test_index, r.prompt_index, r.provider))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("config", help="promptfoo yaml config")
+    parser.add_argument("--output", help="json file receiving the results")
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--store", default=settings.EVALUATION_RESULTS_DB, help="SQLite file")
+    parser.add_argument("--no-store", action="store_true", help="recompute every result")
+    parser.add_argument(
+        "--parquet", default=settings.EVALUATION_PARQUET_DIR, help="directory of the runs"
+    )
+    args = parser.parse_args()
+
+    config_path = Path(args.config).resolve()
+    evaluation_results = run_evaluation(
+        load_config(config_path),
+        config_path.parent,
+        args.max_concurrency,
+        store=None if args.no_store else ResultsStore(args.store),
+    )
+    print(json.dumps(summarize(evaluation_results), indent=2))
+    if args.parquet:
+        ParquetResultsStore(args.parquet).write_run(evaluation_results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([asdict(r) for r in evaluation_results], f, ensure_ascii=False, indent=2)
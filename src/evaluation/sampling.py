@@ -0,0 +1,313 @@
+"""Evaluation of a sample of a large dataset, grown until the metric means are precise enough.
+
+Scoring every row of a large dataset with llm-judged metrics (evaluation/metrics/ragas_metrics)
+is slow and costly. In sampling mode the rows are evaluated in a random order that keeps the
+strata of a variable (e.g. the topic of the question) in their dataset proportions at any
+sample size. After a first batch, the mean of each metric is estimated with a confidence
+interval (stratified estimator with finite population correction), and batches are added until
+every interval is narrower than the target and every stratum has a minimum of sampled rows, or
+the sample reaches its maximum size. A sample of identical scores (e.g. the first rows all pass)
+is not taken as precise: the intervals of the scores in [0, 1] are computed as if each stratum
+also had z²/2 scores of 0 and z²/2 scores of 1 (Agresti-Coull interval for the binary metrics).
+
+It is enabled in a promptfoo config by `evaluateOptions.sampling`:
+
+    evaluateOptions:
+      sampling:
+        targetHalfWidth: 0.05  # half width of the confidence intervals of the means
+        confidence: 0.95
+        initialSize: 100  # test cases of the first batch
+        batchSize: 100  # test cases added per batch
+        maxSize: 2000  # default: the whole dataset
+        stratifyBy: topic  # variable of the test cases, default: no strata
+        minStratumSize: 10  # sampled rows per stratum (or all its rows) before stopping
+        metrics: [Ragas Answer Similarity]  # metrics reaching the target, default: all
+        seed: 0
+
+Run it from the src directory:
+`python -m evaluation.sampling evaluation/configs/config_simple.yaml --output results.json`
+"""
+
+import argparse
+import json
+import random
+from collections import defaultdict
+from dataclasses import asdict, dataclass, replace
+from math import sqrt
+from pathlib import Path
+from statistics import NormalDist
+from typing import Callable
+
+from evaluation.parquet_store import ParquetResultsStore
+from evaluation.results_store import ResultsStore
+from evaluation.runner import (
+    CONFIGS_DIR,
+    AssertionResult,
+    load_config,
+    load_tests,
+    run_evaluation,
+    summarize,
+)
+from utils import logger, settings
+
+
+@dataclass
+class SamplingOptions:
+    target_half_width: float = 0.05
+    confidence: float = 0.95
+    initial_size: int = 100
+    batch_size: int = 100
+    max_size: int = None
+    stratify_by: str = None
+    min_stratum_size: int = 10
+    metrics: list[str] = None
+    seed: int = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> "SamplingOptions | None":
+        """Returns the options of `evaluateOptions.sampling`, None if sampling is disabled."""
+        options = (config.get("evaluateOptions") or {}).get("sampling")
+        if not options:
+            return None
+        options = {} if options is True else options
+        names = {
+            "targetHalfWidth": "target_half_width",
+            "confidence": "confidence",
+            "initialSize": "initial_size",
+            "batchSize": "batch_size",
+            "maxSize": "max_size",
+            "stratifyBy": "stratify_by",
+            "minStratumSize": "min_stratum_size",
+            "metrics": "metrics",
+            "seed": "seed",
+        }
+        unknown = set(options) - set(names)
+        if unknown:
+            raise ValueError(f"Unknown sampling options: {', '.join(sorted(unknown))}")
+        return cls(**{names[name]: value for name, value in options.items()})
+
+
+def stratum(test: dict, stratify_by: str | None) -> str:
+    return str(test["vars"].get(stratify_by)) if stratify_by else ""
+
+
+def stratified_order(tests: list[dict], stratify_by: str = None, seed: int = 0) -> list[int]:
+    """Returns the indices of the tests in an order whose prefixes are proportionally stratified.
+
+    The rows of each stratum are shuffled, the i-th row of a stratum of size n is placed at the
+    position (i + u) / n of the order (u uniform in [0, 1)): any prefix holds about the same
+    share of each stratum as the dataset.
+    """
+    rng = random.Random(seed)
+    strata = defaultdict(list)
+    for index, test in enumerate(tests):
+        strata[stratum(test, stratify_by)].append(index)
+
+    keys = []
+    for indices in strata.values():
+        rng.shuffle(indices)
+        keys.extend(
+            ((rank + rng.random()) / len(indices), index) for rank, index in enumerate(indices)
+        )
+    return [index for _, index in sorted(keys)]
+
+
+def estimate_means(
+    results: list[AssertionResult],
+    strata: dict[int, str],
+    population: dict[str, int],
+    confidence: float = 0.95,
+) -> dict:
+    """Returns the stratified estimate of the mean score of each metric, prompt and provider.
+
+    Args:
+        results: the results of the sampled test cases.
+        strata: {test index: stratum} of the sampled test cases.
+        population: {stratum: number of test cases in the dataset}.
+        confidence: the level of the confidence intervals.
+
+    Returns:
+        {metric: {"mean", "half_width", "ci_low", "ci_high", "count"}}, the metrics are
+        named `metric` if the config has one prompt and one provider, else
+        `metric [prompt <index>, <provider>]`. The half width is None below 2 sampled cases.
+        For the metrics scored in [0, 1], the half width is computed with z²/2 pseudo-scores of
+        0 and of 1 per stratum (Agresti-Coull): identical scores do not give an interval of 0.
+    """
+    groups = {(r.prompt_index, r.provider) for r in results}
+    scores = defaultdict(lambda: defaultdict(list))
+    for result in results:
+        name = result.metric
+        if len(groups) > 1:
+            name = f"{result.metric} [prompt {result.prompt_index}, {result.provider}]"
+        scores[name][strata[result.test_index]].append(result.score)
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    estimates = {}
+    for name, by_stratum in scores.items():
+        count = sum(len(values) for values in by_stratum.values())
+        # the strata not sampled yet are represented by the sampled ones
+        sampled_total = sum(population[key] for key in by_stratum)
+        all_values = [value for values in by_stratum.values() for value in values]
+        pooled_variance = _variance(all_values)
+        bounded = all(0 <= value <= 1 for value in all_values)
+        mean, variance = 0.0, 0.0
+        for key, values in by_stratum.items():
+            weight = population[key] / sampled_total
+            mean += weight * sum(values) / len(values)
+            correction = 1 - len(values) / population[key]
+            if bounded:
+                variance += weight**2 * _adjusted_variance(values, z) * correction
+            else:
+                # a stratum with a single sampled case gets the variance of the whole sample
+                stratum_variance = _variance(values) if len(values) > 1 else pooled_variance
+                variance += weight**2 * stratum_variance / len(values) * correction
+        half_width = z * sqrt(variance) if count > 1 else None
+        estimates[name] = {
+            "mean": mean,
+            "half_width": half_width,
+            "ci_low": None if half_width is None else mean - half_width,
+            "ci_high": None if half_width is None else mean + half_width,
+            "count": count,
+        }
+    return estimates
+
+
+def _variance(values: list[float]) -> float:
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / len(values)
+    return sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+
+
+def _adjusted_variance(values: list[float], z: float) -> float:
+    """Returns the variance of the mean of scores in [0, 1] with z²/2 pseudo-scores of 0 and 1.
+
+    For binary scores, it is the variance of the Agresti-Coull interval: p(1 - p) / (n + z²)
+    with p = (successes + z²/2) / (n + z²).
+    """
+    size = len(values) + z**2
+    mean = (sum(values) + z**2 / 2) / size
+    second_moment = (sum(value**2 for value in values) + z**2 / 2) / size
+    return max(second_moment - mean**2, 0.0) / size
+
+
+def covers_strata(
+    sampled: list[int], strata: dict[int, str], population: dict[str, int], minimum: int
+) -> bool:
+    """Returns whether each stratum has `minimum` sampled test cases (or all its test cases)."""
+    counts = defaultdict(int)
+    for index in sampled:
+        counts[strata[index]] += 1
+    return all(counts[key] >= min(minimum, size) for key, size in population.items())
+
+
+def is_precise(estimates: dict, options: SamplingOptions) -> bool:
+    """Returns whether the intervals of the target metrics are narrower than the target."""
+    targets = [
+        estimate
+        for name, estimate in estimates.items()
+        if options.metrics is None or name.split(" [")[0] in options.metrics
+    ]
+    return bool(targets) and all(
+        estimate["half_width"] is not None and estimate["half_width"] <= options.target_half_width
+        for estimate in targets
+    )
+
+
+def run_sampled_evaluation(
+    config: dict,
+    base_dir: str | Path = CONFIGS_DIR,
+    options: SamplingOptions = None,
+    progress: Callable[[int, int], None] = None,
+    **run_options,
+) -> tuple[list[AssertionResult], dict]:
+    """Evaluates growing samples of the test cases of a config until the means are precise.
+
+    Args:
+        config: the promptfoo config (see evaluation.runner.load_config).
+        base_dir: the directory the `file://` references of the config are relative to.
+        options: the sampling options, defaults to the `evaluateOptions.sampling` of the config.
+        progress: called with (cases done, cases planned) after each case.
+        **run_options: passed to evaluation.runner.run_evaluation (store, max_concurrency...).
+
+    Returns:
+        the results of the sampled test cases (with their index in the dataset) and the
+        estimates of the means (see estimate_means) with a "sampling" entry: the sample size,
+        the dataset size and whether the target precision was reached.
+    """
+    options = options or SamplingOptions.from_config(config) or SamplingOptions()
+    base_dir = Path(base_dir)
+    tests = load_tests(config, base_dir)
+    order = stratified_order(tests, options.stratify_by, options.seed)
+    max_size = min(options.max_size or len(tests), len(tests))
+    strata = {index: stratum(test, options.stratify_by) for index, test in enumerate(tests)}
+    population = defaultdict(int)
+    for key in strata.values():
+        population[key] += 1
+
+    # the test cases are already merged with the default test
+    sample_config = {key: value for key, value in config.items() if key != "defaultTest"}
+    results, estimates, size, precise = [], {}, 0, False
+    while size < max_size:
+        batch = order[
+            size : min(size + (options.batch_size if size else options.initial_size), max_size)
+        ]
+        done = size * len(config.get("prompts") or []) * len(config.get("providers") or [])
+
+        def batch_progress(batch_done: int, batch_total: int, offset=done):
+            if progress:
+                progress(offset + batch_done, offset + batch_total)
+
+        batch_results = run_evaluation(
+            {**sample_config, "tests": [tests[index] for index in batch]},
+            base_dir,
+            progress=batch_progress,
+            **run_options,
+        )
+        results.extend(replace(r, test_index=batch[r.test_index]) for r in batch_results)
+        size += len(batch)
+        estimates = estimate_means(results, strata, population, options.confidence)
+        logger.info(
+            "Sampled {} of {} test cases: {}",
+            size,
+            len(tests),
+            {name: round(estimate["half_width"] or 0, 4) for name, estimate in estimates.items()},
+        )
+        precise = is_precise(estimates, options) and covers_strata(
+            order[:size], strata, population, options.min_stratum_size
+        )
+        if precise:
+            break
+
+    estimates["sampling"] = {"size": size, "dataset_size": len(tests), "precise": precise}
+    return sorted(results, key=lambda r: (r.test_index, r.prompt_index, r.provider)), estimates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("config", help="promptfoo yaml config")
+    parser.add_argument("--output", help="json file receiving the results")
+    parser.add_argument("--target-half-width", type=float, help="overrides the config")
+    parser.add_argument("--no-store", action="store_true", help="recompute every result")
+    parser.add_argument(
+        "--parquet", default=settings.EVALUATION_PARQUET_DIR, help="directory of the runs"
+    )
+    args = parser.parse_args()
+
+    config_path = Path(args.config).resolve()
+    config = load_config(config_path)
+    sampling_options = SamplingOptions.from_config(config) or SamplingOptions()
+    if args.target_half_width is not None:
+        sampling_options.target_half_width = args.target_half_width
+    sampled_results, sampled_estimates = run_sampled_evaluation(
+        config,
+        config_path.parent,
+        sampling_options,
+        store=None if args.no_store else ResultsStore(settings.EVALUATION_RESULTS_DB),
+    )
+    print(json.dumps({"summary": summarize(sampled_results), **sampled_estimates}, indent=2))
+    if args.parquet:
+        ParquetResultsStore(args.parquet).write_run(sampled_results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([asdict(r) for r in sampled_results], f, ensure_ascii=False, indent=2)
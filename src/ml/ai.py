@@ -1,15 +1,124 @@
+import asyncio
+import contextvars
+import copy
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import weakref
+from functools import lru_cache
+
 import instructor
+import openai
 import requests
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError, create_model
+from tenacity import Retrying, retry_if_exception_type, stop_after_attempt
+
+from ml.gateway import get_gateway, unwrap_error
+from ml.memory import ConversationStore
+from ml.passages import reciprocal_rank_fusion, select_passages
+from ml.prompts import (
+    CONVERSATION_SUMMARY,
+    QUERY_DECOMPOSITION,
+    QUERY_REFORMULATION,
+    RAG_ANSWER,
+)
+from ml.retrieval_cache import RetrievalCache
+from ml.router import get_endpoint_name, router
+from ml.tokens import count_message_tokens, fit_passages
+from telemetry import get_current_span, span
+from utils import log_payload, logger, settings, search_client, chat_model_name
+
+# clients whose provider rejected native structured outputs, they use the JSON mode instead
+_structured_output_unsupported = set()
+# parameters of the native structured outputs, named by the errors of the providers rejecting them
+_STRUCTURED_OUTPUT_PARAMS = ("tools", "tool_choice", "strict", "response_format")
+
+
+def get_structured_output_mode(client) -> instructor.Mode:
+    """Returns the instructor mode used for the structured outputs of a client.
+
+    OpenAI and Azure OpenAI support native structured outputs (strict json schema): the model
+    cannot return an invalid response, so instructor does not need validation retries. Other
+    OpenAI compatible servers (ollama, ollamazure...) use the JSON mode.
+    """
+    if settings.LLM_STRUCTURED_OUTPUT_MODE:
+        return instructor.Mode(settings.LLM_STRUCTURED_OUTPUT_MODE)
+    if "openai" in str(getattr(client, "base_url", "")) and (
+        client not in _structured_output_unsupported
+    ):
+        return instructor.Mode.TOOLS_STRICT
+    return instructor.Mode.JSON
+
+
+def rejects_structured_outputs(error: Exception) -> bool:
+    """Returns True if an error is a bad request about the native structured outputs.
+
+    The other bad requests (context length, content filter...) would fail in JSON mode too.
+    """
+    if not isinstance(error, openai.BadRequestError):
+        return False
+    details = " ".join(str(value) for value in (error.param, error.code, error.message) if value)
+    return any(param in details.lower() for param in _STRUCTURED_OUTPUT_PARAMS)
+
+
+def validation_retries(attempts: int = 1) -> Retrying:
+    """Returns the retries of instructor: only invalid responses are asked again.
+
+    With an int, instructor retries every error and wraps the last one in an
+    InstructorRetryException. The errors of the provider must reach the gateway and the router
+    unchanged: they retry and fail over themselves.
+    """
+    return Retrying(
+        stop=stop_after_attempt(attempts),
+        retry=retry_if_exception_type((ValidationError, json.JSONDecodeError)),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_instructor_client(client, mode: instructor.Mode) -> instructor.Instructor:
+    """Returns the instructor client patching `client`, created once per (client, mode)."""
+    return instructor.from_openai(client, mode=mode)
+
+
+_json_schemas = weakref.WeakKeyDictionary()
+
 
-from utils import logger, settings, search_client, chat_client, chat_model_name
+class CachedSchemaModel(BaseModel):
+    """Pydantic model generating its json schema only once.
+
+    instructor sends the json schema of the response model with every request and pydantic does
+    not cache it: for large models, generating it costs far more than validating the answer.
+    """
+
+    @classmethod
+    def model_json_schema(cls, *args, **kwargs) -> dict:
+        schemas = _json_schemas.setdefault(cls, {})
+        key = (args, tuple(sorted(kwargs.items())))
+        if key not in schemas:
+            schemas[key] = super().model_json_schema(*args, **kwargs)
+        # callers such as the strict schema conversion of openai modify the schema in place
+        return copy.deepcopy(schemas[key])
+
+
+@lru_cache(maxsize=256)
+def get_response_model(response_model: type[BaseModel]) -> type[BaseModel]:
+    """Returns `response_model` prepared once for instructor, with a cached json schema.
+
+    The returned class is a subclass of `response_model`, so are the responses.
+    """
+    cached_model = create_model(
+        response_model.__name__,
+        __base__=(response_model, CachedSchemaModel),
+        __doc__=response_model.__doc__,
+    )
+    return instructor.openai_schema(cached_model)
 
 
 def get_completions(
     messages: list,
     stream: bool = False,
     response_model: BaseModel = None,  # Use Instructor library
-    max_tokens: int = 1000,
+    max_tokens: int = None,  # defaults to settings.LLM_MAX_COMPLETION_TOKENS
     temperature: int = 0,
     top_p: int = 1,
     seed: int = 100,
@@ -33,11 +142,10 @@ def get_completions(
     Returns:
         response : str | BaseModel | None :
     """
-    if not client:
-        client = chat_client
+    if max_tokens is None:
+        max_tokens = settings.LLM_MAX_COMPLETION_TOKENS
 
     input_dict = {
-        "model": chat_model_name,
         "messages": messages,
         "max_tokens": max_tokens,
         "temperature": temperature,
@@ -46,19 +154,60 @@ def get_completions(
         "stream": stream,
     }
     if response_model:
-        # if you use local models instead of openai models, the response_model feature may not work
-        client = instructor.from_openai(chat_client, mode=instructor.Mode.JSON)
-        input_dict["response_model"] = response_model
+        input_dict["response_model"] = get_response_model(response_model)
 
     if stream:
         raise NotImplementedError("Stream is not supported right now. Please set stream to False.")
 
-    try:
-        response = client.chat.completions.create(**input_dict)
-    except Exception as e:
-        logger.exception(f"Error in chat GPT: {e}")
-        logger.error("chat GPT response: None")
-        return None
+    def create(llm_client, model_name):
+        if not response_model:
+            return llm_client.chat.completions.create(model=model_name, **input_dict)
+
+        # with local models instead of openai models, the response_model feature may not work
+        mode = get_structured_output_mode(llm_client)
+        try:
+            return get_instructor_client(llm_client, mode).chat.completions.create(
+                model=model_name, max_retries=validation_retries(), **input_dict
+            )
+        except Exception as e:
+            if mode != instructor.Mode.TOOLS_STRICT or not rejects_structured_outputs(
+                unwrap_error(e)
+            ):
+                raise
+            logger.warning(f"{model_name} does not support structured outputs, using JSON mode")
+            _structured_output_unsupported.add(llm_client)
+            return get_instructor_client(llm_client, instructor.Mode.JSON).chat.completions.create(
+                model=model_name, max_retries=validation_retries(), **input_dict
+            )
+
+    prompt_tokens = count_message_tokens(messages)
+    # the answer can use up to max_tokens, charged to the tokens/min budget of the deployment
+    estimated_tokens = prompt_tokens + max_tokens
+    with span("llm.completion", prompt_tokens=prompt_tokens, max_tokens=max_tokens) as current:
+        try:
+            if client:
+                # a client given explicitly is not load balanced, it only goes through its gateway
+                response = get_gateway(get_endpoint_name(client, chat_model_name)).call(
+                    lambda: create(client, chat_model_name), estimated_tokens=estimated_tokens
+                )
+            else:
+                response = router.call(create, estimated_tokens=estimated_tokens)
+        except Exception as e:
+            current.status = f"error: {type(e).__name__}"
+            logger.exception(f"Error in chat GPT: {e}")
+            logger.error("chat GPT response: None")
+            return None
+
+        # instructor returns the pydantic model and keeps the completion in _raw_response
+        usage = getattr(getattr(response, "_raw_response", response), "usage", None)
+        if usage:
+            current.set_attribute("completion_tokens", usage.completion_tokens)
+            logger.info(
+                "Tokens - prompt: {} (estimated {}), completion: {}",
+                usage.prompt_tokens,
+                prompt_tokens,
+                usage.completion_tokens,
+            )
 
     if full_response or response_model:
         return response
@@ -66,47 +215,251 @@ def get_completions(
         return response.choices[0].message.content
 
 
-def get_related_document_ai_search(question):
-    logger.info(f"Azure AI search - find related documents: {question}")
+retrieval_cache = RetrievalCache(
+    max_entries=settings.RAG_CACHE_MAX_ENTRIES,
+    max_chars=settings.RAG_CACHE_MAX_CHARS,
+    ttl=settings.RAG_CACHE_TTL,
+)
+# end time of the last indexer run and when it was checked
+_index_version = {"value": None, "checked": float("-inf")}
+
+
+def get_index_version() -> str | None:
+    """Returns the end time of the last indexer run, checked at most every interval.
+
+    The indexer is also run by other processes (the streamlit pages), its status tells every
+    process that the documents changed.
+    """
+    interval = settings.RAG_CACHE_VERSION_CHECK_INTERVAL
+    if interval is None or not settings.AZURE_SEARCH_INDEXER_NAME:
+        return _index_version["value"]
+    if time.monotonic() - _index_version["checked"] < interval:
+        return _index_version["value"]
+
+    _index_version["checked"] = time.monotonic()
+    try:
+        res = requests.get(
+            url=f"{settings.AZURE_SEARCH_SERVICE_ENDPOINT}/indexers('{settings.AZURE_SEARCH_INDEXER_NAME}')/status",
+            headers={"api-key": settings.AZURE_SEARCH_API_KEY},
+            params={"api-version": "2024-07-01"},
+            timeout=5,
+        )
+        res.raise_for_status()
+        last_result = res.json().get("lastResult") or {}
+        _index_version["value"] = last_result.get("endTime")
+    except (requests.RequestException, ValueError) as e:
+        logger.warning(f"Could not check the indexer status, keeping the retrieval cache: {e}")
+    return _index_version["value"]
+
 
+def reformulate_query(question: str) -> str:
+    """Returns the question rewritten as an affirmative search query."""
     logger.info("Reformulate QUERY")
-    system_prompt = "Tu es un modèle qui a pour fonction de convertir des questions utilisateur en phrase affirmative pour faciliter la recherche par similarité dans une base documentaire vectorielle. Modifiez la phrase utilisateur suivante en ce sens et retirez tout ce qui n'est pas pertinent, comment Bonjour, merci etc. Si c'est dans une autre langue que le Français, traduis la question en Français:"
-
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": "Convertis cette phrase en affirmative " + question},
-    ]
-    new_question = get_completions(
-        messages=messages,
-    )
-    logger.debug(f"{question} ==> {new_question}")
-    content_docs = []
-    results = search_client.search(
-        search_text=new_question,
-        query_type="semantic",
-        query_answer="extractive",
-        semantic_configuration_name=settings.SEMENTIC_CONFIGURATION_NAME,
-        top=settings.AZURE_SEARCH_TOP_K or 2,
-        query_answer_count=settings.AZURE_SEARCH_TOP_K or 2,
-        include_total_count=True,
-        query_caption="extractive|highlight-true",
+    with span("rag.reformulation"):
+        messages = QUERY_REFORMULATION.messages(question=question)
+        new_question = get_completions(
+            messages=messages,
+        )
+    logger.debug("{} ==> {}", question, new_question)
+    return new_question
+
+
+class SubQueries(BaseModel):
+    queries: list[str]
+
+
+def decompose_query(question: str, max_queries: int) -> list[str] | None:
+    """Returns at most `max_queries` simpler search queries covering the parts of a question.
+
+    Returns None if the model failed to decompose the question.
+    """
+    with span("rag.decomposition") as current:
+        sub_queries = get_completions(
+            messages=QUERY_DECOMPOSITION.messages(question=question, max_queries=max_queries),
+            response_model=SubQueries,
+        )
+        if sub_queries is None:
+            return None
+        queries = [query for query in sub_queries.queries if query.strip()][:max_queries]
+        current.set_attribute("sub_queries", len(queries))
+    return queries
+
+
+def search_captions(query: str) -> list[tuple[str, str]]:
+    """Returns the (document title, caption) of the search results of a query, best first."""
+    captions = []
+    with span("rag.search", top_k=settings.AZURE_SEARCH_TOP_K or 2) as current:
+        results = search_client.search(
+            search_text=query,
+            query_type="semantic",
+            query_answer="extractive",
+            semantic_configuration_name=settings.SEMENTIC_CONFIGURATION_NAME,
+            top=settings.AZURE_SEARCH_TOP_K or 2,
+            query_answer_count=settings.AZURE_SEARCH_TOP_K or 2,
+            include_total_count=True,
+            query_caption="extractive|highlight-true",
+        )
+        # the results are fetched while iterating
+        for result in results:
+            for cap in result["@search.captions"]:
+                captions.append((result["title"], cap.text))
+        current.set_attribute("passages", len(captions))
+    return captions
+
+
+async def fan_out_search(question: str, max_sub_queries: int, concurrency: int):
+    """Searches the reformulated question and its sub-queries concurrently.
+
+    The reformulation and the decomposition are requested in parallel, each query is searched
+    as soon as it is known, at most `concurrency` searches at a time.
+
+    Returns:
+        the reformulated question, the captions of its search, and the captions of the search
+        of each sub-query (None if the question could not be decomposed).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def search(query: str) -> list[tuple[str, str]]:
+        async with semaphore:
+            # the search client is synchronous, threads copy the context of the current span
+            return await asyncio.to_thread(search_captions, query)
+
+    async def search_question():
+        new_question = await asyncio.to_thread(reformulate_query, question)
+        captions = await search(new_question)
+        return new_question, captions, time.perf_counter() - start
+
+    async def search_sub_queries():
+        queries = await asyncio.to_thread(decompose_query, question, max_sub_queries)
+        if queries is None:
+            return None
+        return list(await asyncio.gather(*(search(query) for query in queries)))
+
+    start = time.perf_counter()
+    (new_question, captions, question_seconds), sub_captions = await asyncio.gather(
+        search_question(), search_sub_queries()
     )
-    for i, result in enumerate(results):
-        for cap in result["@search.captions"]:
+    # latency added by the sub-queries compared to searching only the question
+    current = get_current_span()
+    if current:
+        current.set_attribute("question_seconds", question_seconds)
+        current.set_attribute(
+            "added_latency_seconds", time.perf_counter() - start - question_seconds
+        )
+    return new_question, captions, sub_captions
+
+
+def run_coroutine(coroutine):
+    """Runs a coroutine to completion from synchronous code, even within a running event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # called by an async route: the loop of the route cannot be reentered
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        context = contextvars.copy_context()
+        return executor.submit(context.run, asyncio.run, coroutine).result()
+
+
+def get_related_passages(question, sub_queries: int = None) -> list[str]:
+    """Returns the passages (search captions) related to a question, most relevant first.
+
+    The passages of recent questions are cached, which also saves the reformulation. They are
+    not cached when the reformulation or the decomposition failed, so that the question is
+    searched again next time.
+
+    Args:
+        question: the question of the user.
+        sub_queries: maximum number of sub-queries searched in addition to the question, whose
+            results are merged by reciprocal rank fusion. 0 searches only the question.
+            Defaults to settings.RAG_FANOUT_QUERIES.
+    """
+    log_payload("Azure AI search - find related documents", question, level="INFO")
+    if sub_queries is None:
+        sub_queries = settings.RAG_FANOUT_QUERIES
+    cache_key = f"{question} [{sub_queries} sub-queries]" if sub_queries else question
+
+    retrieval_cache.set_version(get_index_version())
+    content_docs = retrieval_cache.get(cache_key)
+    current = get_current_span()
+    if current:
+        current.set_attribute("retrieval_cache_hit", content_docs is not None)
+    if content_docs is not None:
+        logger.debug("Retrieval cache hit")
+        return content_docs
+
+    if sub_queries:
+        with span("rag.fanout", max_sub_queries=sub_queries) as current:
+            new_question, captions, sub_captions = run_coroutine(
+                fan_out_search(question, sub_queries, settings.RAG_FANOUT_CONCURRENCY)
+            )
+            complete = new_question is not None and sub_captions is not None
+            sub_captions = sub_captions or []
+            fused = reciprocal_rank_fusion([captions] + sub_captions, k=settings.RAG_RRF_K)
+            # recall gain: passages the question alone would have missed
+            current.set_attribute("sub_queries", len(sub_captions))
+            current.set_attribute("question_passages", len(set(captions)))
+            current.set_attribute("added_passages", len(set(fused) - set(captions)))
+        captions = fused
+    else:
+        new_question = reformulate_query(question)
+        captions = search_captions(new_question)
+        complete = new_question is not None
+
+    with span("rag.passage_selection") as current:
+        selected = select_passages(
+            new_question,
+            [text for _, text in captions],
+            dedupe_threshold=settings.RAG_DEDUPE_THRESHOLD,
+            rerank_passages=settings.RAG_RERANK,
+            max_chars=settings.RAG_CONTEXT_MAX_CHARS,
+        )
+        # documents are numbered in their ranking order
+        numbers = {}
+        for title, _ in captions:
+            numbers.setdefault(title, len(numbers) + 1)
+        content_docs = []
+        for title, text in (captions[j] for j in selected):
             # data = f"Document {i + 1}: {cap.text} \nRéférence: {result['filename']}\n==="
-            data = f"Numéro document: {i + 1} - nom document:{result['title']}  - text:{cap.text} \n==="
+            data = f"Numéro document: {numbers[title]} - nom document:{title}  - text:{text} \n==="
             content_docs.append(data)
-    context = "\n".join(content_docs)
-    return context
+        current.set_attribute("passages", len(content_docs))
+        current.set_attribute("dropped_passages", len(captions) - len(content_docs))
+    if complete:
+        retrieval_cache.put(cache_key, content_docs)
+    return content_docs
+
+
+def get_related_document_ai_search(question, sub_queries: int = None):
+    return "\n".join(get_related_passages(question, sub_queries))
 
 
-def get_rag_response(user_input):
+def summarize_conversation(summary: str, messages: list[dict]) -> str:
+    """Returns the summary of a conversation updated with the messages that left its window."""
+    transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    new_summary = get_completions(
+        messages=CONVERSATION_SUMMARY.messages(summary=summary or "-", messages=transcript),
+        max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+    )
+    # if the model failed, the previous summary is kept
+    return new_summary if new_summary is not None else summary
+
+
+conversation_store = ConversationStore(
+    summarize=summarize_conversation,
+    window_tokens=settings.CONVERSATION_WINDOW_TOKENS,
+    max_conversations=settings.CONVERSATION_MAX_CONVERSATIONS,
+    db_path=settings.CONVERSATION_DB_PATH,
+)
+
+
+def get_rag_response(user_input, conversation_id: str = None):
     """Return the response after running RAG.
 
     Args:
-        user_input:
-        settings:
-        conversation_id:
+        user_input: the question of the user.
+        conversation_id: the conversation of the question. Its summary and recent messages are
+            sent with the question, and the question and the response are added to it.
 
     Returns:
         response:
@@ -114,19 +467,35 @@ def get_rag_response(user_input):
     """
     logger.info(f"Running RAG")
 
-    context = get_related_document_ai_search(user_input)
-    formatted_user_input = f"question :{user_input}, \n\n contexte : \n{context}."
-    logger.info(f"RAG - final formatted prompt: {formatted_user_input}")
-
-    response = get_completions(
-        messages=[
-            {
-                "role": "system",
-                "content": "Tu est un chatbot qui répond aux questions.",
-            },
-            {"role": "user", "content": formatted_user_input},
-        ],
-    )
+    with span("rag"):
+        passages = get_related_passages(user_input)
+
+        with span("rag.prompt_build") as current:
+            history = conversation_store.get(conversation_id).history() if conversation_id else []
+            # tokens left for the context once the rest of the prompt and the answer are accounted for
+            budget = (
+                settings.LLM_CONTEXT_WINDOW
+                - settings.LLM_MAX_COMPLETION_TOKENS
+                - count_message_tokens(
+                    RAG_ANSWER.messages(history=history, question=user_input, context="")
+                )
+            )
+            if settings.RAG_CONTEXT_MAX_TOKENS:
+                budget = min(budget, settings.RAG_CONTEXT_MAX_TOKENS)
+            selected = fit_passages(passages, budget)
+            context = "\n".join(selected)
+
+            messages = RAG_ANSWER.messages(history=history, question=user_input, context=context)
+            current.set_attribute("passages", len(selected))
+            current.set_attribute("history_messages", len(history))
+            current.set_attribute("context_budget", budget)
+        log_payload("RAG - final formatted prompt", messages[-1]["content"])
+
+        response = get_completions(messages=messages)
+
+        if conversation_id and response is not None:
+            with span("rag.memory_update"):
+                conversation_store.add_turn(conversation_id, user_input, response)
     return response
 
 
@@ -145,6 +514,8 @@ def run_azure_ai_search_indexer():
 
     res = requests.post(url=url, headers=headers, params=params)
     logger.debug(f"run_azure_ai_search_index response: {res.status_code}")
+    # the documents changed, the other processes see it with the indexer status
+    retrieval_cache.clear()
     return res
 
 
@@ -0,0 +1,66 @@
+import asyncio
+from typing import AsyncIterator
+
+from pydantic import BaseModel
+
+from ml.ai import get_completions
+from ml.prompts import JSON_EXTRACTION
+from telemetry import span
+
+
+def extract_document(document: str, response_model: type[BaseModel]) -> dict | None:
+    """Returns the fields of `response_model` extracted from a document, None if the call failed."""
+    with span("extraction.document", characters=len(document)):
+        answer = get_completions(
+            messages=JSON_EXTRACTION.messages(document=document), response_model=response_model
+        )
+    return answer.model_dump() if answer is not None else None
+
+
+async def extract_documents(
+    documents: list[str], response_model: type[BaseModel], concurrency: int = 8
+) -> AsyncIterator[dict]:
+    """Extracts the same fields from each document, yielding the results as they complete.
+
+    One structured output call is made per document, with the same response model. At most
+    `concurrency` calls run at a time and the next document is only submitted when a result has
+    been consumed, so a slow consumer (e.g. a streamed response) slows the extraction down
+    instead of accumulating results in memory.
+
+    Args:
+        documents: the texts of the documents.
+        response_model: the fields to extract, e.g. built by `create_dynamic_model` from
+            {field: question describing the field} as in the json extraction dataset.
+        concurrency: maximum number of concurrent calls.
+
+    Yields:
+        {"index": position of the document, "fields": {field: answer}}, or
+        {"index": ..., "error": ...} if the extraction failed.
+    """
+    pending = {}
+    documents = iter(enumerate(documents))
+    try:
+        while True:
+            for index, document in documents:
+                # the completion client is synchronous, the calls run in threads
+                task = asyncio.create_task(
+                    asyncio.to_thread(extract_document, document, response_model)
+                )
+                pending[task] = index
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = pending.pop(task)
+                answer = task.result() if task.exception() is None else None
+                if answer is None:
+                    yield {"index": index, "error": "the extraction failed"}
+                else:
+                    yield {"index": index, "fields": answer}
+    finally:
+        # the consumer stopped early (e.g. the client disconnected)
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,247 @@
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import openai
+from instructor.exceptions import InstructorRetryException
+
+from utils import logger, settings
+
+# errors worth retrying: throttling, timeouts, connection resets and server side failures
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,  # includes openai.APITimeoutError
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously up to `per_minute` units per minute.
+
+    Callers reserve units up front and sleep for the returned delay. The balance may go negative, so
+    reservations are served in arrival order instead of letting late callers overtake waiting ones.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Reserves `amount` units and returns the number of seconds to wait before using them."""
+        with self.lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float):
+        """Gives back units that were reserved but not consumed (e.g. overestimated tokens)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AIMDLimiter:
+    """Adaptive concurrency limit with a FIFO queue of waiting callers.
+
+    The limit grows additively (about +1 per `limit` successful calls) and is cut multiplicatively
+    when the provider throttles us, like TCP congestion control.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        decrease_factor: float = 0.5,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.decrease_factor = decrease_factor
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.waiters = deque()
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            ticket = object()
+            self.waiters.append(ticket)
+            while self.waiters[0] is not ticket or self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.waiters.popleft()
+            self.in_flight += 1
+            self.condition.notify_all()
+
+    def release(self, throttled: bool = False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+def unwrap_error(error: Exception) -> Exception:
+    """Returns the error raised by the provider when instructor wrapped it.
+
+    instructor raises an InstructorRetryException holding the error of its last attempt (a
+    validation error or an error of the provider) when its retries failed.
+    """
+    while isinstance(error, InstructorRetryException) and error.args:
+        if not isinstance(error.args[0], Exception):
+            break
+        error = error.args[0]
+    return error
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """Returns the delay requested by the provider through the Retry-After headers, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    # non-standard header sent by OpenAI and Azure OpenAI, more precise than retry-after
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+
+    if "retry-after" in headers:
+        value = headers["retry-after"]
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter: a random delay in [0, min(cap, base * 2**attempt)]."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def get_usage_tokens(response) -> int | None:
+    """Returns the total tokens reported by the provider for a (possibly instructor) response."""
+    # instructor returns the pydantic model and keeps the completion in _raw_response
+    raw_response = getattr(response, "_raw_response", response)
+    usage = getattr(raw_response, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+class DeploymentGateway:
+    """Rate limits, adaptive concurrency and retries for the calls made to one deployment."""
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        max_concurrency: int = 16,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        max_retry_after: float = 60.0,
+    ):
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.limiter = AIMDLimiter(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+
+    def _wait_for_budget(self, estimated_tokens: int):
+        delay = 0.0
+        if self.request_bucket:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket and estimated_tokens:
+            delay = max(delay, self.token_bucket.reserve(estimated_tokens))
+        if delay > 0:
+            logger.debug(f"Gateway {self.name}: rate limit reached, waiting {delay:.2f}s")
+            time.sleep(delay)
+
+    def call(self, fn, estimated_tokens: int = 0, max_retries: int = None):
+        """Calls `fn` once the deployment has capacity, retrying on retryable errors.
+
+        Args:
+            fn: function without arguments sending the request to the provider.
+            estimated_tokens: prompt + completion tokens expected, charged to the tokens/min bucket.
+            max_retries: overrides the number of retries of the gateway for this call.
+
+        Returns:
+            The value returned by `fn`.
+
+        Raises:
+            The last error raised by `fn` if it is not retryable or if all the retries failed.
+            The errors are classified on the provider error wrapped by instructor, if any.
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+
+        for attempt in range(max_retries + 1):
+            self._wait_for_budget(estimated_tokens)
+            self.limiter.acquire()
+            throttled = False
+            try:
+                response = fn()
+            except Exception as e:
+                error = unwrap_error(e)
+                if not isinstance(error, RETRYABLE_ERRORS):
+                    raise
+                throttled = isinstance(error, openai.RateLimitError)
+                if self.token_bucket and estimated_tokens:
+                    self.token_bucket.refund(estimated_tokens)
+                if attempt == max_retries:
+                    raise
+                delay = retry_after_seconds(error)
+                if delay is None:
+                    delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                # a misbehaving provider must not block the caller for hours
+                delay = min(delay, self.max_retry_after)
+                logger.warning(
+                    f"Gateway {self.name}: {type(error).__name__} on attempt {attempt + 1}/"
+                    f"{max_retries + 1}, retrying in {delay:.2f}s"
+                )
+            else:
+                used_tokens = get_usage_tokens(response)
+                if self.token_bucket and used_tokens is not None and used_tokens < estimated_tokens:
+                    self.token_bucket.refund(estimated_tokens - used_tokens)
+                return response
+            finally:
+                self.limiter.release(throttled)
+            time.sleep(delay)
+
+
+_gateways: dict[str, DeploymentGateway] = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(deployment: str) -> DeploymentGateway:
+    """Returns the gateway of a deployment, created from the settings on first use."""
+    with _gateways_lock:
+        if deployment not in _gateways:
+            _gateways[deployment] = DeploymentGateway(
+                name=deployment,
+                requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+                tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+                max_concurrency=settings.LLM_MAX_CONCURRENCY,
+                max_retries=settings.LLM_MAX_RETRIES,
+                max_retry_after=settings.LLM_MAX_RETRY_AFTER,
+            )
+        return _gateways[deployment]
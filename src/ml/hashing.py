@@ -0,0 +1,29 @@
+"""Hashes and hashed vectors of texts, deterministic across processes and without a model.
+
+They are used by the passage selection (near-duplicates, rerank) and by the embeddings of the
+local provider.
+"""
+
+import hashlib
+import re
+
+import numpy as np
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def stable_hash(text: str) -> int:
+    """Returns a 64 bits hash of a text, unlike hash() identical across processes."""
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+def hashed_embedding(text: str, dimensions: int = 384) -> np.ndarray:
+    """Returns the L2 normalized hashed bag of words (words and word bigrams) vector of a text."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    words = _WORD_PATTERN.findall(text.lower())
+    for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        h = stable_hash(feature)
+        # the sign bit keeps the expected dot product of unrelated features at 0
+        vector[h % dimensions] += 1.0 if h >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
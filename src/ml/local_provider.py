@@ -0,0 +1,200 @@
+"""Local model provider answering OpenAI API requests in process, without network.
+
+The provider is an httpx transport given to the OpenAI and langchain clients, so the whole client
+stack (instructor, gateway, router, ragas) runs as with a real provider. It serves:
+    - chat completions: a scripted answer chosen by hashing the prompt, or the echo of the last
+      message. Tool calls and prompts containing a json schema (instructor, ragas) get an object
+      filled from the schema.
+    - embeddings: deterministic hashed bag of words vectors, close for texts sharing words.
+    - the list of models, used by the health checks.
+"""
+
+import ast
+import asyncio
+import base64
+import json
+import re
+import time
+import uuid
+
+import httpx
+import numpy as np
+
+from ml.hashing import hashed_embedding, stable_hash
+
+LOCAL_BASE_URL = "http://local-llm/v1"
+LOCAL_API_KEY = "local"
+
+
+def fill_json_schema(schema: dict, definitions: dict = None):
+    """Returns a value valid for a json schema: empty strings and lists, zeros, False..."""
+    definitions = definitions if definitions is not None else schema.get("$defs", {})
+    if "$ref" in schema:
+        return fill_json_schema(definitions[schema["$ref"].split("/")[-1]], definitions)
+    for combination in ("anyOf", "oneOf", "allOf"):
+        if combination in schema:
+            return fill_json_schema(schema[combination][0], definitions)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if schema.get("default") is not None:
+        return schema["default"]
+
+    schema_type = schema.get("type", "object")
+    if isinstance(schema_type, list):
+        schema_type = schema_type[0]
+    if schema_type == "object":
+        return {
+            name: fill_json_schema(property_schema, definitions)
+            for name, property_schema in schema.get("properties", {}).items()
+        }
+    return {"string": "", "integer": 0, "number": 0.0, "boolean": False, "array": []}.get(
+        schema_type
+    )
+
+
+def _find_json_schema(text: str) -> dict | None:
+    """Returns the first json schema of a text, written as json (instructor) or as a dict (ragas)."""
+    if "properties" not in text:
+        return None
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"\{", text):
+        start = match.start()
+        try:
+            value, _ = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            # python repr of a dict: evaluate up to the matching closing brace
+            depth = 0
+            value = None
+            for end in range(start, len(text)):
+                depth += {"{": 1, "}": -1}.get(text[end], 0)
+                if depth == 0:
+                    try:
+                        value = ast.literal_eval(text[start : end + 1])
+                    except (ValueError, SyntaxError):
+                        pass
+                    break
+        if isinstance(value, dict) and "properties" in value:
+            return value
+    return None
+
+
+class LocalTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """httpx transport implementing the OpenAI chat completions, embeddings and models routes.
+
+    Args:
+        model_name: the name of the model returned by the models route.
+        latency: simulated seconds per request.
+        responses: scripted answers, the answer of a prompt is chosen by hashing it. Without
+            responses, the last message is echoed.
+        embedding_dimensions: the size of the embeddings.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "local",
+        latency: float = 0.0,
+        responses: list[str] = None,
+        embedding_dimensions: int = 384,
+    ):
+        self.model_name = model_name
+        self.latency = latency
+        self.responses = responses or []
+        self.embedding_dimensions = embedding_dimensions
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(request, request.read())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(request, await request.aread())
+
+    def _respond(self, request: httpx.Request, content: bytes) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/chat/completions"):
+            return httpx.Response(200, json=self.chat_completion(json.loads(content)))
+        if path.endswith("/embeddings"):
+            return httpx.Response(200, json=self.embeddings(json.loads(content)))
+        if path.endswith("/models"):
+            data = [{"id": self.model_name, "object": "model", "created": 0, "owned_by": "local"}]
+            return httpx.Response(200, json={"object": "list", "data": data})
+        return httpx.Response(404, json={"error": {"message": f"Unknown route {path}"}})
+
+    def complete(self, messages: list[dict]) -> str:
+        """Returns the scripted answer of the prompt, or the content of the last message."""
+        if self.responses:
+            prompt = json.dumps(messages, sort_keys=True, ensure_ascii=False)
+            return self.responses[stable_hash(prompt) % len(self.responses)]
+        content = messages[-1].get("content") if messages else ""
+        return content if isinstance(content, str) else json.dumps(content, ensure_ascii=False)
+
+    def chat_completion(self, body: dict) -> dict:
+        messages = body.get("messages", [])
+        message = {"role": "assistant", "content": None}
+        finish_reason = "stop"
+
+        tools = body.get("tools")
+        response_format = body.get("response_format") or {}
+        if tools:
+            function = tools[0]["function"]
+            arguments = fill_json_schema(function.get("parameters", {}))
+            message["tool_calls"] = [
+                {
+                    "id": f"call_{uuid.uuid4().hex}",
+                    "type": "function",
+                    "function": {"name": function["name"], "arguments": json.dumps(arguments)},
+                }
+            ]
+            finish_reason = "tool_calls"
+        elif self.responses:
+            message["content"] = self.complete(messages)
+        else:
+            # instructor json mode and ragas put the json schema of the answer in the prompt
+            schema = response_format.get("json_schema", {}).get("schema") or _find_json_schema(
+                " ".join(str(m.get("content", "")) for m in messages)
+            )
+            if schema:
+                message["content"] = json.dumps(fill_json_schema(schema))
+            elif response_format.get("type") in ("json_object", "json_schema"):
+                message["content"] = "{}"
+            else:
+                message["content"] = self.complete(messages)
+
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 + 1 for m in messages)
+        completion_tokens = len(str(message["content"] or message.get("tool_calls"))) // 4 + 1
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", self.model_name),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def embeddings(self, body: dict) -> dict:
+        inputs = body["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            vector = hashed_embedding(
+                str(text), body.get("dimensions") or self.embedding_dimensions
+            )
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype(np.float32).tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        num_tokens = sum(len(str(text)) // 4 + 1 for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", self.model_name),
+            "usage": {"prompt_tokens": num_tokens, "total_tokens": num_tokens},
+        }
@@ -0,0 +1,150 @@
+import json
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable
+
+from ml.tokens import count_message_tokens
+from utils import logger
+
+
+@dataclass
+class Conversation:
+    """The summary of the old messages of a conversation and the window of its recent messages."""
+
+    id: str
+    summary: str = ""
+    messages: list[dict] = field(default_factory=list)
+    updated: float = field(default_factory=time.time)
+
+    def history(self) -> list[dict]:
+        """Returns the chat messages to put before the new question: summary, then recent messages."""
+        history = []
+        if self.summary:
+            history.append(
+                {"role": "system", "content": f"Résumé de la conversation : {self.summary}"}
+            )
+        return history + self.messages
+
+    def to_dict(self) -> dict:
+        return {"conversation_id": self.id, "summary": self.summary, "messages": self.messages}
+
+
+class ConversationStore:
+    """Conversations kept in an LRU cache, optionally persisted in SQLite.
+
+    The messages of a conversation are kept while they fit in `window_tokens` tokens. The oldest
+    ones are then merged into the summary of the conversation, so the size of the history sent to
+    the model stays bounded however long the conversation is.
+
+    Args:
+        summarize: function(summary, messages) returning the summary updated with the messages.
+        window_tokens: maximum tokens of the recent messages.
+        max_conversations: maximum conversations in memory, the least recently used are evicted.
+        db_path: SQLite database persisting the conversations, None to keep them only in memory.
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[str, list[dict]], str],
+        window_tokens: int = 1000,
+        max_conversations: int = 1000,
+        db_path: str = None,
+    ):
+        self.summarize = summarize
+        self.window_tokens = window_tokens
+        self.max_conversations = max_conversations
+        self.conversations: OrderedDict[str, Conversation] = OrderedDict()
+        self.lock = threading.RLock()
+        # a turn is added under the lock of its conversation, kept while a thread holds it
+        self.conversation_locks: weakref.WeakValueDictionary[str, threading.Lock] = (
+            weakref.WeakValueDictionary()
+        )
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations "
+                "(id TEXT PRIMARY KEY, summary TEXT, messages TEXT, updated REAL)"
+            )
+            self.db.commit()
+
+    def _load(self, conversation_id: str) -> Conversation | None:
+        if not self.db:
+            return None
+        row = self.db.execute(
+            "SELECT summary, messages, updated FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return Conversation(conversation_id, row[0], json.loads(row[1]), row[2])
+
+    def _cache(self, conversation: Conversation):
+        self.conversations[conversation.id] = conversation
+        self.conversations.move_to_end(conversation.id)
+        while len(self.conversations) > self.max_conversations:
+            self.conversations.popitem(last=False)
+
+    def find(self, conversation_id: str) -> Conversation | None:
+        """Returns a conversation, or None if it does not exist."""
+        with self.lock:
+            conversation = self.conversations.get(conversation_id) or self._load(conversation_id)
+            if conversation:
+                self._cache(conversation)
+            return conversation
+
+    def get(self, conversation_id: str) -> Conversation:
+        """Returns a conversation, created empty if it does not exist."""
+        with self.lock:
+            return self.find(conversation_id) or Conversation(conversation_id)
+
+    def save(self, conversation: Conversation):
+        with self.lock:
+            conversation.updated = time.time()
+            self._cache(conversation)
+            if self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?)",
+                    (
+                        conversation.id,
+                        conversation.summary,
+                        json.dumps(conversation.messages, ensure_ascii=False),
+                        conversation.updated,
+                    ),
+                )
+                self.db.commit()
+
+    def _conversation_lock(self, conversation_id: str) -> threading.Lock:
+        with self.lock:
+            lock = self.conversation_locks.get(conversation_id)
+            if lock is None:
+                lock = self.conversation_locks[conversation_id] = threading.Lock()
+            return lock
+
+    def add_turn(self, conversation_id: str, question: str, answer: str) -> Conversation:
+        """Adds a question and its answer, then summarizes the messages out of the window.
+
+        The turns of a conversation are added one at a time, summary included, so that concurrent
+        turns are not lost. The other conversations are not blocked while the model summarizes.
+        """
+        with self._conversation_lock(conversation_id):
+            conversation = self.get(conversation_id)
+            conversation.messages.append({"role": "user", "content": question})
+            conversation.messages.append({"role": "assistant", "content": answer})
+
+            evicted = []
+            while conversation.messages and (
+                count_message_tokens(conversation.messages) > self.window_tokens
+            ):
+                evicted.append(conversation.messages.pop(0))
+
+            if evicted:
+                logger.debug(
+                    "Conversation {}: summarizing {} messages", conversation_id, len(evicted)
+                )
+                conversation.summary = self.summarize(conversation.summary, evicted)
+            self.save(conversation)
+        return conversation
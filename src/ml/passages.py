@@ -0,0 +1,129 @@
+"""Post-retrieval stage: removes the near-duplicate passages, reranks them and caps their size.
+
+The search returns one caption per document, and documents often share paragraphs (versions of
+the same file, headers, legal notices...). Sending them twice costs prompt tokens and generation
+time without adding information.
+"""
+
+import re
+
+import numpy as np
+
+from ml.hashing import hashed_embedding, stable_hash
+from utils import logger
+
+_WORD_PATTERN = re.compile(r"\w+")
+# largest prime below 2**32: hashes and coefficients are reduced to 32 bits, a * x + b fits in 64
+_PRIME = (1 << 32) - 5
+
+
+def shingles(text: str, size: int = 5) -> set[int]:
+    """Returns the hashes of the sequences of `size` words of a text (all its words if shorter)."""
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {stable_hash(" ".join(words))}
+    return {stable_hash(" ".join(words[i : i + size])) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    """Computes MinHash signatures, whose agreement estimates the Jaccard similarity of shingles.
+
+    Args:
+        num_permutations: size of the signatures, the error of the estimate is ~1/sqrt(size).
+        seed: seed of the hash functions, signatures are comparable only with the same seed.
+    """
+
+    def __init__(self, num_permutations: int = 64, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, num_permutations, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, num_permutations, dtype=np.uint64)
+
+    def signature(self, hashes: set[int]) -> np.ndarray:
+        x = np.fromiter((h & 0xFFFFFFFF for h in hashes), dtype=np.uint64, count=len(hashes))
+        return ((np.outer(x, self.a) + self.b) % np.uint64(_PRIME)).min(axis=0)
+
+
+def deduplicate(texts: list[str], threshold: float = 0.8, hasher: MinHasher = None) -> list[int]:
+    """Returns the indices of the texts to keep: the first of each group of near-duplicates.
+
+    Args:
+        texts: the texts, most relevant first.
+        threshold: estimated Jaccard similarity of the shingles above which two texts are
+            near-duplicates.
+        hasher: the MinHash functions, 64 permutations by default.
+    """
+    hasher = hasher or MinHasher()
+    kept = []
+    signatures = np.empty((0, len(hasher.a)), dtype=np.uint64)
+    for i, text in enumerate(texts):
+        signature = hasher.signature(shingles(text))
+        if len(kept) and (signatures == signature).mean(axis=1).max() >= threshold:
+            continue
+        kept.append(i)
+        signatures = np.vstack([signatures, signature])
+    return kept
+
+
+def rerank(query: str, texts: list[str]) -> list[int]:
+    """Returns the indices of the texts by decreasing cosine similarity with the query.
+
+    The hashed bag of words embeddings are computed locally, without a model call. The sort is
+    stable: the search ranking breaks the ties.
+    """
+    query_embedding = hashed_embedding(query)
+    scores = [float(np.dot(query_embedding, hashed_embedding(text))) for text in texts]
+    return sorted(range(len(texts)), key=lambda i: -scores[i])
+
+
+def reciprocal_rank_fusion(rankings: list[list], k: int = 60) -> list:
+    """Merges rankings into one, by decreasing sum of 1 / (k + rank) over the rankings.
+
+    Items are compared by equality, an item found by several rankings appears once. The fusion
+    only uses the ranks, the scores of different queries not being comparable.
+
+    Args:
+        rankings: lists of hashable items, best first.
+        k: smoothing constant, larger values reduce the weight of the first ranks.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(dict.fromkeys(ranking), start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    # dicts keep the insertion order, ties stay in the order of the first ranking
+    return sorted(scores, key=lambda item: -scores[item])
+
+
+def select_passages(
+    query: str,
+    texts: list[str],
+    dedupe_threshold: float | None = 0.8,
+    rerank_passages: bool = False,
+    max_chars: int | None = None,
+) -> list[int]:
+    """Returns the indices of the retrieved texts to send to the model, in their final order.
+
+    Args:
+        query: the search query.
+        texts: the retrieved texts, in the search ranking order.
+        dedupe_threshold: similarity above which a text is dropped as a near-duplicate of a
+            better ranked one, None to keep the duplicates.
+        rerank_passages: whether to reorder the texts by similarity with the query.
+        max_chars: maximum total characters of the texts, the following ones are dropped (the
+            first one is always kept). None for no limit.
+    """
+    indices = list(range(len(texts)))
+    if dedupe_threshold is not None:
+        indices = deduplicate(texts, dedupe_threshold)
+    if rerank_passages:
+        indices = [indices[i] for i in rerank(query, [texts[i] for i in indices])]
+    if max_chars is not None:
+        selected = []
+        chars = 0
+        for i in indices:
+            chars += len(texts[i])
+            if chars > max_chars and selected:
+                break
+            selected.append(i)
+        indices = selected
+    logger.debug("Kept {}/{} retrieved passages", len(indices), len(texts))
+    return indices
@@ -0,0 +1,116 @@
+from string import Formatter
+
+
+class PromptTemplate:
+    """Chat prompt made of static instructions and a user message template.
+
+    The system message never contains variables and always comes first, and the variable parts
+    (question, retrieved context) come last in the user message. Requests then share the longest
+    possible identical prefix, which is what provider-side prompt caching reuses.
+
+    The user template uses the `str.format` syntax. It is parsed once when the template is created,
+    formatting only joins the literal parts with the values.
+    """
+
+    def __init__(self, name: str, system: str, user: str):
+        self.name = name
+        self.system = system
+        # [(literal text, variable name or None), ...]
+        self._parts = [
+            (literal, field_name) for literal, field_name, _, _ in Formatter().parse(user)
+        ]
+        self.variables = tuple(field_name for _, field_name in self._parts if field_name)
+
+    def format_user(self, **variables) -> str:
+        """Returns the user message with the given variables."""
+        chunks = []
+        for literal, field_name in self._parts:
+            chunks.append(literal)
+            if field_name:
+                chunks.append(str(variables[field_name]))
+        return "".join(chunks)
+
+    def messages(self, history: list[dict] = None, **variables) -> list[dict]:
+        """Returns the chat messages: static system message, conversation history, user message."""
+        return [
+            {"role": "system", "content": self.system},
+            *(history or []),
+            {"role": "user", "content": self.format_user(**variables)},
+        ]
+
+
+PROMPTS: dict[str, PromptTemplate] = {}
+
+
+def register_prompt(template: PromptTemplate) -> PromptTemplate:
+    if template.name in PROMPTS:
+        raise ValueError(f"Prompt {template.name} is already registered.")
+    PROMPTS[template.name] = template
+    return template
+
+
+def get_prompt(name: str) -> PromptTemplate:
+    try:
+        return PROMPTS[name]
+    except KeyError:
+        raise ValueError(f"Unknown prompt: {name}. Registered prompts: {list(PROMPTS)}")
+
+
+QUERY_REFORMULATION = register_prompt(
+    PromptTemplate(
+        name="query_reformulation",
+        system=(
+            "Tu es un modèle qui a pour fonction de convertir des questions utilisateur en phrase "
+            "affirmative pour faciliter la recherche par similarité dans une base documentaire "
+            "vectorielle. Modifiez la phrase utilisateur suivante en ce sens et retirez tout ce qui "
+            "n'est pas pertinent, comment Bonjour, merci etc. Si c'est dans une autre langue que le "
+            "Français, traduis la question en Français:"
+        ),
+        user="Convertis cette phrase en affirmative {question}",
+    )
+)
+
+QUERY_DECOMPOSITION = register_prompt(
+    PromptTemplate(
+        name="query_decomposition",
+        system=(
+            "Tu décomposes des questions utilisateur en requêtes de recherche plus simples pour une "
+            "base documentaire. Chaque requête est une phrase affirmative en Français qui porte sur "
+            "un seul aspect de la question. N'invente pas d'aspect absent de la question; une "
+            "question simple donne une seule requête."
+        ),
+        user="Donne au plus {max_queries} requêtes pour cette question : {question}",
+    )
+)
+
+RAG_ANSWER = register_prompt(
+    PromptTemplate(
+        name="rag_answer",
+        system="Tu est un chatbot qui répond aux questions.",
+        user="question :{question}, \n\n contexte : \n{context}.",
+    )
+)
+
+JSON_EXTRACTION = register_prompt(
+    PromptTemplate(
+        name="json_extraction",
+        system=(
+            "Tu extrais des informations de documents. Pour chaque champ demandé, réponds à la "
+            "question décrivant le champ en utilisant uniquement le document. Si le document ne "
+            "contient pas l'information, laisse le champ vide."
+        ),
+        user="Document :\n{document}",
+    )
+)
+
+CONVERSATION_SUMMARY = register_prompt(
+    PromptTemplate(
+        name="conversation_summary",
+        system=(
+            "Tu résumes des conversations entre un utilisateur et un chatbot. Mets à jour le résumé "
+            "avec les nouveaux messages en gardant les faits, les questions et les réponses utiles "
+            "pour la suite de la conversation. Réponds uniquement avec le résumé, en quelques phrases."
+        ),
+        user="Résumé actuel :\n{summary}\n\nNouveaux messages :\n{messages}",
+    )
+)
@@ -0,0 +1,89 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Returns the cache key of a question: same unicode form, case and spaces.
+
+    The punctuation is kept, it can change the question: "C++" and "C" have different keys.
+
+    Example:
+        "  Quels sont les HORAIRES ?" and "quels sont  les horaires ?" have the same key.
+    """
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return _SPACES.sub(" ", query).strip()
+
+
+class RetrievalCache:
+    """LRU cache of the passages retrieved for a question, with a time to live and memory bounds.
+
+    The cache is tied to a version of the search index: when the version changes (new documents
+    were indexed), all the entries are dropped.
+
+    Args:
+        max_entries: maximum number of questions, 0 disables the cache.
+        max_chars: maximum total characters of the cached passages.
+        ttl: seconds an entry stays valid.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_chars: int = 10_000_000, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, list[str], int]] = OrderedDict()
+        self.chars = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _remove(self, key: str):
+        _, _, size = self.entries.pop(key)
+        self.chars -= size
+
+    def get(self, query: str) -> list[str] | None:
+        """Returns the cached passages of a question, or None."""
+        key = normalize_query(query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, query: str, passages: list[str]):
+        size = sum(len(passage) for passage in passages)
+        if not self.max_entries or size > self.max_chars:
+            return
+        key = normalize_query(query)
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, list(passages), size)
+            self.chars += size
+            while len(self.entries) > self.max_entries or self.chars > self.max_chars:
+                self._remove(next(iter(self.entries)))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.chars = 0
+
+    def set_version(self, version):
+        """Drops all the entries if the index version changed."""
+        with self.lock:
+            if version == self.version:
+                return
+            self.version = version
+            self.entries.clear()
+            self.chars = 0
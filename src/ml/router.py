@@ -0,0 +1,241 @@
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+
+import openai
+
+from ml.gateway import get_gateway, unwrap_error
+from settings import RoutingStrategyEnum
+from utils import chat_client, chat_model_name, get_llm_deployment_clients, logger, settings
+
+# errors caused by the request itself: every deployment would reject it, so there is no failover
+NON_FAILOVER_ERRORS = (openai.BadRequestError, openai.UnprocessableEntityError)
+
+
+class NoHealthyEndpointError(Exception):
+    pass
+
+
+def get_endpoint_name(client, model_name: str) -> str:
+    """Returns the name identifying a deployment, also used as the key of its gateway."""
+    # the same model can be deployed in several regions, the url makes the name unique
+    return f"{model_name}@{getattr(client, 'base_url', '')}"
+
+
+class CircuitBreaker:
+    """Skips an endpoint after `failure_threshold` consecutive failures.
+
+    Once opened, the circuit stays open for `cooldown` seconds, then lets a single trial request
+    through (half-open). The circuit is closed again if that request succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def is_available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def allow_request(self) -> bool:
+        """Returns whether a request can be sent, reserving the trial request if half-open."""
+        with self.lock:
+            if not self.is_available():
+                return False
+            if self.state == "half_open":
+                self.trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        """Ends a request that tells nothing about the health of the endpoint (e.g. invalid)."""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+@dataclass
+class Endpoint:
+    """A deployment the router can send requests to."""
+
+    client: object
+    model_name: str
+    priority: int = 0
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    outstanding: int = 0
+    latency_ewma: float | None = None  # seconds, exponentially weighted moving average
+
+    @property
+    def name(self) -> str:
+        return get_endpoint_name(self.client, self.model_name)
+
+
+class Router:
+    """Load balances requests over several deployments with circuit breakers and failover.
+
+    Endpoints are tried by increasing priority. Among the available endpoints of the lowest
+    priority, the strategy picks either the one with the fewest outstanding requests or a random
+    one weighted by the inverse of its latency. If the call fails, the next endpoint is tried.
+    """
+
+    def __init__(
+        self,
+        endpoints: list[Endpoint],
+        strategy: RoutingStrategyEnum = RoutingStrategyEnum.least_outstanding,
+        latency_alpha: float = 0.2,
+    ):
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.latency_alpha = latency_alpha
+        self.lock = threading.Lock()
+
+    def _pick(self, candidates: list[Endpoint]) -> Endpoint:
+        best_priority = min(endpoint.priority for endpoint in candidates)
+        candidates = [endpoint for endpoint in candidates if endpoint.priority == best_priority]
+        random.shuffle(candidates)  # random tie-break
+
+        if self.strategy == RoutingStrategyEnum.latency:
+            known = [e.latency_ewma for e in candidates if e.latency_ewma]
+            # endpoints without measurements get the best known latency so that they get explored
+            default = min(known) if known else 1.0
+            weights = [1 / (endpoint.latency_ewma or default) for endpoint in candidates]
+            return random.choices(candidates, weights=weights)[0]
+
+        return min(candidates, key=lambda endpoint: endpoint.outstanding)
+
+    def _record_latency(self, endpoint: Endpoint, latency: float):
+        with self.lock:
+            if endpoint.latency_ewma is None:
+                endpoint.latency_ewma = latency
+            else:
+                endpoint.latency_ewma += self.latency_alpha * (latency - endpoint.latency_ewma)
+
+    def call(self, fn, estimated_tokens: int = 0):
+        """Calls `fn(client, model_name)` on the best available endpoint, failing over on errors.
+
+        Args:
+            fn: function sending the request with the given client and model name.
+            estimated_tokens: tokens expected for the request, see `DeploymentGateway.call`.
+
+        Returns:
+            The value returned by `fn`.
+
+        Raises:
+            NoHealthyEndpointError: If every circuit is open.
+            The last error raised by `fn` if all the endpoints failed.
+        """
+        tried = set()
+        last_error = None
+        while True:
+            with self.lock:
+                candidates = [
+                    e for e in self.endpoints if e.name not in tried and e.breaker.is_available()
+                ]
+                if not candidates:
+                    break
+                endpoint = self._pick(candidates)
+                tried.add(endpoint.name)
+                if not endpoint.breaker.allow_request():
+                    continue
+                endpoint.outstanding += 1
+            # with other endpoints left, fail over quickly instead of exhausting the retries
+            is_last = len(candidates) == 1
+            max_retries = None if is_last else 1
+
+            start = time.monotonic()
+            try:
+                response = get_gateway(endpoint.name).call(
+                    lambda: fn(endpoint.client, endpoint.model_name),
+                    estimated_tokens=estimated_tokens,
+                    max_retries=max_retries,
+                )
+            except Exception as e:
+                # instructor wraps the errors of the provider
+                error = unwrap_error(e)
+                if not isinstance(error, openai.APIError) or isinstance(error, NON_FAILOVER_ERRORS):
+                    # the request itself is wrong or the response is invalid: no failover, and
+                    # the circuit is left as it is
+                    endpoint.breaker.release_trial()
+                    raise
+                endpoint.breaker.record_failure()
+                last_error = e
+                logger.warning(f"Router: {endpoint.name} failed with {type(error).__name__}")
+            else:
+                endpoint.breaker.record_success()
+                self._record_latency(endpoint, time.monotonic() - start)
+                return response
+            finally:
+                with self.lock:
+                    endpoint.outstanding -= 1
+
+        if last_error:
+            raise last_error
+        raise NoHealthyEndpointError("All the LLM endpoints are unavailable (circuits open).")
+
+    def check_health(self):
+        """Actively checks each endpoint by listing its models and updates its circuit breaker."""
+        for endpoint in self.endpoints:
+            try:
+                endpoint.client.models.list()
+            except Exception as e:
+                endpoint.breaker.record_failure()
+                logger.warning(f"Router health check: {endpoint.name} is unhealthy: {e}")
+            else:
+                endpoint.breaker.record_success()
+
+    def start_health_checks(self, interval: float):
+        """Runs `check_health` every `interval` seconds in a daemon thread."""
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.check_health()
+
+        threading.Thread(target=loop, name="llm-health-check", daemon=True).start()
+
+
+def create_router() -> Router:
+    """Creates a router over the LLM_PROVIDER deployment and the LLM_DEPLOYMENTS ones."""
+    deployments = [(chat_client, chat_model_name, 0)] + get_llm_deployment_clients()
+    endpoints = [
+        Endpoint(
+            client=client,
+            model_name=model_name,
+            priority=priority,
+            breaker=CircuitBreaker(
+                settings.LLM_CIRCUIT_BREAKER_THRESHOLD, settings.LLM_CIRCUIT_BREAKER_COOLDOWN
+            ),
+        )
+        for client, model_name, priority in deployments
+    ]
+    router = Router(endpoints, strategy=settings.LLM_ROUTING_STRATEGY)
+    if settings.LLM_HEALTH_CHECK_INTERVAL:
+        router.start_health_checks(settings.LLM_HEALTH_CHECK_INTERVAL)
+    return router
+
+
+router = create_router()
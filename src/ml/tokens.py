@@ -0,0 +1,120 @@
+import threading
+import time
+from functools import lru_cache
+
+import tiktoken
+
+from utils import chat_model_name, logger
+
+# tokens added by the chat format around each message and to prime the assistant reply
+# https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+# seconds before loading an encoding again after a failure (e.g. the download was not possible)
+ENCODING_RETRY_SECONDS = 60
+
+_encodings: dict[str, tiktoken.Encoding] = {}
+# model name -> time of the last failed load
+_failed_loads: dict[str, float] = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(model_name: str) -> tiktoken.Encoding | None:
+    """Returns the tiktoken encoding of a model, loaded once per model name.
+
+    Local models (ollama, ...) are unknown to tiktoken, cl100k_base is then used as an
+    approximation. Returns None if no encoding can be loaded (tiktoken downloads them on first
+    use): the load is tried again after ENCODING_RETRY_SECONDS.
+    """
+    encoding = _encodings.get(model_name)
+    if encoding is not None:
+        return encoding
+    with _encodings_lock:
+        if model_name in _encodings:
+            return _encodings[model_name]
+        failed_at = _failed_loads.get(model_name)
+        if failed_at is not None and time.monotonic() - failed_at < ENCODING_RETRY_SECONDS:
+            return None
+        try:
+            try:
+                encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"No tokenizer available for {model_name}, estimating tokens: {e}")
+            _failed_loads[model_name] = time.monotonic()
+            return None
+        _encodings[model_name] = encoding
+        if _failed_loads.pop(model_name, None) is not None:
+            # the estimated counts are replaced by the counts of the encoding
+            count_tokens.cache_clear()
+        return encoding
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str, model_name: str = chat_model_name) -> int:
+    """Returns the number of tokens of a text. Cached since the same passages come back often."""
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return len(text) // 4 + 1  # ~4 characters per token
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: list[dict], model_name: str = chat_model_name) -> int:
+    """Returns the number of prompt tokens of a list of chat messages."""
+    num_tokens = TOKENS_PER_REPLY
+    for message in messages:
+        num_tokens += TOKENS_PER_MESSAGE
+        for value in message.values():
+            num_tokens += count_tokens(str(value), model_name)
+    return num_tokens
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model_name: str = chat_model_name) -> str:
+    """Returns the beginning of a text that fits in `max_tokens` tokens."""
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return text[: max(0, max_tokens - 1) * 4]  # consistent with count_tokens
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def fit_passages(
+    passages: list[str],
+    budget: int,
+    model_name: str = chat_model_name,
+    separator: str = "\n",
+    min_partial_tokens: int = 32,
+) -> list[str]:
+    """Keeps the passages, in their ranking order, that fit in a budget of tokens.
+
+    The first passage that does not fit is truncated if at least `min_partial_tokens` tokens are
+    left, the following ones are dropped.
+
+    Args:
+        passages: the retrieved passages, most relevant first.
+        budget: the maximum number of tokens of the joined passages.
+        model_name: the model used to count the tokens.
+        separator: the string used to join the passages, counted in the budget.
+        min_partial_tokens: the minimum size of a truncated passage.
+
+    Returns:
+        the passages that fit in the budget.
+    """
+    separator_tokens = count_tokens(separator, model_name)
+    selected = []
+    used = 0
+    for passage in passages:
+        cost = count_tokens(passage, model_name) + (separator_tokens if selected else 0)
+        if used + cost <= budget:
+            selected.append(passage)
+            used += cost
+            continue
+
+        remaining = budget - used - (separator_tokens if selected else 0)
+        if remaining >= min_partial_tokens:
+            selected.append(truncate_to_tokens(passage, remaining, model_name))
+        logger.debug(
+            f"Context budget of {budget} tokens reached: kept {len(selected)}/{len(passages)} passages"
+        )
+        break
+    return selected
@@ -0,0 +1,69 @@
+import streamlit as st
+
+from evaluation.parquet_store import ParquetResultsStore
+from evaluation.report import (
+    compare_runs,
+    list_runs,
+    load_results,
+    metric_summary,
+    prompt_comparison,
+    regressed_cells,
+)
+from utils import settings
+
+st.write("# Evaluation results")
+
+if not settings.EVALUATION_PARQUET_DIR:
+    st.error("EVALUATION_PARQUET_DIR env var is not set")
+    st.stop()
+
+store = ParquetResultsStore(settings.EVALUATION_PARQUET_DIR)
+
+
+@st.cache_data()
+def get_results(run_files: tuple):
+    # the files of the runs are the cache key: a new run invalidates the cache
+    return load_results(store)
+
+
+results = get_results(tuple(sorted(path.name for path in store.root.glob("*.parquet"))))
+if results.empty:
+    st.info(
+        f"No evaluation run in {settings.EVALUATION_PARQUET_DIR}: run an evaluation job "
+        "(POST /evaluation/jobs/) or `python -m evaluation.runner <config>`."
+    )
+    st.stop()
+
+runs = list_runs(results)
+st.header("Runs", divider="rainbow")
+st.dataframe(runs, hide_index=True)
+
+run_id = st.selectbox("Run", runs["run_id"])
+st.header("Metrics", divider="rainbow")
+st.dataframe(
+    metric_summary(results[results["run_id"] == run_id], by=["metric"]),
+    hide_index=True,
+)
+
+st.header("Prompts and providers", divider="rainbow")
+st.dataframe(prompt_comparison(results, run_id))
+
+st.header("Regressions", divider="rainbow")
+col1, col2 = st.columns([3, 1])
+with col1:
+    baseline = st.selectbox("Baseline run", runs["run_id"], index=min(1, len(runs) - 1))
+with col2:
+    tolerance = st.number_input("Tolerance", min_value=0.0, max_value=1.0, value=0.0, step=0.01)
+
+if baseline == run_id:
+    st.info("Select a baseline run different from the run.")
+else:
+    comparison = compare_runs(results, baseline, run_id, tolerance)
+    regressed = comparison[comparison["regressed"]]
+    if regressed.empty:
+        st.success("No metric regressed.")
+    else:
+        st.error(f"Regressed metrics: {', '.join(regressed['metric'])}")
+    st.dataframe(comparison, hide_index=True)
+    with st.expander("Cells whose score dropped"):
+        st.dataframe(regressed_cells(results, baseline, run_id, tolerance), hide_index=True)
@@ -3,7 +3,7 @@ from typing import Optional, Self
 from rich.pretty import pretty_repr
 
 from loguru import logger as loguru_logger
-from pydantic import SecretStr, model_validator
+from pydantic import BaseModel, SecretStr, model_validator
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -11,6 +11,28 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class ProviderEnum(str, Enum):
     openai = "openai"
     azure_openai = "azure_openai"
+    local = "local"  # in process model without network, for tests and benchmarks
+
+
+class LogFormatEnum(str, Enum):
+    text = "text"  # human readable lines
+    json = "json"  # one JSON record per line, for log collectors
+
+
+class RoutingStrategyEnum(str, Enum):
+    least_outstanding = "least_outstanding"  # endpoint with the fewest requests in flight
+    latency = "latency"  # random choice weighted by the inverse of the observed latency
+
+
+class LLMDeployment(BaseModel):
+    """An additional OpenAI or Azure OpenAI deployment used for load balancing and failover."""
+
+    provider: ProviderEnum
+    deployment_name: str
+    base_url: str
+    api_key: SecretStr
+    api_version: str = "2024-10-01-preview"  # only used by azure_openai
+    priority: int = 0  # lower is preferred, higher priorities are only used when others fail
 
 
 class BaseEnvironmentVariables(BaseSettings):
@@ -36,14 +58,63 @@ class AzureOpenAIChatEnvironmentVariables(BaseEnvironmentVariables):
         return {key: value for key, value in vars(self).items() if key.startswith("AZURE_OPENAI")}
 
 
-class ChatEnvironmentVariables(OpenAIChatEnvironmentVariables, AzureOpenAIChatEnvironmentVariables):
+class LocalChatEnvironmentVariables(BaseEnvironmentVariables):
+    """Represents environment variables for configuring the local provider (ml/local_provider.py).
+
+    The local provider is also used by the LLM as a judge when LLMAAJ_PROVIDER is local.
+    """
+
+    LOCAL_MODEL_NAME: str = "local"
+    LOCAL_LATENCY: float = 0.0  # simulated seconds per request
+    # scripted answers (json list), the answer of a prompt is chosen by hashing it. Empty = echo
+    LOCAL_RESPONSES: list[str] = []
+    LOCAL_EMBEDDING_DIMENSIONS: int = 384
+
+    def get_local_env_vars(self):
+        return {key: value for key, value in vars(self).items() if key.startswith("LOCAL_")}
+
+
+class ChatEnvironmentVariables(
+    OpenAIChatEnvironmentVariables,
+    AzureOpenAIChatEnvironmentVariables,
+    LocalChatEnvironmentVariables,
+):
     """Represents environment variables for configuring the chatbot and promptfoo providers."""
 
-    LLM_PROVIDER: ProviderEnum  # openai or azure_openai
+    LLM_PROVIDER: ProviderEnum  # openai, azure_openai or local
     # if you want to emulate azure_openai or openai using ollama or ollamazure
     OLLAMA_MODEL_NAME: Optional[str] = None  # "phi3:3.8b-mini-4k-instruct-q4_K_M"
     OLLAMA_EMBEDDING_MODEL_NAME: Optional[str] = None  # "all-minilm:l6-v2"
 
+    # provider gateway: limits applied per deployment to every chat completion (None = no limit)
+    LLM_REQUESTS_PER_MINUTE: Optional[int] = None
+    LLM_TOKENS_PER_MINUTE: Optional[int] = None
+    LLM_MAX_CONCURRENCY: int = 16  # upper bound of the adaptive (AIMD) concurrency limit
+    LLM_MAX_RETRIES: int = 5  # retries on 429, timeouts, connection and 5xx errors
+    LLM_MAX_RETRY_AFTER: float = 60.0  # upper bound of the delays requested by the providers
+    # token budget of the prompts: context window of the model and tokens reserved for the answer
+    LLM_CONTEXT_WINDOW: int = 4096
+    LLM_MAX_COMPLETION_TOKENS: int = 1000
+    # instructor mode for response_model calls (json_mode, tools_strict...), None = automatic
+    LLM_STRUCTURED_OUTPUT_MODE: Optional[str] = None
+
+    # extra deployments (json list) balanced with the LLM_PROVIDER one, which has priority 0
+    LLM_DEPLOYMENTS: list[LLMDeployment] = []
+    LLM_ROUTING_STRATEGY: RoutingStrategyEnum = RoutingStrategyEnum.least_outstanding
+    LLM_CIRCUIT_BREAKER_THRESHOLD: int = 5  # consecutive failures before a deployment is skipped
+    LLM_CIRCUIT_BREAKER_COOLDOWN: float = 30.0  # seconds before a skipped deployment is retried
+    LLM_HEALTH_CHECK_INTERVAL: Optional[float] = None  # seconds, None disables active health checks
+
+    # conversation memory: tokens of recent messages kept as is, older ones are summarized
+    CONVERSATION_WINDOW_TOKENS: int = 1000
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 300
+    CONVERSATION_MAX_CONVERSATIONS: int = 1000  # kept in memory (LRU)
+    CONVERSATION_DB_PATH: Optional[str] = None  # SQLite file persisting the conversations
+
+    # bulk extraction endpoint: documents extracted at the same time and per request
+    EXTRACTION_MAX_CONCURRENCY: int = 8
+    EXTRACTION_MAX_DOCUMENTS: int = 1000
+
     @model_validator(mode="after")
     def check_chat_api_keys(self: Self) -> Self:
         """Validate API keys based on the selected provider after model initialization."""
@@ -73,6 +144,9 @@ class ChatEnvironmentVariables(OpenAIChatEnvironmentVariables, AzureOpenAIChatEn
                     f"\n{pretty_repr(azure_openai_vars)}"
                 )
 
+        elif self.LLM_PROVIDER == ProviderEnum.local:
+            pass  # no API key
+
         else:
             raise ValueError(f"Unknown LLM_PROVIDER: {self.LLM_PROVIDER}")
 
@@ -90,6 +164,25 @@ class AzureAISearchEnvironmentVariables(BaseEnvironmentVariables):
     AZURE_SEARCH_API_KEY: Optional[str] = None
     AZURE_SEARCH_TOP_K: Optional[str] = "2"
     SEMENTIC_CONFIGURATION_NAME: Optional[str] = None
+    # maximum tokens of retrieved context in the RAG prompt, None = whatever fits in the window
+    RAG_CONTEXT_MAX_TOKENS: Optional[int] = None
+    # passages whose shingles are this similar (estimated Jaccard) to a better ranked one are
+    # dropped, None keeps the near-duplicates
+    RAG_DEDUPE_THRESHOLD: Optional[float] = 0.8
+    # reorder the passages by local embedding similarity with the query
+    RAG_RERANK: bool = False
+    # maximum characters of retrieved passages, None = no limit
+    RAG_CONTEXT_MAX_CHARS: Optional[int] = None
+    # fan-out: sub-queries searched concurrently in addition to the question, 0 = disabled
+    RAG_FANOUT_QUERIES: int = 0
+    RAG_FANOUT_CONCURRENCY: int = 4  # maximum concurrent searches
+    RAG_RRF_K: int = 60  # smoothing constant of the reciprocal rank fusion of the results
+    # retrieval cache: passages of the recent questions (0 entries disables it)
+    RAG_CACHE_MAX_ENTRIES: int = 1024
+    RAG_CACHE_MAX_CHARS: int = 10_000_000
+    RAG_CACHE_TTL: float = 3600.0  # seconds
+    # seconds between two checks of the last indexer run, which invalidates the cache. None = never
+    RAG_CACHE_VERSION_CHECK_INTERVAL: Optional[float] = 60.0
     # Azure Storage settings
     AZURE_STORAGE_ACCOUNT_NAME: Optional[str] = None
     AZURE_STORAGE_ACCOUNT_KEY: Optional[str] = None
@@ -135,7 +228,7 @@ class EvaluationEnvironmentVariables(BaseEnvironmentVariables):
 
     ENABLE_EVALUATION: bool = False
     # LLM as a Judge for RAGAS metrics
-    LLMAAJ_PROVIDER: Optional[ProviderEnum] = None  # openai or azure_openai
+    LLMAAJ_PROVIDER: Optional[ProviderEnum] = None  # openai, azure_openai or local
 
     # if judge provider is openai
     LLMAAJ_OPENAI_DEPLOYMENT_NAME: Optional[str] = None
@@ -150,6 +243,24 @@ class EvaluationEnvironmentVariables(BaseEnvironmentVariables):
     LLMAAJ_AZURE_OPENAI_API_VERSION: str = "2024-10-01-preview"
     LLMAAJ_AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME: Optional[str] = "all-minilm:l6-v2"
 
+    # evaluation jobs (POST /evaluation/jobs/): SQLite queue, jobs run by the API at the same
+    # time (0 = only by standalone workers, see evaluation/jobs.py) and test cases run per job
+    EVALUATION_JOBS_DB: str = "evaluation_jobs.db"
+    EVALUATION_WORKERS: int = 2
+    EVALUATION_JOB_CONCURRENCY: int = 4
+    # seconds a running job stays claimed without a heartbeat of its worker: the jobs of a dead
+    # worker (or of a restarted API) are claimed again once their lease expired
+    EVALUATION_JOB_LEASE: float = 60.0
+    EVALUATION_JOB_MAX_ATTEMPTS: int = 3  # claims of a job before it is failed
+    # processes running the CPU-bound metrics (None = number of CPUs, 0 = in threads) and
+    # I/O-bound metrics (llm as a judge) run at the same time
+    EVALUATION_PROCESS_WORKERS: Optional[int] = None
+    EVALUATION_IO_CONCURRENCY: int = 16
+    # outputs and scores of the previous runs, only the changed cells are computed again
+    EVALUATION_RESULTS_DB: str = "evaluation_results.db"
+    # parquet files of the results of the runs, for the reports (None = not written)
+    EVALUATION_PARQUET_DIR: Optional[str] = "evaluation_runs"
+
     def get_eval_env_vars(self):
         items_dict = {
             "ENABLE_EVALUATION": self.ENABLE_EVALUATION,
@@ -167,6 +278,8 @@ class EvaluationEnvironmentVariables(BaseEnvironmentVariables):
                     if key.startswith("LLMAAJ_AZURE_OPENAI")
                 }
             )
+        elif self.LLMAAJ_PROVIDER == ProviderEnum.local:
+            pass  # configured by the LOCAL_ variables
         else:
             raise ValueError(f"Unknown LLMAAJ_PROVIDER: {self.LLMAAJ_PROVIDER}")
         return items_dict
@@ -175,7 +288,11 @@ class EvaluationEnvironmentVariables(BaseEnvironmentVariables):
     def check_eval_api_keys(self: Self) -> Self:
         """Validate API keys based on the selected provider after model initialization."""
         if self.ENABLE_EVALUATION:
-            if not self.LLMAAJ_PROVIDER in [ProviderEnum.openai, ProviderEnum.azure_openai]:
+            if not self.LLMAAJ_PROVIDER in [
+                ProviderEnum.openai,
+                ProviderEnum.azure_openai,
+                ProviderEnum.local,
+            ]:
                 loguru_logger.error(
                     f"Unsupported env variable LLMAAJ_PROVIDER with value: {self.LLMAAJ_PROVIDER}"
                 )
@@ -213,6 +330,16 @@ class Settings(
     FASTAPI_PORT: int = 8080
     STREAMLIT_PORT: int = 8501
     DEV_MODE: bool = True
+    # JSON lines file receiving the traces (spans) of the instrumented operations, see telemetry.py
+    TRACES_FILE: Optional[str] = None
+
+    LOG_FORMAT: LogFormatEnum = LogFormatEnum.text
+    # write the logs from a background thread so that the requests never wait for stderr
+    LOG_ENQUEUE: bool = True
+    # large payloads (prompts, contexts...) are truncated to this number of characters
+    LOG_MAX_PAYLOAD_CHARS: int = 1000
+    # fraction of the large payloads that are logged, between 0 and 1
+    LOG_PAYLOAD_SAMPLE_RATE: float = 1.0
 
     def get_active_env_vars(self):
         env_vars = {
@@ -225,6 +352,8 @@ class Settings(
             env_vars.update(self.get_openai_env_vars())
         elif self.LLM_PROVIDER == ProviderEnum.azure_openai:
             env_vars.update(self.get_azure_openai_env_vars())
+        elif self.LLM_PROVIDER == ProviderEnum.local:
+            env_vars.update(self.get_local_env_vars())
         else:
             raise ValueError(f"Unknown LLM_PROVIDER: {self.LLM_PROVIDER}")
 
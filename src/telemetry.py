@@ -0,0 +1,186 @@
+import bisect
+import json
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+
+# upper bounds (seconds) of the histogram buckets, as the prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+@dataclass
+class Span:
+    """A timed operation, in the spirit of OpenTelemetry spans."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    start_time: float = field(default_factory=time.time)  # epoch seconds
+    duration: float | None = None  # seconds
+    status: str = "ok"
+    attributes: dict = field(default_factory=dict)
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+
+class Histogram:
+    """Cumulative bucket counts for prometheus and a window of recent values for percentiles."""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS, window: int = 2048):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentiles(self, quantiles: tuple = QUANTILES) -> dict[float, float]:
+        """Returns the percentiles of the recent values (nearest rank)."""
+        values = sorted(self.recent)
+        if not values:
+            return {q: 0.0 for q in quantiles}
+        # the rank is rounded first: 0.07 * 100 is 7.000000000000001
+        ranks = {q: math.ceil(round(q * len(values), 9)) for q in quantiles}
+        return {q: values[min(len(values), max(rank, 1)) - 1] for q, rank in ranks.items()}
+
+
+class MetricsRegistry:
+    """Duration histograms of the spans, by span name."""
+
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name: str, value: float):
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(value)
+
+    def summary(self) -> dict[str, dict]:
+        """Returns the count, mean and p50/p95/p99 durations (seconds) of each span name."""
+        with self.lock:
+            return {
+                name: {
+                    "count": histogram.count,
+                    "mean": histogram.sum / histogram.count,
+                    **{f"p{int(q * 100)}": v for q, v in histogram.percentiles().items()},
+                }
+                for name, histogram in self.histograms.items()
+            }
+
+    def to_prometheus(self) -> str:
+        """Returns the metrics in the prometheus text exposition format."""
+        lines = [
+            "# HELP span_duration_seconds Duration of the instrumented operations.",
+            "# TYPE span_duration_seconds histogram",
+        ]
+        quantile_lines = [
+            "# HELP span_duration_quantiles_seconds Percentiles of the recent durations.",
+            "# TYPE span_duration_quantiles_seconds summary",
+        ]
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f'span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}'
+                    )
+                lines.append(f'span_duration_seconds_sum{{span="{name}"}} {histogram.sum}')
+                lines.append(f'span_duration_seconds_count{{span="{name}"}} {histogram.count}')
+
+                for q, value in histogram.percentiles().items():
+                    quantile_lines.append(
+                        f'span_duration_quantiles_seconds{{span="{name}",quantile="{q}"}} {value}'
+                    )
+                quantile_lines.append(
+                    f'span_duration_quantiles_seconds_sum{{span="{name}"}} {histogram.sum}'
+                )
+                quantile_lines.append(
+                    f'span_duration_quantiles_seconds_count{{span="{name}"}} {histogram.count}'
+                )
+        return "\n".join(lines + quantile_lines) + "\n"
+
+
+class JsonlSpanExporter:
+    """Appends the finished spans to a JSON lines file from a background thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        threading.Thread(target=self._worker, name="span-exporter", daemon=True).start()
+
+    def export(self, span: Span):
+        self.queue.put(span)
+
+    def _worker(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                span = self.queue.get()
+                f.write(json.dumps(asdict(span), ensure_ascii=False, default=str) + "\n")
+                if self.queue.empty():
+                    f.flush()
+
+
+registry = MetricsRegistry()
+exporter: JsonlSpanExporter | None = None
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def configure(traces_file: str | None):
+    """Exports the finished spans to `traces_file` (JSON lines), or nowhere if None."""
+    global exporter
+    exporter = JsonlSpanExporter(traces_file) if traces_file else None
+
+
+def get_current_span() -> Span | None:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Times the enclosed block as a span, child of the current span if any.
+
+    The duration is recorded in the histogram of `name` and the span is exported.
+
+    Example:
+        with span("rag.search", top_k=3) as s:
+            results = search(...)
+            s.set_attribute("results", len(results))
+    """
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+        span_id=os.urandom(8).hex(),
+        parent_id=parent.span_id if parent else None,
+        attributes=attributes,
+    )
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.status = f"error: {type(e).__name__}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_span.reset(token)
+        registry.observe(name, current.duration)
+        if exporter:
+            exporter.export(current)
@@ -1,17 +1,19 @@
 import ast
 import os
+import functools
+import random
 import sys
-import timeit
 from pathlib import Path
 
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings, OpenAIEmbeddings, ChatOpenAI
 from loguru import logger as loguru_logger
-from pydantic import ValidationError
+from pydantic import SecretStr, ValidationError
 from rich.pretty import pretty_repr
 
-from settings import Settings, ProviderEnum
+from settings import LogFormatEnum, Settings, ProviderEnum
+from telemetry import configure as configure_telemetry, get_current_span, span
 
 # Check if we run the code from the src directory
 if Path("src").is_dir():
@@ -41,10 +43,16 @@ def initialize():
     settings = Settings()
     loguru_logger.remove()
 
-    if settings.DEV_MODE:
-        loguru_logger.add(sys.stderr, level="TRACE")
-    else:
-        loguru_logger.add(sys.stderr, level="INFO")
+    # the logs of a request can be joined with its trace (see telemetry.py)
+    loguru_logger.configure(patcher=add_trace_id)
+    loguru_logger.add(
+        sys.stderr,
+        level="TRACE" if settings.DEV_MODE else "INFO",
+        serialize=settings.LOG_FORMAT == LogFormatEnum.json,
+        enqueue=settings.LOG_ENQUEUE,
+    )
+
+    configure_telemetry(settings.TRACES_FILE)
 
     search_client = None
     if settings.ENABLE_AZURE_SEARCH:
@@ -57,6 +65,41 @@ def initialize():
     return settings, loguru_logger, search_client
 
 
+def add_trace_id(record):
+    """Loguru patcher adding the trace id of the current span to the extra fields of the record."""
+    current = get_current_span()
+    if current:
+        record["extra"]["trace_id"] = current.trace_id
+
+
+def truncate_payload(payload, max_chars: int = None) -> str:
+    """Returns the payload as a string of at most `max_chars` characters (LOG_MAX_PAYLOAD_CHARS)."""
+    if max_chars is None:
+        max_chars = settings.LOG_MAX_PAYLOAD_CHARS
+    text = str(payload)
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [{len(text) - max_chars} characters truncated]"
+
+
+def log_payload(message: str, payload, level: str = "DEBUG"):
+    """Logs a large payload (prompt, context...) truncated, for a sample of the calls.
+
+    The payload is only converted and truncated if a handler accepts the level.
+
+    Args:
+        message: the description of the payload.
+        payload: the payload, converted with str.
+        level: the loguru level of the log.
+    """
+    if settings.LOG_PAYLOAD_SAMPLE_RATE < 1 and random.random() >= settings.LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    # depth=1: the log is attributed to the caller
+    logger.opt(lazy=True, depth=1).log(
+        level, "{}: {}", lambda: message, lambda: truncate_payload(payload)
+    )
+
+
 def safe_eval(x):
     try:
         return ast.literal_eval(x)
@@ -65,19 +108,17 @@ def safe_eval(x):
 
 
 def time_function(func):
-    def wrapper(*args, **kwargs):
-        start_time = timeit.default_timer()
-        result = func(*args, **kwargs)
-
-        end_time = timeit.default_timer()
-        execution_time = round(end_time - start_time, 2)
-        if "reason" in result:
-            result["reason"] = f" Execution time: {execution_time}s | " + result["reason"]
+    """Records each call of `func` as a span: duration histogram and trace, see telemetry.py.
 
-        if "output" in result:
-            result["output"] = f" Execution time: {execution_time}s | " + result["output"]
-        logger.debug(f"Function {func.__name__} took {execution_time} seconds to execute.")
+    The result of `func` is returned unchanged.
+    """
+    name = f"{func.__module__}.{func.__name__}"
 
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(name) as current:
+            result = func(*args, **kwargs)
+        logger.debug("Function {} took {:.2f} seconds to execute.", name, current.duration)
         return result
 
     return wrapper
@@ -91,12 +132,79 @@ def validation_error_message(error: ValidationError) -> ValidationError:
     return error
 
 
+def get_local_transport():
+    """Returns the transport of the local provider, configured by the LOCAL_ settings."""
+    from ml.local_provider import LocalTransport
+
+    return LocalTransport(
+        model_name=settings.LOCAL_MODEL_NAME,
+        latency=settings.LOCAL_LATENCY,
+        responses=settings.LOCAL_RESPONSES,
+        embedding_dimensions=settings.LOCAL_EMBEDDING_DIMENSIONS,
+    )
+
+
+def create_llm_client(
+    provider: ProviderEnum, base_url: str, api_key: SecretStr, api_version: str = None
+) -> object:
+    """Creates an OpenAI or AzureOpenAI client from OpenAI library.
+
+    The local provider is an OpenAI client whose requests are answered in process.
+
+    Args:
+        provider: openai, azure_openai or local.
+        base_url: the OpenAI base url or the Azure OpenAI endpoint.
+        api_key: the API key of the provider.
+        api_version: the Azure OpenAI API version, ignored by the openai provider.
+
+    Returns:
+        client: the initialized client.
+
+    Raises:
+        ValueError: If the provider is unsupported.
+    """
+    if provider == ProviderEnum.openai:
+        from openai import OpenAI
+
+        client = OpenAI(
+            base_url=base_url,
+            api_key=api_key.get_secret_value(),
+            max_retries=0,  # retries are handled by the provider gateway (ml/gateway.py)
+        )
+
+    elif provider == ProviderEnum.azure_openai:
+        from openai import AzureOpenAI
+
+        client = AzureOpenAI(
+            api_key=api_key.get_secret_value(),
+            api_version=api_version,
+            azure_endpoint=base_url,
+            max_retries=0,  # retries are handled by the provider gateway (ml/gateway.py)
+        )
+
+    elif provider == ProviderEnum.local:
+        import httpx
+        from openai import OpenAI
+
+        client = OpenAI(
+            base_url=base_url,
+            api_key=api_key.get_secret_value(),
+            max_retries=0,
+            http_client=httpx.Client(transport=get_local_transport()),
+        )
+
+    else:
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+
+    return client
+
+
 def get_llm_client() -> tuple[object, str]:
     """Initializes and returns a language model client based on the configured provider.
 
     Depending on the value of `settings.LLM_PROVIDER`, this function will initialize
     either an OpenAI or AzureOpenAI client from OpenAI library. It loads the client with the appropriate
-    settings and logs the model being used.
+    settings and logs the model being used. The local provider answers without network.
 
     Returns:
         tuple: A tuple containing the initialized client and the model name.
@@ -105,38 +213,61 @@ def get_llm_client() -> tuple[object, str]:
         ValueError: If the configured LLM provider is unsupported.
     """
     if settings.LLM_PROVIDER == ProviderEnum.openai:
-        from openai import OpenAI
-
-        client = OpenAI(
-            base_url=settings.OPENAI_BASE_URL,
-            api_key=settings.OPENAI_API_KEY.get_secret_value(),
+        client = create_llm_client(
+            settings.LLM_PROVIDER, settings.OPENAI_BASE_URL, settings.OPENAI_API_KEY
         )
         model_name = settings.OPENAI_DEPLOYMENT_NAME
         loguru_logger.info(f"Loaded OpenAI client with model: {model_name}")
 
     elif settings.LLM_PROVIDER == ProviderEnum.azure_openai:
-        from openai import AzureOpenAI
-
-        client = AzureOpenAI(
-            api_key=settings.AZURE_OPENAI_API_KEY.get_secret_value(),
-            api_version=settings.AZURE_OPENAI_API_VERSION,
-            azure_endpoint=settings.AZURE_OPENAI_BASE_URL,
+        client = create_llm_client(
+            settings.LLM_PROVIDER,
+            settings.AZURE_OPENAI_BASE_URL,
+            settings.AZURE_OPENAI_API_KEY,
+            settings.AZURE_OPENAI_API_VERSION,
         )
         model_name = settings.AZURE_OPENAI_DEPLOYMENT_NAME
         loguru_logger.info(f"Loaded AzureOpenAI client with model: {model_name}")
 
+    elif settings.LLM_PROVIDER == ProviderEnum.local:
+        from ml.local_provider import LOCAL_API_KEY, LOCAL_BASE_URL
+
+        client = create_llm_client(settings.LLM_PROVIDER, LOCAL_BASE_URL, SecretStr(LOCAL_API_KEY))
+        model_name = settings.LOCAL_MODEL_NAME
+        loguru_logger.info(f"Loaded local client with model: {model_name}")
+
     else:
         raise ValueError(f"Unsupported LLM provider: {settings.LLM_PROVIDER}")
 
     return client, model_name
 
 
+def get_llm_deployment_clients() -> list[tuple[object, str, int]]:
+    """Initializes a client for each additional deployment listed in `settings.LLM_DEPLOYMENTS`.
+
+    Returns:
+        list: (client, model name, priority) tuples, empty if no additional deployment is set.
+    """
+    clients = []
+    for deployment in settings.LLM_DEPLOYMENTS:
+        client = create_llm_client(
+            deployment.provider, deployment.base_url, deployment.api_key, deployment.api_version
+        )
+        clients.append((client, deployment.deployment_name, deployment.priority))
+        loguru_logger.info(
+            f"Loaded {deployment.provider.value} deployment {deployment.deployment_name} "
+            f"({deployment.base_url}) with priority {deployment.priority}"
+        )
+    return clients
+
+
 def get_llm_as_a_judge_client():
     """Initializes and returns a LLM as a judge client based on the configured provider.
 
     Depending on the value of `settings.LLMAAJ_PROVIDER`, this function will initialize
     either an OpenAI or AzureOpenAI client and embedding client from Langchain OpenAI library. It loads the client with
-    the appropriate settings and logs the model being used.
+    the appropriate settings and logs the model being used. With the local provider, the Langchain
+    OpenAI clients are answered in process (deterministic hashed embeddings).
 
     If `settings.ENABLE_EVALUATION` is False, the function will return `(None, None)` and log a warning.
 
@@ -180,6 +311,31 @@ def get_llm_as_a_judge_client():
             loguru_logger.info(
                 f"Loaded LLMAAJ OpenAI client with model: {settings.LLMAAJ_OPENAI_DEPLOYMENT_NAME}"
             )
+        elif settings.LLMAAJ_PROVIDER == ProviderEnum.local:
+            import httpx
+
+            from ml.local_provider import LOCAL_API_KEY, LOCAL_BASE_URL
+
+            transport = get_local_transport()
+            client = ChatOpenAI(
+                model_name=settings.LOCAL_MODEL_NAME,
+                openai_api_base=LOCAL_BASE_URL,
+                openai_api_key=LOCAL_API_KEY,
+                http_client=httpx.Client(transport=transport),
+                http_async_client=httpx.AsyncClient(transport=transport),
+            )
+            embeddings_client = OpenAIEmbeddings(
+                model=settings.LOCAL_MODEL_NAME,
+                openai_api_base=LOCAL_BASE_URL,
+                openai_api_key=LOCAL_API_KEY,
+                http_client=httpx.Client(transport=transport),
+                http_async_client=httpx.AsyncClient(transport=transport),
+                # send the texts instead of tiktoken tokens
+                check_embedding_ctx_length=False,
+            )
+            loguru_logger.info(
+                f"Loaded LLMAAJ local client with model: {settings.LOCAL_MODEL_NAME}"
+            )
 
         else:
             raise ValueError(f"Unsupported LLM provider: {settings.LLMAAJ_PROVIDER}")
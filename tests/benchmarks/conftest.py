@@ -0,0 +1,89 @@
+import json
+import random
+
+import pytest
+
+from settings import ProviderEnum
+from utils import get_llm_as_a_judge_client, settings
+
+
+@pytest.fixture(scope="session")
+def local_judge():
+    """LLM as a judge clients of the local provider: no network, deterministic embeddings."""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(settings, "ENABLE_EVALUATION", True)
+        mp.setattr(settings, "LLMAAJ_PROVIDER", ProviderEnum.local)
+        return get_llm_as_a_judge_client()
+
+
+@pytest.fixture
+def use_local_judge(local_judge, monkeypatch):
+    """Replaces the judge clients imported by a metric module with the local ones."""
+
+    def patch(module):
+        chat_client, embedding_client = local_judge
+        if hasattr(module, "llmaaj_chat_client"):
+            monkeypatch.setattr(module, "llmaaj_chat_client", chat_client)
+        if hasattr(module, "llmaaj_embedding_client"):
+            monkeypatch.setattr(module, "llmaaj_embedding_client", embedding_client)
+        return module
+
+    return patch
+
+
+def _retrieval_context(num_docs: int) -> dict:
+    """Promptfoo context of a retrieval test: half of the retrieved documents are relevant."""
+    rng = random.Random(num_docs)
+    retrieved = [f"document {i}" for i in range(num_docs)]
+    relevant = rng.sample(retrieved, max(1, num_docs // 2))
+    return {"vars": {"context": str(retrieved), "relevant_context": str(relevant)}}
+
+
+def _extraction_case(num_fields: int, error_rate: float = 0.2) -> tuple[str, dict]:
+    """Returns the output and the promptfoo context of an extraction test of `num_fields` fields.
+
+    A fraction `error_rate` of the fields of the output differ from the ground truth.
+    """
+    rng = random.Random(num_fields)
+    ground_truth = {f"field_{i}": f"value number {i}" for i in range(num_fields)}
+    output = {
+        key: f"other value {rng.randint(0, 100)}" if rng.random() < error_rate else value
+        for key, value in ground_truth.items()
+    }
+    return json.dumps(output), {"vars": {"ground_truth": json.dumps(ground_truth)}}
+
+
+def _rag_case(num_rows: int, num_docs: int) -> tuple[str, dict]:
+    """Returns the output and the promptfoo context of a RAG test evaluated by ragas.
+
+    There are `num_rows` questions (json fields) and `num_docs` documents in each context.
+    """
+    fields = [f"field_{i}" for i in range(num_rows)]
+    contexts = [f"The value of field {i} is {i * 7}." for i in range(num_docs)]
+    context = {
+        "vars": {
+            "query": str({field: f"What is the value of {field}?" for field in fields}),
+            "ground_truth": str(
+                {field: f"The value is {i * 7}." for i, field in enumerate(fields)}
+            ),
+            "context": str(contexts),
+        }
+    }
+    output = str({field: f"It is {i * 7}." for i, field in enumerate(fields)})
+    return output, context
+
+
+# pre-commit only allows test files in tests/, the builders of the datasets are given as fixtures
+@pytest.fixture
+def retrieval_context():
+    return _retrieval_context
+
+
+@pytest.fixture
+def extraction_case():
+    return _extraction_case
+
+
+@pytest.fixture
+def rag_case():
+    return _rag_case
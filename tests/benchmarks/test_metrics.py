@@ -0,0 +1,84 @@
+"""Benchmarks of the metrics (get_assert) over synthetic tests of growing size.
+
+The judge of the ragas metrics is the local provider, so the metric code is timed, not a model.
+They run once without timing in the default test session (--benchmark-disable), use
+`make bench-metrics` to time them and compare with the previous run.
+"""
+
+import importlib
+
+import pytest
+
+SIZES = [10, 100, 1000]
+# documents per context. The ragas metrics read a single score, so a test has a single question
+RAGAS_SIZES = [1, 10, 50]
+
+RETRIEVAL_METRICS = [
+    "order_unaware.precision_at_k",
+    "order_unaware.recall_at_k",
+    "order_unaware.f1_at_k",
+    "order_aware.reciprocal_rank",
+]
+EXTRACTION_METRICS = [
+    "information_extraction.exact_match_json",
+    "information_extraction.missing_fields",
+    "information_extraction.similarity_json",
+    "information_extraction.fuzzy_match_json",
+    "information_extraction.entity_level",
+    # compares the json fields of the ground truth one by one
+    "local_metrics.local_answer_similarity",
+]
+RAGAS_METRICS = [
+    "ragas_metrics.ragas_answer_correctness",
+    "ragas_metrics.ragas_answer_relevancy",
+    "ragas_metrics.ragas_answer_similarity",
+    "ragas_metrics.ragas_context_entity_recall",
+    "ragas_metrics.ragas_context_precision",
+    "ragas_metrics.ragas_context_recall",
+    "ragas_metrics.ragas_context_utilization",
+    "ragas_metrics.ragas_faithfulness",
+    "ragas_metrics.ragas_harmfulness",
+]
+
+
+def import_metric(name: str):
+    try:
+        return importlib.import_module(f"evaluation.metrics.{name}")
+    except ImportError as e:
+        pytest.skip(f"{name} is not available with the installed ragas version: {e}")
+
+
+@pytest.mark.parametrize("num_docs", SIZES)
+@pytest.mark.parametrize("metric", RETRIEVAL_METRICS)
+def test_retrieval_metric(benchmark, metric, num_docs, retrieval_context):
+    module = import_metric(metric)
+    context = retrieval_context(num_docs)
+
+    result = benchmark(module.get_assert, output="", context=context)
+    assert "score" in result
+
+
+@pytest.mark.parametrize("num_fields", SIZES)
+@pytest.mark.parametrize("metric", EXTRACTION_METRICS)
+def test_extraction_metric(benchmark, metric, num_fields, extraction_case, use_local_judge):
+    module = use_local_judge(import_metric(metric))
+    output, context = extraction_case(num_fields)
+
+    result = benchmark(module.get_assert, output=output, context=context)
+    assert 0 <= result["score"] <= 1
+
+
+@pytest.mark.parametrize("num_docs", RAGAS_SIZES)
+@pytest.mark.parametrize("metric", RAGAS_METRICS)
+def test_ragas_metric(benchmark, metric, num_docs, rag_case, use_local_judge):
+    module = use_local_judge(import_metric(metric))
+    output, context = rag_case(num_rows=1, num_docs=num_docs)
+
+    # the first evaluation of ragas initializes the metric and its prompts
+    result = benchmark.pedantic(
+        module.get_assert,
+        kwargs={"output": output, "context": context},
+        rounds=3,
+        warmup_rounds=1,
+    )
+    assert "score" in result
@@ -1,8 +1,19 @@
+import json
+
+import httpx
+import instructor
+import openai
 import pytest
 from openai.types.chat import ChatCompletion
 from pydantic import BaseModel, Field
 
-from ml.ai import get_completions
+from ml.ai import (
+    _structured_output_unsupported,
+    get_completions,
+    get_instructor_client,
+    get_response_model,
+)
+from utils import chat_client
 
 messages = [{"role": "system", "content": "You are a helpful assistant."}]
 inputs = {
@@ -60,3 +71,86 @@ def test_get_chat_completions_none():
             stream=True,
         )
         assert response is None
+
+
+def test_get_instructor_client_is_cached():
+    client = get_instructor_client(chat_client, instructor.Mode.JSON)
+
+    assert get_instructor_client(chat_client, instructor.Mode.JSON) is client
+    assert get_instructor_client(chat_client, instructor.Mode.TOOLS) is not client
+
+
+def test_get_response_model_caches_schema():
+    class UserInfo(BaseModel):
+        """Information about the user."""
+
+        number_account: str = Field(default=None, description="Client number account")
+
+    response_model = get_response_model(UserInfo)
+
+    assert get_response_model(UserInfo) is response_model
+    assert issubclass(response_model, UserInfo)
+    assert response_model.model_json_schema() == UserInfo.model_json_schema()
+    assert response_model.openai_schema["description"] == UserInfo.__doc__
+
+
+def test_get_chat_completions_falls_back_to_json_mode(monkeypatch):
+    monkeypatch.setattr("ml.ai.settings.LLM_STRUCTURED_OUTPUT_MODE", None)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        requests.append(body)
+        if "tools" in body:
+            return httpx.Response(400, json={"error": {"message": "strict is not supported"}})
+        message = {"role": "assistant", "content": '{"number_account": "208977"}'}
+        return httpx.Response(
+            200,
+            json={
+                "id": "1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            },
+        )
+
+    client = openai.OpenAI(
+        api_key="test",
+        base_url="https://test.openai.azure.com/v1",
+        max_retries=0,
+        http_client=httpx.Client(transport=httpx.MockTransport(handler)),
+    )
+
+    class UserInfo(BaseModel):
+        number_account: str
+
+    response = get_completions(messages, response_model=UserInfo, client=client)
+    assert response.number_account == "208977"
+    # the bad request of the strict tools is not retried by instructor
+    assert len(requests) == 2 and "tools" not in requests[1]
+    assert client in _structured_output_unsupported
+
+
+def test_other_bad_requests_do_not_fall_back_to_json_mode(monkeypatch):
+    monkeypatch.setattr("ml.ai.settings.LLM_STRUCTURED_OUTPUT_MODE", None)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        error = {"message": "This model's maximum context length is 8192 tokens"}
+        return httpx.Response(400, json={"error": {**error, "code": "context_length_exceeded"}})
+
+    client = openai.OpenAI(
+        api_key="test",
+        base_url="https://test.openai.azure.com/v1",
+        max_retries=0,
+        http_client=httpx.Client(transport=httpx.MockTransport(handler)),
+    )
+
+    class UserInfo(BaseModel):
+        number_account: str
+
+    assert get_completions(messages, response_model=UserInfo, client=client) is None
+    assert len(requests) == 1
+    assert client not in _structured_output_unsupported
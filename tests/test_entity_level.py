@@ -0,0 +1,57 @@
+import json
+import time
+
+import pytest
+
+from evaluation.metrics.information_extraction.entity_level import (
+    extract_entities,
+    get_assert,
+    match_entities,
+)
+
+GROUND_TRUTH = json.dumps(
+    {"person": ["Marie Curie", "Pierre Curie"], "city": "Paris", "org": ["Sorbonne University"]}
+)
+
+
+def test_extract_entities():
+    assert extract_entities('{"city": ["Paris", ""], "person": "Marie  Curie!"}') == [
+        ("city", "paris"),
+        ("person", "marie curie"),
+    ]
+    assert extract_entities('[{"type": "city", "text": "Paris"}, "Lyon"]') == [
+        ("city", "paris"),
+        ("", "lyon"),
+    ]
+    with pytest.raises(ValueError):
+        extract_entities('"Paris"')
+
+
+def test_entity_level():
+    output = json.dumps(
+        {"person": ["marie curie", "Pierre Curry"], "city": "Paris", "org": ["Sorbone University"]}
+    )
+    result = get_assert(output, {"vars": {"ground_truth": GROUND_TRUTH}})
+    assert result["named_scores"] == {"precision": 0.5, "recall": 0.5, "f1": 0.5}
+    assert not result["pass"]
+
+    context = {"vars": {"ground_truth": GROUND_TRUTH}, "config": {"fuzzy": True}}
+    result = get_assert(output, context)
+    assert "2 exact and 2 fuzzy matches" in result["reason"]
+    assert result["score"] == 1.0 and result["pass"]
+
+    # an entity of another type is not matched
+    output = json.dumps({"person": ["Marie Curie"], "org": ["Paris"]})
+    result = get_assert(output, context)
+    assert result["named_scores"]["precision"] == 0.5 and result["named_scores"]["recall"] == 0.25
+
+    assert get_assert("not json", context)["score"] == 0.0
+
+
+def test_match_entities_scales():
+    expected = [("person", f"person{i} name{i % 97}") for i in range(5000)]
+    predicted = [("person", f"persom{i} name{i % 97}") for i in range(5000)]
+    start = time.perf_counter()
+    exact, fuzzy = match_entities(predicted, expected, fuzzy=True, fuzzy_threshold=0.8)
+    assert (exact, fuzzy) == (0, 5000)
+    assert time.perf_counter() - start < 10
@@ -0,0 +1,138 @@
+import time
+
+from fastapi.testclient import TestClient
+
+import api.evaluation_route
+import evaluation.jobs
+from api.api import app
+from evaluation.jobs import JobQueue, WorkerPool
+
+CONFIG = {
+    "prompts": ["Respond to this query: {{query}}", "Answer: {{query}}"],
+    "providers": [{"id": "file://config_baseline.py", "label": "baseline"}],
+    "defaultTest": {
+        "assert": [
+            {"type": "equals", "value": "output"},
+            {"type": "contains", "value": "{{expected}}"},
+            {"type": "python", "value": "file://../metrics/order_aware/reciprocal_rank.py"},
+            {"type": "select-best", "value": "not supported"},
+        ]
+    },
+    "tests": [
+        {
+            "vars": {
+                "query": "q1",
+                "expected": "out",
+                "context": "['a']",
+                "relevant_context": "['a']",
+            }
+        },
+        {"vars": {"query": "q2", "expected": "x", "context": "['a']", "relevant_context": "['b']"}},
+    ],
+}
+
+
+def wait_for(queue: JobQueue, job_id: str, timeout: float = 30) -> dict:
+    deadline = time.monotonic() + timeout
+    while (job := queue.get(job_id))["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    return job
+
+
+def test_worker_pool_runs_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_ids = [queue.submit(CONFIG), queue.submit({**CONFIG, "tests": ["file://missing.csv"]})]
+    pool = WorkerPool(queue, workers=2, poll_interval=0.05)
+    pool.start()
+    try:
+        job, failed_job = [wait_for(queue, job_id) for job_id in job_ids]
+    finally:
+        pool.stop()
+
+    assert job["status"] == "done" and (job["done"], job["total"]) == (4, 4)
+    assert job["summary"]["equals"]["pass_rate"] == 1.0
+    assert job["summary"]["contains"]["pass_rate"] == 0.5
+    assert job["summary"]["reciprocal_rank"]["count"] == 4
+    assert "select-best" not in job["summary"]
+    assert len(queue.get(job_ids[0], with_results=True)["results"]) == 12
+    assert failed_job["status"] == "failed" and failed_job["error"]
+
+
+def test_evaluation_jobs_api(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    monkeypatch.setitem(app.dependency_overrides, api.evaluation_route.get_job_queue, lambda: queue)
+    client = TestClient(app)
+
+    response = client.post("/evaluation/jobs/", json={"config_name": "config_simple.yaml"})
+    job_id = response.json()["id"]
+    assert client.get(f"/evaluation/jobs/{job_id}").json()["status"] == "queued"
+    assert queue.claim()["config"]["tests"] == ["file://../data/test_simple.csv"]
+
+    assert (
+        client.post("/evaluation/jobs/", json={"config_name": "../../utils.py"}).status_code == 404
+    )
+    assert client.post("/evaluation/jobs/", json={}).status_code == 422
+    # inline configs are refused: their file:// references would be run
+    assert client.post("/evaluation/jobs/", json={"config": CONFIG}).status_code == 422
+    assert client.get("/evaluation/jobs/unknown/results").status_code == 404
+
+
+def test_jobs_of_dead_workers_are_claimed_again(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), lease=0.5)
+    job_id = queue.submit(CONFIG)
+    assert queue.claim()["id"] == job_id
+    queue.set_progress(job_id, 1, 4)
+    assert queue.claim() is None
+
+    # a heartbeat renews the lease
+    time.sleep(0.25)
+    queue.heartbeat([job_id])
+    time.sleep(0.35)
+    assert queue.claim() is None
+
+    # the worker died: the job is run again from the start
+    time.sleep(0.25)
+    assert queue.claim()["id"] == job_id
+    assert queue.get(job_id)["done"] == 0
+
+    # a restarted worker pool finishes the job
+    time.sleep(0.6)
+    pool = WorkerPool(JobQueue(queue.db_path, lease=0.5), workers=1, poll_interval=0.05)
+    pool.start()
+    try:
+        assert wait_for(queue, job_id)["status"] == "done"
+    finally:
+        pool.stop()
+
+
+def test_jobs_are_failed_after_max_attempts(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), lease=0.0, max_attempts=2)
+    job_id = queue.submit(CONFIG)
+    assert queue.claim()["id"] == job_id
+    assert queue.claim()["id"] == job_id
+    # the workers running it died twice
+    assert queue.claim() is None
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and "died 2 times" in job["error"]
+
+
+def test_workers_survive_errors_outside_the_evaluation(tmp_path, monkeypatch):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    run_job = evaluation.jobs.run_job
+
+    def failing_run_job(queue, job, *args):
+        if job["config"].get("description") == "broken":
+            raise ValueError("database is locked")
+        run_job(queue, job, *args)
+
+    monkeypatch.setattr(evaluation.jobs, "run_job", failing_run_job)
+    job_ids = [queue.submit({**CONFIG, "description": "broken"}), queue.submit(CONFIG)]
+    pool = WorkerPool(queue, workers=1, poll_interval=0.05)
+    pool.start()
+    try:
+        failed_job, job = [wait_for(queue, job_id) for job_id in job_ids]
+    finally:
+        pool.stop()
+    assert failed_job["status"] == "failed" and "database is locked" in failed_job["error"]
+    assert job["status"] == "done"
@@ -0,0 +1,60 @@
+import json
+
+from fastapi.testclient import TestClient
+from pydantic import SecretStr
+
+import ml.extraction
+from api.api import app
+from evaluation.metrics.utils import create_dynamic_model
+from ml.ai import get_completions, get_response_model
+from ml.local_provider import LOCAL_BASE_URL
+from settings import ProviderEnum
+from utils import create_llm_client
+
+local_client = create_llm_client(ProviderEnum.local, LOCAL_BASE_URL, SecretStr("local"))
+
+
+def local_completions(messages, **kwargs):
+    if "échec" in messages[-1]["content"]:
+        return None
+    return get_completions(messages, client=local_client, **kwargs)
+
+
+def test_bulk_json_extraction(monkeypatch):
+    monkeypatch.setattr(ml.extraction, "get_completions", local_completions)
+    documents = [{"id": f"doc-{i}", "text": f"Facture {i}"} for i in range(20)]
+    documents.append({"text": "échec"})
+
+    response = TestClient(app).post(
+        "/extraction/json/",
+        json={
+            "fields": {"client": "Quel est le client ?", "total": "Quel est le total ?"},
+            "documents": documents,
+        },
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(result["index"] for result in results) == list(range(21))
+
+    by_index = {result["index"]: result for result in results}
+    assert by_index[3] == {"index": 3, "id": "doc-3", "fields": {"client": "", "total": ""}}
+    assert by_index[20]["id"] is None and "error" in by_index[20]
+
+
+def test_bulk_json_extraction_validation():
+    client = TestClient(app)
+    assert client.post("/extraction/json/", json={"fields": {}, "documents": []}).status_code == 422
+    for field in ("_private", "model_config", "model_dump"):
+        response = client.post(
+            "/extraction/json/", json={"fields": {field: "?"}, "documents": [{"text": "Facture"}]}
+        )
+        assert response.status_code == 422 and "Invalid fields" in response.json()["detail"]
+
+
+def test_dynamic_models_are_cached_per_fields():
+    fields = {"client": "Quel est le client ?", "total": "Quel est le total ?"}
+    model = create_dynamic_model(fields)
+    assert create_dynamic_model(dict(fields)) is model
+    assert get_response_model(create_dynamic_model(fields)) is get_response_model(model)
+    assert create_dynamic_model({**fields, "total": "Quel est le montant ?"}) is not model
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+from pydantic import BaseModel
+
+from evaluation.metrics.fuzzy import (
+    compare,
+    jaro_winkler,
+    levenshtein_distance,
+    normalize,
+    token_f1,
+)
+from evaluation.metrics.information_extraction import similarity_json
+from evaluation.metrics.information_extraction.fuzzy_match_json import get_assert
+
+
+def test_fuzzy_comparisons():
+    assert normalize("  Élysée Palace, PARIS!") == "elysee palace paris"
+    assert token_f1("the palace paris", "palace of paris") == pytest.approx(2 / 3)
+    assert levenshtein_distance("kitten", "sitting") == 3
+    assert levenshtein_distance("", "abc") == 3
+    assert levenshtein_distance("a" * 200 + "b", "a" * 200 + "c") == 1
+    assert jaro_winkler("martha", "marhta") == pytest.approx(0.9611, abs=1e-4)
+
+    assert compare("Paris.", "paris") == dict.fromkeys(compare("x", "x"), 1.0)
+    scores = compare("12 may 2022", "12 May, 2021")
+    assert scores["normalized_match"] == 0.0
+    assert 0.5 < scores["token_f1"] < scores["jaro_winkler"] < 1
+    assert set(compare(None, "paris").values()) == {0.0}
+
+
+def test_fuzzy_comparisons_keep_signs_and_symbols():
+    assert normalize("-500, C++ and 3.14.") == "-500 c++ and 3.14"
+    assert normalize("Jean-Paul -") == "jean-paul"
+    assert set(compare(-500, 500).values()) == {0.0}
+    assert set(compare("-500", "500").values()) == {0.0}
+    assert compare("C++", "C")["normalized_match"] == 0.0
+    assert compare("3.14", "314")["normalized_match"] == 0.0
+    # numbers are compared by value
+    assert set(compare(5, 5.0).values()) == {1.0}
+    assert set(compare("5", " 5.0 ").values()) == {1.0}
+    assert set(compare(True, 1).values()) != {1.0}
+
+
+def test_fuzzy_match_json():
+    ground_truth = json.dumps({"city": "Paris", "date": "12 May 2022", "name": "Marie Curie"})
+    output = json.dumps({"city": "paris", "date": "12 may 2021", "name": None})
+
+    result = get_assert(output, {"vars": {"ground_truth": ground_truth}})
+    named_scores = result["named_scores"]
+    assert named_scores["normalized_match"] == pytest.approx(1 / 3, abs=1e-3)
+    assert result["score"] == named_scores["token_f1"] == pytest.approx((1 + 2 / 3) / 3, abs=1e-3)
+    assert "date" in result["reason"] and "city" not in result["reason"]
+    assert not result["pass"]
+
+    context = {"vars": {"ground_truth": ground_truth}, "config": {"method": "jaro_winkler"}}
+    assert get_assert(output, context)["score"] == named_scores["jaro_winkler"]
+    assert get_assert("not json", context)["score"] == 0.0
+
+
+def test_similarity_json_only_skips_embeddings_of_equal_texts(monkeypatch):
+    embedded = []
+
+    class EmbeddingClient:
+        def embed_query(self, text):
+            embedded.append(text)
+            return [1.0, float(len(text))]
+
+    monkeypatch.setattr(similarity_json, "llmaaj_embedding_client", EmbeddingClient())
+
+    class Answer(BaseModel):
+        language: str
+        name: str
+
+    result, _ = similarity_json.compare_pydantic_objects(
+        Answer(language="C++", name=" Marie  CURIE"), Answer(language="C", name="marie curie")
+    )
+    assert result["name"] == 1
+    assert result["language"] < 1 and embedded == ["C++", "C"]
@@ -0,0 +1,130 @@
+import time
+
+import httpx
+import openai
+import pytest
+from instructor.exceptions import InstructorRetryException
+
+from ml.gateway import (
+    AIMDLimiter,
+    DeploymentGateway,
+    TokenBucket,
+    retry_after_seconds,
+    unwrap_error,
+)
+
+
+def rate_limit_error(headers: dict) -> openai.RateLimitError:
+    request = httpx.Request("POST", "http://localhost/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError("Too many requests", response=response, body=None)
+
+
+def test_token_bucket_reserve():
+    bucket = TokenBucket(per_minute=60)  # 1 unit per second
+
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(30) == pytest.approx(30, abs=0.1)
+
+    bucket.refund(30)
+    assert bucket.reserve(1) == pytest.approx(1, abs=0.1)
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds(rate_limit_error({"retry-after": "3"})) == 3
+    assert retry_after_seconds(rate_limit_error({"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(rate_limit_error({})) is None
+    assert retry_after_seconds(ValueError()) is None
+
+
+def test_aimd_limiter():
+    limiter = AIMDLimiter(max_concurrency=8)
+
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert limiter.limit == 4
+
+    limiter.acquire()
+    limiter.release()
+    assert 4 < limiter.limit < 5
+
+
+def test_gateway_retries_rate_limited_calls():
+    gateway = DeploymentGateway("test", max_retries=2)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) < 3:
+            raise rate_limit_error({"retry-after": "0"})
+        return "ok"
+
+    assert gateway.call(fn) == "ok"
+    assert len(calls) == 3
+    assert gateway.limiter.limit < gateway.limiter.max_concurrency
+
+
+def test_gateway_raises_after_max_retries():
+    gateway = DeploymentGateway("test", max_retries=1)
+
+    def fn():
+        raise rate_limit_error({"retry-after": "0"})
+
+    with pytest.raises(openai.RateLimitError):
+        gateway.call(fn)
+
+
+def test_gateway_does_not_retry_client_errors():
+    gateway = DeploymentGateway("test", max_retries=3)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        gateway.call(fn)
+    assert len(calls) == 1
+
+
+def test_gateway_unwraps_instructor_errors():
+    gateway = DeploymentGateway("test", max_retries=2)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) < 2:
+            # instructor wraps the error of its last attempt
+            raise InstructorRetryException(
+                rate_limit_error({"retry-after": "0"}), n_attempts=1, total_usage=0
+            )
+        return "ok"
+
+    assert gateway.call(fn) == "ok"
+    assert len(calls) == 2
+    assert gateway.limiter.limit < gateway.limiter.max_concurrency
+
+    def invalid_response():
+        calls.append(1)
+        raise InstructorRetryException(ValueError("invalid"), n_attempts=1, total_usage=0)
+
+    # validation errors are not retried by the gateway
+    with pytest.raises(InstructorRetryException) as error:
+        gateway.call(invalid_response)
+    assert len(calls) == 3
+    assert isinstance(unwrap_error(error.value), ValueError)
+
+
+def test_gateway_clamps_retry_after():
+    gateway = DeploymentGateway("test", max_retries=1, max_retry_after=0.01)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) < 2:
+            raise rate_limit_error({"retry-after": "3600"})
+        return "ok"
+
+    start = time.monotonic()
+    assert gateway.call(fn) == "ok"
+    assert time.monotonic() - start < 1
@@ -0,0 +1,52 @@
+import instructor
+import numpy as np
+from pydantic import BaseModel, SecretStr
+
+from ml.ai import get_instructor_client
+from ml.hashing import hashed_embedding
+from ml.local_provider import LOCAL_BASE_URL, LocalTransport, fill_json_schema
+from settings import ProviderEnum
+from utils import create_llm_client
+
+
+def test_echo_and_scripted_completions():
+    client = create_llm_client(ProviderEnum.local, LOCAL_BASE_URL, SecretStr("local"))
+    response = client.chat.completions.create(
+        model="local", messages=[{"role": "user", "content": "Bonjour"}]
+    )
+    assert response.choices[0].message.content == "Bonjour"
+    assert response.usage.total_tokens > 0
+
+    transport = LocalTransport(responses=["a", "b", "c"])
+    messages = [{"role": "user", "content": "question"}]
+    assert transport.complete(messages) == transport.complete(messages)
+
+
+def test_structured_outputs():
+    class Invoice(BaseModel):
+        number: str
+        amount: float
+        lines: list[str]
+
+    client = create_llm_client(ProviderEnum.local, LOCAL_BASE_URL, SecretStr("local"))
+    for mode in [instructor.Mode.JSON, instructor.Mode.TOOLS_STRICT]:
+        invoice = get_instructor_client(client, mode).chat.completions.create(
+            model="local", messages=[{"role": "user", "content": "x"}], response_model=Invoice
+        )
+        assert invoice.model_dump() == {"number": "", "amount": 0.0, "lines": []}
+
+    # ragas writes the schema of the answer as a python dict in the prompt
+    prompt = f"Answer with this schema: {Invoice.model_json_schema()}"
+    answer = LocalTransport().chat_completion({"messages": [{"role": "user", "content": prompt}]})
+    assert Invoice.model_validate_json(answer["choices"][0]["message"]["content"])
+    assert fill_json_schema({"type": "string", "enum": ["yes", "no"]}) == "yes"
+
+
+def test_hashed_embeddings():
+    client = create_llm_client(ProviderEnum.local, LOCAL_BASE_URL, SecretStr("local"))
+    texts = ["the cat sat on the mat", "the cat sat on a mat", "quantum chromodynamics"]
+    embeddings = [e.embedding for e in client.embeddings.create(model="local", input=texts).data]
+
+    assert np.allclose(embeddings[0], hashed_embedding(texts[0]), atol=1e-6)
+    assert np.dot(embeddings[0], embeddings[1]) > 0.5
+    assert abs(np.dot(embeddings[0], embeddings[2])) < 0.2
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from evaluation.metrics.hashed_ngrams import HashedNgramVectorizer, ngram_hashes
+from evaluation.metrics.local_metrics.local_answer_similarity import get_assert
+from evaluation.runner import CONFIGS_DIR, metric_kind
+
+GROUND_TRUTH = "The ruling limited access to abortion for one in three women."
+
+
+def test_hashed_ngram_vectorizer():
+    hashes = ngram_hashes("Hello  World")
+    assert hashes.max() < 2**18
+    # lowercased, whitespaces collapsed, deterministic
+    assert np.array_equal(hashes, ngram_hashes("hello world"))
+
+    vectorizer = HashedNgramVectorizer()
+    identical, paraphrase, unrelated = vectorizer.similarities(
+        [GROUND_TRUTH, "Access to abortion was limited for a third of women.", "Sunny weather"],
+        [GROUND_TRUTH] * 3,
+    )
+    assert identical == pytest.approx(1.0)
+    assert unrelated < paraphrase < identical
+    assert vectorizer.similarities([""], [GROUND_TRUTH])[0] == 0.0
+    assert vectorizer.similarities(["", " "], ["", ""]).tolist() == [1.0, 1.0]
+
+    vectors = vectorizer.encode([GROUND_TRUTH, GROUND_TRUTH])
+    assert vectors[0] is vectors[1] is vectorizer.encode_one(GROUND_TRUTH)
+
+
+def test_local_answer_similarity():
+    metric = "file://../metrics/local_metrics/local_answer_similarity.py"
+    assert metric_kind({"type": "python", "value": metric}, CONFIGS_DIR) == "cpu"
+
+    result = get_assert(GROUND_TRUTH, {"vars": {"ground_truth": GROUND_TRUTH}})
+    assert result["pass"] and result["score"] == pytest.approx(1.0)
+
+    ground_truth = '{"date": "12 May 2022", "city": "Paris"}'
+    result = get_assert(
+        '{"date": "12 May 2022", "city": "Lyon"}',
+        {"vars": {"ground_truth": ground_truth}, "config": {"threshold": 0.9}},
+    )
+    assert result["named_scores"]["date"] == pytest.approx(1.0)
+    assert result["named_scores"]["city"] < 0.5
+    assert result["score"] == pytest.approx(sum(result["named_scores"].values()) / 2, abs=1e-3)
+    assert not result["pass"]
+
+    # an output that is not json scores 0 on every field
+    result = get_assert("no json", {"vars": {"ground_truth": ground_truth}})
+    assert result["score"] == 0.0 and set(result["named_scores"]) == {"date", "city"}
+
+    # empty (or null) fields on both sides are identical
+    result = get_assert(
+        '{"date": "", "city": "Paris"}',
+        {"vars": {"ground_truth": '{"date": null, "city": "Paris"}'}},
+    )
+    assert result["named_scores"] == {"date": 1.0, "city": 1.0}
@@ -0,0 +1,31 @@
+from utils import log_payload, logger, settings, truncate_payload
+
+
+def test_truncate_payload():
+    assert truncate_payload("short", max_chars=10) == "short"
+    assert truncate_payload("a" * 25, max_chars=10) == "a" * 10 + "... [15 characters truncated]"
+
+
+def test_log_payload_is_sampled_and_lazy(monkeypatch):
+    messages = []
+    handler_id = logger.add(messages.append, level="DEBUG", format="{message}")
+    converted = []
+
+    class Payload:
+        def __str__(self):
+            converted.append(True)
+            return "x" * 50
+
+    try:
+        monkeypatch.setattr(settings, "LOG_MAX_PAYLOAD_CHARS", 20)
+        log_payload("prompt", Payload())
+        monkeypatch.setattr(settings, "LOG_PAYLOAD_SAMPLE_RATE", 0.0)
+        log_payload("prompt", Payload())
+        logger.complete()
+    finally:
+        logger.remove(handler_id)
+
+    assert [message.strip() for message in messages] == [
+        "prompt: " + "x" * 20 + "... [30 characters truncated]"
+    ]
+    assert len(converted) == 1  # the payload that is not sampled is never converted
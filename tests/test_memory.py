@@ -0,0 +1,61 @@
+import threading
+import time
+
+from ml.memory import ConversationStore
+from ml.prompts import RAG_ANSWER
+
+
+def summarize(summary: str, messages: list[dict]) -> str:
+    return " | ".join([summary] * bool(summary) + [message["content"] for message in messages])
+
+
+def test_window_is_bounded_and_summarized():
+    store = ConversationStore(summarize, window_tokens=60)
+    for i in range(10):
+        conversation = store.add_turn("c1", f"question {i} " * 5, f"answer {i} " * 5)
+
+    assert 0 < len(conversation.messages) < 20
+    assert conversation.messages[-1]["content"] == "answer 9 " * 5
+    assert conversation.summary.startswith("question 0")
+    # every message is either in the summary or in the window
+    assert len(conversation.summary.split(" | ")) + len(conversation.messages) == 20
+
+    history = conversation.history()
+    assert history[0]["role"] == "system" and conversation.summary in history[0]["content"]
+    messages = RAG_ANSWER.messages(history=history, question="q", context="c")
+    assert messages[0]["content"] == RAG_ANSWER.system
+    assert messages[1:-1] == history
+
+
+def test_lru_and_sqlite_persistence(tmp_path):
+    db_path = str(tmp_path / "conversations.db")
+    store = ConversationStore(summarize, max_conversations=2, db_path=db_path)
+    for conversation_id in ["a", "b", "c"]:
+        store.add_turn(conversation_id, f"question {conversation_id}", "answer")
+
+    assert list(store.conversations) == ["b", "c"]
+    assert store.find("a").messages[0]["content"] == "question a"  # reloaded from sqlite
+
+    reopened = ConversationStore(summarize, db_path=db_path)
+    assert reopened.find("c").messages[0]["content"] == "question c"
+    assert reopened.find("unknown") is None
+    assert ConversationStore(summarize).find("a") is None
+
+
+def test_concurrent_turns_are_not_lost():
+    def slow_summarize(summary: str, messages: list[dict]) -> str:
+        time.sleep(0.01)
+        return summarize(summary, messages)
+
+    store = ConversationStore(slow_summarize, window_tokens=30)
+    threads = [
+        threading.Thread(target=store.add_turn, args=("c1", f"question {i}", f"answer {i}"))
+        for i in range(10)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    conversation = store.find("c1")
+    assert len(conversation.summary.split(" | ")) + len(conversation.messages) == 20
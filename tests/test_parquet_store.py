@@ -0,0 +1,75 @@
+import pytest
+
+from evaluation import runner
+from evaluation.metrics.utils import safe_eval
+from evaluation.parquet_store import ParquetResultsStore, convert_dataset, read_dataset
+from evaluation.runner import AssertionResult, CONFIGS_DIR, load_tests
+
+
+@pytest.fixture(autouse=True)
+def allow_tmp_path(tmp_path, monkeypatch):
+    # the metrics of the tests are written to tmp_path
+    monkeypatch.setattr(runner, "ALLOWED_DIRS", [*runner.ALLOWED_DIRS, tmp_path])
+
+
+def result(test_index: int, metric: str, score: float, named_scores: dict) -> AssertionResult:
+    return AssertionResult(
+        test_index=test_index,
+        prompt_index=0,
+        provider="file://config_baseline.py",
+        metric=metric,
+        passed=score > 0.5,
+        score=score,
+        reason="",
+        named_scores=named_scores,
+        output="output",
+        vars={"query": f"q{test_index}"},
+        latency=0.1,
+    )
+
+
+def test_runs_are_read_with_the_union_of_their_columns(tmp_path):
+    store = ParquetResultsStore(tmp_path)
+    store.write_run([result(0, "accuracy", 1.0, {"name": 1.0})], run_id="first")
+    store.write_run(
+        [result(0, "accuracy", 0.0, {"date": 0.5}), result(0, "equals", 1.0, {})],
+        run_id="second",
+    )
+
+    table = store.read(columns=["run_id", "score", "named_scores.name", "named_scores.date"])
+    assert table.num_columns == 4 and table.num_rows == 3
+    rows = sorted(table.to_pylist(), key=lambda row: (row["run_id"], row["score"]))
+    assert rows[0] == {
+        "run_id": "first",
+        "score": 1.0,
+        "named_scores.name": 1.0,
+        "named_scores.date": None,
+    }
+    assert rows[1]["named_scores.date"] == 0.5 and rows[1]["named_scores.name"] is None
+
+    filtered = store.read(columns=["score"], run_ids=["second"], metrics=["accuracy"])
+    assert filtered.to_pylist() == [{"score": 0.0}]
+    assert ParquetResultsStore(tmp_path / "empty").read().num_rows == 0
+
+
+def test_convert_dataset(tmp_path):
+    csv_path = CONFIGS_DIR.parent / "data" / "test_json.csv"
+    parquet_path = tmp_path / "test_json.parquet"
+    table = convert_dataset(csv_path, parquet_path)
+
+    assert str(table.schema.field("relevant_context").type) == "list<item: string>"
+    # a column referencing files is not a list column
+    assert str(table.schema.field("context").type) == "string"
+
+    # the runner reads the parquet dataset as the csv dataset
+    from_csv = load_tests({"tests": ["file://../data/test_json.csv"]}, CONFIGS_DIR)
+    from_parquet = load_tests({"tests": [f"file://{parquet_path}"]}, CONFIGS_DIR)
+    assert read_dataset(parquet_path) == [test["vars"] for test in from_parquet]
+    assert len(from_parquet) == len(from_csv)
+    for csv_test, parquet_test in zip(from_csv, from_parquet):
+        csv_vars, parquet_vars = csv_test["vars"], parquet_test["vars"]
+        assert parquet_vars["query"] == csv_vars["query"]
+        assert parquet_vars["context"] == csv_vars["context"]
+        assert safe_eval(parquet_vars["relevant_context"]) == safe_eval(
+            csv_vars["relevant_context"]
+        )
@@ -0,0 +1,47 @@
+from ml.passages import (
+    MinHasher,
+    deduplicate,
+    reciprocal_rank_fusion,
+    rerank,
+    select_passages,
+    shingles,
+)
+
+PASSAGE = (
+    "Les congés payés sont acquis à raison de deux jours et demi ouvrables par mois de travail "
+    "effectif chez le même employeur, dans la limite de trente jours ouvrables par an."
+)
+
+
+def test_minhash_estimates_jaccard():
+    a = shingles(PASSAGE)
+    b = shingles(PASSAGE.replace("même employeur", "même patron"))
+    jaccard = len(a & b) / len(a | b)
+    hasher = MinHasher(num_permutations=256)
+    estimate = (hasher.signature(a) == hasher.signature(b)).mean()
+    assert abs(estimate - jaccard) < 0.15
+
+
+def test_deduplicate_keeps_the_best_ranked():
+    texts = [
+        PASSAGE,
+        "Le télétravail est possible deux jours par semaine avec l'accord du manager.",
+        PASSAGE.replace("par an.", "par an !"),
+    ]
+    assert deduplicate(texts) == [0, 1]
+    assert deduplicate(texts, threshold=1.01) == [0, 1, 2]
+
+
+def test_select_passages():
+    texts = ["la cantine ouvre à midi", "les congés payés du salarié", "les congés payés"]
+    assert rerank("congés payés du salarié", texts) == [1, 2, 0]
+    assert select_passages("congés payés", texts, rerank_passages=True, max_chars=30) == [2]
+    assert select_passages("congés payés", texts, max_chars=1) == [0]
+    assert select_passages("congés payés", texts, dedupe_threshold=None) == [0, 1, 2]
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"], ["c", "a"]])
+    # b and d tie, b comes first in the first ranking
+    assert fused == ["c", "a", "b", "d"]
+    assert reciprocal_rank_fusion([["a", "a", "b"]]) == ["a", "b"]
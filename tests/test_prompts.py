@@ -0,0 +1,26 @@
+import pytest
+
+from ml.prompts import PromptTemplate, get_prompt
+
+
+def test_prompt_template_messages():
+    template = PromptTemplate("test", system="Static {instructions}", user="{question} - {{x}}")
+
+    messages = template.messages(question="Why?")
+
+    assert template.variables == ("question",)
+    assert messages[0] == {"role": "system", "content": "Static {instructions}"}
+    assert messages[1] == {"role": "user", "content": "Why? - {x}"}
+
+
+def test_prompt_template_matches_str_format():
+    user = "question :{question}, \n\n contexte : \n{context}."
+    template = PromptTemplate("test", system="", user=user)
+
+    assert template.format_user(question="q", context="c") == user.format(question="q", context="c")
+
+
+def test_get_prompt():
+    assert get_prompt("rag_answer").variables == ("question", "context")
+    with pytest.raises(ValueError):
+        get_prompt("unknown")
@@ -1,7 +1,11 @@
+import asyncio
 import os
+import time
 
 import pytest
 
+import ml.ai
+from benchmarks.fakes import FakeSearchClient
 from ml.ai import get_related_document_ai_search, get_rag_response, run_azure_ai_search_indexer
 from utils import logger, settings
 
@@ -31,3 +35,40 @@ def test_get_rag_response():
 )
 def test_run_azure_ai_search_indexer():
     assert run_azure_ai_search_indexer().status_code == 202
+
+
+def test_fan_out_search(monkeypatch):
+    monkeypatch.setattr(ml.ai, "search_client", FakeSearchClient(latency=0.1, caption_words=1))
+    monkeypatch.setattr(ml.ai, "reformulate_query", lambda question: question)
+    monkeypatch.setattr(ml.ai, "decompose_query", lambda question, n: ["a", "b", "c"][:n])
+    monkeypatch.setattr(ml.ai, "get_index_version", lambda: None)
+    monkeypatch.setattr(settings, "AZURE_SEARCH_TOP_K", "2")
+
+    start = time.perf_counter()
+    new_question, captions, sub_captions = asyncio.run(ml.ai.fan_out_search("q", 3, 4))
+    assert time.perf_counter() - start < 0.3  # the 4 searches ran concurrently
+    assert new_question == "q" and len(sub_captions) == 3
+
+    context = get_related_document_ai_search("question", sub_queries=2)
+    # the documents of the question, then the ones of the sub-queries, merged by rank
+    assert context.count("Numéro document") == 6
+    assert context.index("question passage 0") < context.index("a passage 0")
+
+
+def test_failed_reformulations_are_not_cached(monkeypatch):
+    monkeypatch.setattr(ml.ai, "search_client", FakeSearchClient(latency=0, caption_words=1))
+    monkeypatch.setattr(ml.ai, "get_index_version", lambda: None)
+    monkeypatch.setattr(settings, "AZURE_SEARCH_TOP_K", "2")
+    monkeypatch.setattr(ml.ai.retrieval_cache, "max_entries", 16)
+    ml.ai.retrieval_cache.clear()
+
+    monkeypatch.setattr(ml.ai, "reformulate_query", lambda question: question)
+    monkeypatch.setattr(ml.ai, "decompose_query", lambda question, n: None)
+    get_related_document_ai_search("failed decomposition", sub_queries=2)
+    monkeypatch.setattr(ml.ai, "reformulate_query", lambda question: None)
+    get_related_document_ai_search("failed reformulation", sub_queries=0)
+    assert len(ml.ai.retrieval_cache.entries) == 0
+
+    monkeypatch.setattr(ml.ai, "reformulate_query", lambda question: question)
+    get_related_document_ai_search("failed reformulation", sub_queries=0)
+    assert len(ml.ai.retrieval_cache.entries) == 1
@@ -0,0 +1,57 @@
+import pytest
+
+from evaluation.parquet_store import ParquetResultsStore
+from evaluation.report import compare_runs, load_results, metric_summary, prompt_comparison
+from evaluation.runner import AssertionResult
+
+
+def run(scores: list[float], named_scores: bool = False) -> list[AssertionResult]:
+    return [
+        AssertionResult(
+            test_index=i // 2,
+            prompt_index=i % 2,
+            provider="provider",
+            metric="accuracy",
+            passed=score >= 0.5,
+            score=score,
+            reason="",
+            named_scores={"name": score / 2} if named_scores else {},
+        )
+        for i, score in enumerate(scores)
+    ]
+
+
+@pytest.fixture
+def results(tmp_path):
+    store = ParquetResultsStore(tmp_path)
+    store.write_run(run([1.0, 0.5, 1.0, 0.5, 1.0, 0.5, 1.0, 0.5], named_scores=True), "baseline")
+    store.write_run(run([0.5, 0.5, 0.4, 0.5, 0.6, 0.5, 0.5, 0.5]), "candidate")
+    return load_results(store)
+
+
+def test_metric_summary(results):
+    summary = metric_summary(results).set_index(["run_id", "metric"])
+    accuracy = summary.loc[("baseline", "accuracy")]
+    assert accuracy["count"] == 8 and accuracy["mean"] == 0.75 and accuracy["pass_rate"] == 1.0
+    assert accuracy["ci_low"] < 0.75 < accuracy["ci_high"]
+    # the named scores are reported as metrics, without pass rate
+    named = summary.loc[("baseline", "accuracy.name")]
+    assert named["mean"] == 0.375 and named["pass_rate"] != named["pass_rate"]
+    assert ("candidate", "accuracy.name") not in summary.index
+
+    prompts = prompt_comparison(results, "baseline")
+    assert prompts.loc["accuracy", (0, "provider")] == 1.0
+    assert prompts.loc["accuracy", (1, "provider")] == 0.5
+
+
+def test_compare_runs(results):
+    comparison = compare_runs(results, "baseline", "candidate").set_index("metric")
+    # only the cells of both runs are compared
+    assert list(comparison.index) == ["accuracy"]
+    accuracy = comparison.loc["accuracy"]
+    assert accuracy["cells"] == 8 and accuracy["dropped_cells"] == 4
+    assert accuracy["delta"] == pytest.approx(-0.25)
+    assert accuracy["regressed"]
+
+    assert not compare_runs(results, "baseline", "candidate", tolerance=0.5)["regressed"].any()
+    assert not compare_runs(results, "candidate", "baseline")["regressed"].any()
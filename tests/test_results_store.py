@@ -0,0 +1,56 @@
+import copy
+
+from evaluation.results_store import ResultsStore, source_hash
+from evaluation.runner import load_module, resolve_path, run_evaluation, CONFIGS_DIR
+
+CONFIG = {
+    "prompts": ["Respond to this query: {{query}}", "Answer: {{query}}"],
+    "providers": ["file://config_baseline.py"],
+    "defaultTest": {
+        "assert": [
+            {"type": "equals", "value": "output"},
+            {"type": "python", "value": "file://../metrics/order_aware/reciprocal_rank.py"},
+        ]
+    },
+    "tests": [
+        {"vars": {"query": f"q{i}", "context": "['a', 'b']", "relevant_context": "['b']"}}
+        for i in range(3)
+    ],
+}
+
+
+def cached_cells(results) -> set:
+    return {(r.test_index, r.prompt_index, r.metric) for r in results if r.cached}
+
+
+def test_only_changed_cells_are_recomputed(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    first = run_evaluation(CONFIG, store=store)
+    assert len(first) == 12 and not cached_cells(first)
+
+    second = run_evaluation(CONFIG, store=store)
+    assert len(cached_cells(second)) == 12
+    assert [r.score for r in second] == [r.score for r in first]
+
+    config = copy.deepcopy(CONFIG)
+    config["prompts"][1] = "Answer briefly: {{query}}"
+    config["tests"][0]["vars"]["relevant_context"] = "['a']"
+    config["defaultTest"]["assert"][0]["threshold"] = 0.5
+    changed = run_evaluation(config, store=store)
+    # the first test and the second prompt changed, the equals assertion of every cell changed
+    assert cached_cells(changed) == {(1, 0, "reciprocal_rank"), (2, 0, "reciprocal_rank")}
+
+    assert not cached_cells(
+        run_evaluation({**CONFIG, "evaluateOptions": {"cache": False}}, store=store)
+    )
+
+
+def test_source_hash_includes_project_imports():
+    module = load_module(
+        resolve_path("file://../metrics/information_extraction/exact_match_json.py", CONFIGS_DIR)
+    )
+    other = load_module(
+        resolve_path("file://../metrics/information_extraction/missing_fields.py", CONFIGS_DIR)
+    )
+    assert source_hash(module) != source_hash(other)
+    assert source_hash(module) == source_hash(module)
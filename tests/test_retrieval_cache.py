@@ -0,0 +1,43 @@
+import time
+
+from ml.retrieval_cache import RetrievalCache, normalize_query
+
+
+def test_normalize_query():
+    assert normalize_query("  Quels sont  les HORAIRES ?") == "quels sont les horaires ?"
+    assert normalize_query("C++") != normalize_query("C")
+    assert normalize_query("ﬁchier") == normalize_query("Fichier")
+
+
+def test_expiration_and_bounds():
+    cache = RetrievalCache(max_entries=2, max_chars=10, ttl=0.05)
+    cache.put("a", ["1234"])
+    assert cache.get(" A ") == ["1234"]
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+    cache.ttl = 60
+    cache.put("a", ["1234"])
+    cache.put("b", ["1234"])
+    cache.get("a")
+    cache.put("c", ["1234"])
+    # b is the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+
+    cache.put("d", ["12345678"])
+    assert cache.chars <= 10
+    assert cache.get("d") == ["12345678"]
+    cache.put("e", ["12345678901"])
+    assert cache.get("e") is None
+
+
+def test_version_invalidation():
+    cache = RetrievalCache()
+    cache.set_version("2024-01-01T00:00:00Z")
+    cache.put("question", ["passage"])
+    cache.set_version("2024-01-01T00:00:00Z")
+    assert cache.get("question") == ["passage"]
+    cache.set_version("2024-01-02T00:00:00Z")
+    assert cache.get("question") is None
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,112 @@
+import httpx
+import openai
+import pytest
+from instructor.exceptions import InstructorRetryException
+
+from ml.router import CircuitBreaker, Endpoint, NoHealthyEndpointError, Router
+from settings import RoutingStrategyEnum
+
+
+class FakeClient:
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+
+def server_error() -> openai.InternalServerError:
+    request = httpx.Request("POST", "http://localhost/v1/chat/completions")
+    response = httpx.Response(500, request=request)
+    return openai.InternalServerError("Server error", response=response, body=None)
+
+
+def create_router(**kwargs) -> Router:
+    endpoints = [
+        Endpoint(FakeClient("http://primary"), "model", priority=0),
+        Endpoint(FakeClient("http://fallback"), "model", priority=1),
+    ]
+    return Router(endpoints, **kwargs)
+
+
+def test_router_prefers_lowest_priority():
+    router = create_router()
+
+    assert router.call(lambda client, model_name: client.base_url) == "http://primary"
+
+
+def test_router_fails_over():
+    router = create_router()
+
+    def fn(client, model_name):
+        if client.base_url == "http://primary":
+            raise server_error()
+        return client.base_url
+
+    assert router.call(fn) == "http://fallback"
+    assert router.endpoints[0].breaker.failures == 1
+
+
+def test_router_least_outstanding():
+    router = Router(
+        [Endpoint(FakeClient("http://a"), "model"), Endpoint(FakeClient("http://b"), "model")]
+    )
+    router.endpoints[0].outstanding = 3
+
+    assert router.call(lambda client, model_name: client.base_url) == "http://b"
+
+
+def test_router_latency_strategy_records_latency():
+    router = create_router(strategy=RoutingStrategyEnum.latency)
+
+    router.call(lambda client, model_name: None)
+
+    assert router.endpoints[0].latency_ewma is not None
+
+
+def test_router_no_healthy_endpoint():
+    router = create_router()
+    for endpoint in router.endpoints:
+        endpoint.breaker = CircuitBreaker(failure_threshold=1, cooldown=60)
+        endpoint.breaker.record_failure()
+
+    with pytest.raises(NoHealthyEndpointError):
+        router.call(lambda client, model_name: None)
+
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0)
+
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "half_open"  # cooldown of 0 seconds
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # only one trial request
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_router_fails_over_instructor_errors():
+    router = create_router()
+
+    def fn(client, model_name):
+        if client.base_url == "http://primary":
+            raise InstructorRetryException(server_error(), n_attempts=1, total_usage=0)
+        return client.base_url
+
+    assert router.call(fn) == "http://fallback"
+    assert router.endpoints[0].breaker.failures == 1
+
+
+def test_router_errors_do_not_close_the_circuit():
+    router = create_router()
+    breaker = router.endpoints[0].breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.record_failure()
+    router.endpoints.pop()
+
+    def fn(client, model_name):
+        raise InstructorRetryException(ValueError("invalid"), n_attempts=1, total_usage=0)
+
+    # the half-open trial is released, the circuit is not closed by an error
+    with pytest.raises(InstructorRetryException):
+        router.call(fn)
+    assert breaker.state == "half_open" and breaker.is_available()
@@ -0,0 +1,202 @@
+import os
+
+import pytest
+from jinja2.exceptions import SecurityError
+
+from evaluation import runner
+from evaluation.runner import (
+    CONFIGS_DIR,
+    assertion_fingerprint,
+    call_provider,
+    gated_result,
+    metric_kind,
+    render,
+    resolve_path,
+    run_evaluation,
+)
+
+METRIC = """
+import os
+
+def get_assert(output, context):
+    return {"pass": True, "score": 1.0, "reason": str(os.getpid())}
+"""
+
+
+@pytest.fixture(autouse=True)
+def allow_tmp_path(tmp_path, monkeypatch):
+    # the metrics of the tests are written to tmp_path, the worker processes of a test get its
+    # allowed directories when they start
+    monkeypatch.setattr(runner, "ALLOWED_DIRS", [*runner.ALLOWED_DIRS, tmp_path])
+    monkeypatch.setattr(runner, "_process_pool", None)
+    yield
+    if runner._process_pool is not None:
+        runner._process_pool.shutdown(cancel_futures=True)
+
+
+def test_metric_kind():
+    def kind(path: str) -> str:
+        return metric_kind({"type": "python", "value": f"file://../metrics/{path}"}, CONFIGS_DIR)
+
+    assert kind("order_unaware/precision_at_k.py") == "cpu"
+    assert kind("information_extraction/exact_match_json.py") == "cpu"
+    assert kind("ragas_metrics/ragas_answer_similarity.py") == "io"
+    assert metric_kind({"type": "equals", "value": "x"}, CONFIGS_DIR) == "inline"
+
+
+def test_cpu_metrics_run_in_worker_processes(tmp_path):
+    (tmp_path / "pid_metric.py").write_text(METRIC)
+    (tmp_path / "io_metric.py").write_text("IO_BOUND = True\n" + METRIC)
+    config = {
+        "prompts": ["{{query}}"],
+        "providers": [f"file://{CONFIGS_DIR / 'config_baseline.py'}"],
+        "defaultTest": {
+            "assert": [
+                {"type": "python", "value": "file://pid_metric.py"},
+                {"type": "python", "value": "file://io_metric.py"},
+            ]
+        },
+        "tests": [{"vars": {"query": f"q{i}"}} for i in range(4)],
+    }
+
+    results = run_evaluation(config, tmp_path, process_workers=2)
+    pids = {result.metric: result.reason for result in results}
+    assert pids["pid_metric"].isdigit() and pids["pid_metric"] != str(os.getpid())
+    assert pids["io_metric"] == str(os.getpid())
+
+    in_threads = run_evaluation(config, tmp_path, process_workers=0)
+    assert {result.reason for result in in_threads} == {str(os.getpid())}
+
+
+def test_gated_metrics_are_not_run(tmp_path):
+    calls = tmp_path / "calls.txt"
+    (tmp_path / "judge.py").write_text(
+        "def get_assert(output, context):\n"
+        f"    with open({str(calls)!r}, 'a') as f:\n"
+        "        f.write('call\\n')\n"
+        "    return 0.5\n"
+    )
+    judge = {
+        "type": "python",
+        "value": "file://judge.py",
+        "metric": "judge",
+        "gates": [
+            {"metric": "is-json", "when": "fail", "score": 0.0},
+            {"metric": "exact", "when": "pass", "score": 1.0},
+        ],
+    }
+    config = {
+        "prompts": ["{{query}}"],
+        "providers": [f"file://{CONFIGS_DIR / 'config_baseline.py'}"],
+        "defaultTest": {
+            "assert": [
+                judge,
+                {"type": "equals", "value": "{{expected}}", "metric": "exact"},
+                {"type": "is-json"},
+            ]
+        },
+        "tests": [{"vars": {"query": "q", "expected": "output"}}],
+    }
+
+    # the output is not json: the judge is not called
+    results = {r.metric: r for r in run_evaluation(config, tmp_path, process_workers=0)}
+    assert results["judge"].score == 0.0 and results["judge"].reason == "gated: is-json fail"
+    assert not calls.exists()
+
+    judge["gates"] = [{"metric": "exact", "when": "pass", "score": 1.0}]
+    results = {r.metric: r for r in run_evaluation(config, tmp_path, process_workers=0)}
+    assert results["judge"].score == 1.0 and results["judge"].passed
+    assert not calls.exists()
+
+    config["tests"][0]["vars"]["expected"] = "other"
+    results = {r.metric: r for r in run_evaluation(config, tmp_path, process_workers=0)}
+    assert results["judge"].score == 0.5
+    assert calls.read_text() == "call\n"
+
+    judge["gates"] = [{"metric": "judge", "when": "pass", "score": 1.0}]
+    with pytest.raises(ValueError, match="cycle"):
+        run_evaluation(config, tmp_path, process_workers=0)
+    judge["gates"] = [{"metric": "unknown", "when": "pass", "score": 1.0}]
+    with pytest.raises(ValueError, match="exactly one"):
+        run_evaluation(config, tmp_path, process_workers=0)
+
+
+def test_explicit_gate_pass_wins_over_the_threshold():
+    gate = {"metric": "exact", "when": "pass", "score": 1.0}
+    assertion = {"type": "python", "value": "file://judge.py", "threshold": 0.5}
+    assert gated_result(assertion, gate)["pass"]
+    assert not gated_result(assertion, {**gate, "pass": False})["pass"]
+    assert gated_result({**assertion, "threshold": 0.8}, {**gate, "score": 0.5, "pass": True})[
+        "pass"
+    ]
+    assert not gated_result({**assertion, "threshold": 0.8}, {**gate, "score": 0.5})["pass"]
+
+
+def test_configs_cannot_run_arbitrary_code(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-secret")
+    monkeypatch.setenv("OPENAI_DEPLOYMENT_NAME", "gpt")
+    assert render("{{ env.OPENAI_DEPLOYMENT_NAME }}|{{ env.OPENAI_API_KEY }}", {}) == "gpt|"
+    with pytest.raises(SecurityError):
+        render("{{ cycler.__init__.__globals__.os.popen('id').read() }}", {})
+
+    assert resolve_path("file://pid_metric.py", tmp_path) == tmp_path.resolve() / "pid_metric.py"
+    monkeypatch.setattr(runner, "ALLOWED_DIRS", [runner.EVALUATION_DIR])
+    for path in ("file:///tmp/provider.py", "file://../../utils.py", f"file://{tmp_path}/a.py"):
+        with pytest.raises(ValueError, match="outside"):
+            resolve_path(path, CONFIGS_DIR)
+
+    # another model than the chat deployment is not silently replaced by it
+    monkeypatch.setattr(runner, "chat_model_name", "gpt-4o")
+    for provider_id in ("openai:chat:gpt-4o-mini", "anthropic:messages:claude", "echo"):
+        with pytest.raises(ValueError, match="Unsupported provider"):
+            call_provider({"id": provider_id}, "prompt", {}, CONFIGS_DIR)
+
+
+CRASHING_METRIC = """
+import os
+from pathlib import Path
+
+def get_assert(output, context):
+    flag = Path(__file__).with_suffix(".crashed")
+    if context["vars"]["query"] == "q0" and (ALWAYS or not flag.exists()):
+        flag.touch()
+        os._exit(1)
+    return 1.0
+"""
+
+
+def test_process_pool_is_recreated_when_a_worker_dies(tmp_path):
+    for name, always in (("crash_once", False), ("crash_always", True)):
+        (tmp_path / f"{name}.py").write_text(f"ALWAYS = {always}\n" + CRASHING_METRIC)
+
+    def config(metric: str) -> dict:
+        return {
+            "prompts": ["{{query}}"],
+            "providers": [f"file://{CONFIGS_DIR / 'config_baseline.py'}"],
+            "defaultTest": {"assert": [{"type": "python", "value": f"file://{metric}.py"}]},
+            "tests": [{"vars": {"query": f"q{i}"}} for i in range(3)],
+        }
+
+    # the case killing its worker is run again on a new pool
+    results = run_evaluation(config("crash_once"), tmp_path, process_workers=1)
+    assert [result.score for result in results] == [1.0, 1.0, 1.0]
+
+    results = run_evaluation(config("crash_always"), tmp_path, process_workers=1)
+    assert results[0].score == 0.0 and results[0].reason.startswith("error")
+    # the next runs get a working pool
+    results = run_evaluation(config("crash_once"), tmp_path, process_workers=1)
+    assert [result.score for result in results] == [1.0, 1.0, 1.0]
+
+
+def test_judge_models_are_in_the_fingerprint_of_io_metrics(tmp_path, monkeypatch):
+    (tmp_path / "judge.py").write_text("IO_BOUND = True\n" + METRIC)
+    (tmp_path / "pid_metric.py").write_text(METRIC)
+    judge = {"type": "python", "value": "file://judge.py"}
+    cpu = {"type": "python", "value": "file://pid_metric.py"}
+
+    monkeypatch.setattr(runner.settings, "LLMAAJ_PROVIDER", "azure_openai")
+    before = [assertion_fingerprint(assertion, {}, tmp_path) for assertion in (judge, cpu)]
+    monkeypatch.setattr(runner.settings, "LLMAAJ_AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME", "other")
+    after = [assertion_fingerprint(assertion, {}, tmp_path) for assertion in (judge, cpu)]
+    assert before[0] != after[0] and after[0]["judge"]["embedding_model"] == "other"
+    assert before[1] == after[1]
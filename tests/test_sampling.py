@@ -0,0 +1,87 @@
+from collections import Counter
+
+import pytest
+
+from evaluation import runner
+from evaluation.runner import CONFIGS_DIR, AssertionResult
+from evaluation.sampling import (
+    SamplingOptions,
+    covers_strata,
+    estimate_means,
+    run_sampled_evaluation,
+    stratified_order,
+)
+
+METRIC = """
+def get_assert(output, context):
+    return float(context["vars"]["score"])
+"""
+
+
+@pytest.fixture(autouse=True)
+def allow_tmp_path(tmp_path, monkeypatch):
+    # the metrics of the tests are written to tmp_path
+    monkeypatch.setattr(runner, "ALLOWED_DIRS", [*runner.ALLOWED_DIRS, tmp_path])
+
+
+def test_stratified_order():
+    tests = [{"vars": {"topic": "a" if i < 300 else "b"}} for i in range(400)]
+    order = stratified_order(tests, "topic", seed=1)
+    assert sorted(order) == list(range(400))
+    for size in (4, 40, 100):
+        topics = Counter(tests[index]["vars"]["topic"] for index in order[:size])
+        assert abs(topics["a"] - size * 3 / 4) <= 1
+
+
+def test_sampling_stops_at_the_target_precision(tmp_path):
+    (tmp_path / "score.py").write_text(METRIC)
+    config = {
+        "prompts": ["{{query}}"],
+        "providers": [f"file://{CONFIGS_DIR / 'config_baseline.py'}"],
+        "defaultTest": {"assert": [{"type": "python", "value": "file://score.py"}]},
+        "tests": [
+            {"vars": {"query": f"q{i}", "topic": i % 2, "score": (i % 2) * 0.5 + (i % 5) / 10}}
+            for i in range(1000)
+        ],
+        "evaluateOptions": {
+            "sampling": {"targetHalfWidth": 0.05, "initialSize": 20, "stratifyBy": "topic"}
+        },
+    }
+
+    results, estimates = run_sampled_evaluation(config, tmp_path, process_workers=0)
+    assert estimates["sampling"]["precise"]
+    assert estimates["sampling"]["size"] < 1000 and len(results) == estimates["sampling"]["size"]
+    estimate = estimates["score"]
+    assert estimate["half_width"] <= 0.05
+    # the mean of the dataset is 0.45
+    assert estimate["ci_low"] - 0.01 <= 0.45 <= estimate["ci_high"] + 0.01
+    # the results keep the index of their test case in the dataset
+    assert all(r.vars["query"] == f"q{r.test_index}" for r in results)
+
+    options = SamplingOptions(target_half_width=0.0, initial_size=20, batch_size=30, max_size=50)
+    results, estimates = run_sampled_evaluation(config, tmp_path, options, process_workers=0)
+    assert estimates["sampling"] == {"size": 50, "dataset_size": 1000, "precise": False}
+
+
+def test_identical_scores_are_not_precise():
+    results = [
+        AssertionResult(index, 0, "baseline", "equals", True, 1.0, "") for index in range(20)
+    ]
+    strata = dict.fromkeys(range(1000), "")
+    estimate = estimate_means(results, strata, {"": 1000})["equals"]
+    assert estimate["mean"] == 1.0
+    # Agresti-Coull: p = (20 + z²/2) / (20 + z²)
+    assert estimate["half_width"] == pytest.approx(0.109, abs=1e-3)
+
+    # a stratum sampled entirely is known exactly
+    estimate = estimate_means(results, strata, {"": 20})["equals"]
+    assert estimate["half_width"] == 0.0
+
+
+def test_covers_strata():
+    strata = {index: "rare" if index < 5 else "common" for index in range(100)}
+    population = {"rare": 5, "common": 95}
+    assert not covers_strata(list(range(5, 50)), strata, population, minimum=10)
+    assert not covers_strata(list(range(4, 50)), strata, population, minimum=10)
+    # a stratum smaller than the minimum is covered by all its test cases
+    assert covers_strata(list(range(15)), strata, population, minimum=10)
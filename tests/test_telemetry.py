@@ -0,0 +1,86 @@
+import json
+import time
+
+import pytest
+
+from telemetry import Histogram, JsonlSpanExporter, MetricsRegistry, registry, span
+from utils import time_function
+
+
+def test_nested_spans_share_the_trace():
+    with span("test.parent") as parent:
+        with span("test.child", key="value") as child:
+            pass
+
+    assert child.trace_id == parent.trace_id
+    assert child.parent_id == parent.span_id
+    assert parent.parent_id is None
+    assert child.attributes == {"key": "value"}
+    assert parent.duration >= child.duration >= 0
+
+
+def test_span_records_errors():
+    with pytest.raises(ValueError):
+        with span("test.error") as current:
+            raise ValueError("boom")
+
+    assert current.status == "error: ValueError"
+    assert registry.summary()["test.error"]["count"] >= 1
+
+
+def test_percentiles_and_prometheus_export():
+    metrics = MetricsRegistry()
+    for i in range(1, 101):
+        metrics.observe("stage", i / 100)
+
+    summary = metrics.summary()["stage"]
+    assert summary["count"] == 100
+    # nearest rank: the smallest value with at least q of the values at or below it
+    assert summary["p50"] == pytest.approx(0.5)
+    assert summary["p95"] == pytest.approx(0.95)
+    assert summary["p99"] == pytest.approx(0.99)
+
+    text = metrics.to_prometheus()
+    assert 'span_duration_seconds_bucket{span="stage",le="0.5"} 50' in text
+    assert 'span_duration_seconds_bucket{span="stage",le="+Inf"} 100' in text
+    assert 'span_duration_seconds_count{span="stage"} 100' in text
+    assert 'span_duration_quantiles_seconds{span="stage",quantile="0.95"} 0.95' in text
+
+
+def test_jsonl_exporter(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = JsonlSpanExporter(str(path))
+    with span("test.export", answer=42) as current:
+        pass
+    exporter.export(current)
+
+    for _ in range(50):
+        if path.exists() and path.read_text():
+            break
+        time.sleep(0.05)
+    exported = json.loads(path.read_text().splitlines()[0])
+    assert exported["name"] == "test.export"
+    assert exported["span_id"] == current.span_id
+    assert exported["attributes"] == {"answer": 42}
+
+
+def test_time_function_keeps_the_result():
+    @time_function
+    def get_assert(output, context):
+        return {"pass": True, "score": 1.0, "reason": "ok"}
+
+    assert get_assert("output", {}) == {"pass": True, "score": 1.0, "reason": "ok"}
+    assert registry.summary()[f"{__name__}.get_assert"]["count"] >= 1
+
+
+def test_percentiles_of_few_values():
+    histogram = Histogram()
+    for value in (3.0, 1.0, 2.0):
+        histogram.observe(value)
+    assert histogram.percentiles((0.0, 0.07, 0.5, 0.67, 1.0)) == {
+        0.0: 1.0,
+        0.07: 1.0,
+        0.5: 2.0,
+        0.67: 3.0,
+        1.0: 3.0,
+    }
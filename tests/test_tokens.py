@@ -0,0 +1,55 @@
+import tiktoken
+
+import ml.tokens
+from ml.tokens import count_message_tokens, count_tokens, fit_passages, get_encoding
+
+
+def test_count_message_tokens():
+    messages = [{"role": "user", "content": "Hello world"}]
+
+    assert count_message_tokens(messages) > count_tokens("Hello world")
+
+
+def test_fit_passages_keeps_order_within_budget():
+    passages = ["first passage " * 10, "second passage " * 10, "third passage " * 10]
+    budget = count_tokens(passages[0]) + count_tokens(passages[1]) + count_tokens("\n")
+
+    assert fit_passages(passages, budget) == passages[:2]
+
+
+def test_fit_passages_truncates_last_passage():
+    passages = ["short passage", "long passage " * 200]
+    budget = 100
+
+    selected = fit_passages(passages, budget)
+
+    assert selected[0] == passages[0]
+    assert passages[1].startswith(selected[1])
+    assert count_tokens("\n".join(selected)) <= budget
+
+
+def test_fit_passages_empty_budget():
+    assert fit_passages(["a passage"], 0) == []
+
+
+def test_failed_encoding_loads_are_retried(monkeypatch):
+    encoding = object()
+    network = {"up": False}
+    now = [1000.0]
+
+    def load(model_name):
+        if not network["up"]:
+            raise OSError("no network")
+        return encoding
+
+    monkeypatch.setattr(tiktoken, "encoding_for_model", load)
+    monkeypatch.setattr(ml.tokens.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(ml.tokens, "_encodings", {})
+    monkeypatch.setattr(ml.tokens, "_failed_loads", {})
+
+    assert get_encoding("gpt-4o") is None
+    network["up"] = True
+    # the failure is kept for a while, then the encoding is loaded again
+    assert get_encoding("gpt-4o") is None
+    now[0] += ml.tokens.ENCODING_RETRY_SECONDS
+    assert get_encoding("gpt-4o") is encoding